@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+`get_parsed_remote_conf` downloading into memory, against the temporary-file
+round-trip it used to make, over a local stand-in connection.
+
+    python benchmarks/bench_fetch.py [servers] [fetches]
+"""
+
+from __future__ import print_function
+
+from os import listdir, path, remove
+from sys import argv
+from tempfile import mkstemp
+from timeit import default_timer
+from typing import Optional
+
+from bench_parser import synthetic_conf
+
+from nginx_parse_emit.parser import load, set_parser_backend
+from nginx_parse_emit.remote import get_parsed_remote_conf
+
+
+class FakeConnection(object):
+    """
+    Serves one remote file from memory, to a filename or a file object
+    """
+
+    def __init__(self, content):
+        self.content = content.encode("utf-8")
+
+    def get(self, remote, local, **kwargs):
+        if hasattr(local, "write"):
+            local.write(self.content)
+        else:
+            with open(local, "wb") as f:
+                f.write(self.content)
+
+
+def via_temporary_file(c, conf_name):
+    # What `get_parsed_remote_conf` did before, `mkstemp` descriptor leak included
+    tempfile = mkstemp("nginx")[1]
+    c.get(remote=conf_name, local=tempfile)
+    with open(tempfile, "rt") as f:
+        conf = load(f)
+    remove(tempfile)
+    return conf
+
+
+def open_fds():  # type: () -> Optional[int]
+    return len(listdir("/proc/self/fd")) if path.isdir("/proc/self/fd") else None
+
+
+def main(servers=50, fetches=200):  # type: (int, int) -> None
+    set_parser_backend("fast")
+    c = FakeConnection(synthetic_conf(servers))
+    print("{} servers, {} fetches".format(servers, fetches))
+    for name, fetch in (
+        ("temporary file", via_temporary_file),
+        ("in memory", get_parsed_remote_conf),
+    ):
+        fds = open_fds()
+        start = default_timer()
+        for _ in range(fetches):
+            fetch(c, "default.conf")
+        elapsed = default_timer() - start
+        print(
+            "{name:>16}: {elapsed:8.3f}s {rate:10.1f} fetches/s {leaked} fds leaked".format(
+                name=name,
+                elapsed=elapsed,
+                rate=fetches / elapsed,
+                leaked="?" if fds is None else open_fds() - fds,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Cold-start time of importing the parse/emit modules, each in a fresh interpreter,
+against also loading what importing them used to pull in: fabric2, patchwork, yaml
+and the logging config.
+
+    python benchmarks/bench_import.py [runs]
+"""
+
+from __future__ import print_function
+
+from subprocess import check_output
+from sys import argv, executable
+
+PARSE_EMIT = "import nginx_parse_emit.emit, nginx_parse_emit.utils"
+
+# What `import nginx_parse_emit.utils` used to do
+EAGER = (
+    PARSE_EMIT + "; import fabric2, patchwork.files; "
+    "import nginx_parse_emit; nginx_parse_emit.configure_logging()"
+)
+
+HEAVY = "fabric2", "invoke", "paramiko", "patchwork", "yaml"
+
+_TIMED = """
+from timeit import default_timer
+start = default_timer()
+{statement}
+elapsed = default_timer() - start
+import sys
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def cold_import(statement):  # type: (str) -> (float, str)
+    """
+    :return: Seconds `statement` took in a new interpreter, and which heavy modules it
+      left loaded
+    :rtype: ```(float, str)```
+    """
+    seconds, _, loaded = (
+        check_output(
+            [executable, "-c", _TIMED.format(statement=statement, heavy=HEAVY)]
+        )
+        .decode("utf-8")
+        .strip()
+        .partition(" ")
+    )
+    return float(seconds), loaded
+
+
+def main(runs=10):  # type: (int) -> None
+    print("best of {} runs".format(runs))
+    for name, statement in ("parse/emit", PARSE_EMIT), ("eager", EAGER):
+        results = [cold_import(statement) for _ in range(runs)]
+        print(
+            "{name:>12}: {best:8.1f}ms  loads: {loaded}".format(
+                name=name,
+                best=min(seconds for seconds, _ in results) * 1000,
+                loaded=results[0][1] or "-",
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Parse throughput of each parser backend on a synthetic conf of `server` blocks.
+
+    python benchmarks/bench_parser.py [servers]
+"""
+
+from __future__ import print_function
+
+from sys import argv
+from timeit import default_timer
+
+from nginx_parse_emit.emit import api_proxy_block, server_block
+from nginx_parse_emit.parser import BACKENDS
+
+
+def synthetic_conf(servers):  # type: (int) -> str
+    # Each server gets a location block spliced in before its closing brace
+    return "\n".join(
+        server_block(
+            server_name="s{}.example.com".format(i), listen="443" if i % 2 else "80"
+        )[:-1]
+        + api_proxy_block("/api{}".format(i), "http://127.0.0.1:5000")
+        + "\n}"
+        for i in range(servers)
+    )
+
+
+def main(servers=500):  # type: (int) -> None
+    source = synthetic_conf(servers)
+    megabytes = len(source) / 1e6
+    print("{} servers, {:.2f} MB".format(servers, megabytes))
+    for name, loads in sorted(BACKENDS.items()):
+        start = default_timer()
+        loads(source)
+        elapsed = default_timer() - start
+        print(
+            "{name:>16}: {elapsed:8.3f}s {rate:10.2f} MB/s".format(
+                name=name, elapsed=elapsed, rate=megabytes / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Time parsing, each edit helper and emitting over synthetic configs of growing size,
+reporting ops/s, peak memory and how each scales, and optionally comparing against a
+stored baseline to catch regressions.
+
+    python benchmarks/bench_suite.py --sizes 10,100,1000 --save baseline.json
+    python benchmarks/bench_suite.py --sizes 10,100,1000 --compare baseline.json
+"""
+
+from __future__ import print_function
+
+import json
+import tracemalloc
+from argparse import ArgumentParser
+from collections import OrderedDict
+from difflib import unified_diff
+from math import log
+from platform import python_version
+from sys import exit
+from timeit import Timer
+from typing import Any, Callable, List, Optional
+
+from generators import server_name, synthetic_conf, synthetic_tree
+from nginxparser_eb.nginxparser_eb import dumps
+
+from nginx_parse_emit.diff import diff
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.emit import (
+    api_proxy_block_tree,
+    secure_attr_tree,
+    upsert_redirect_to_443_block,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.parser import get_parser_backend, loads, set_parser_backend
+from nginx_parse_emit.utils import (
+    apply_attributes,
+    merge_into,
+    remove_by_location,
+    upsert_by_location,
+)
+
+
+def cases(servers, locations):  # type: (int, int) -> OrderedDict
+    """
+    Name to zero-argument callable, for a config of `servers` servers
+    """
+    source = synthetic_conf(servers, locations=locations, redirect_every=4)
+    tree = synthetic_tree(servers, locations=locations, redirect_every=4)
+    # The last server, so that linear scans go all the way
+    name = server_name(servers - 1)
+    child = api_proxy_block_tree("/bench", "http://127.0.0.1:6000")
+    attribute = secure_attr_tree("/etc/ssl/bench.pem", "/etc/ssl/bench.key")
+    edited = upsert_ssl_cert_to_443_block(tree, name, "a.pem", "a.key")
+    return OrderedDict(
+        (
+            ("loads", lambda: loads(source)),
+            ("merge_into", lambda: merge_into(name, tree, child)),
+            (
+                "upsert_by_location",
+                lambda: upsert_by_location(name, "/api0", tree, child),
+            ),
+            ("remove_by_location", lambda: remove_by_location(tree, "/api0")),
+            ("apply_attributes", lambda: apply_attributes(tree, attribute)),
+            (
+                "upsert_ssl_cert_to_443_block",
+                lambda: upsert_ssl_cert_to_443_block(tree, name, "a.pem", "a.key"),
+            ),
+            (
+                "upsert_redirect_to_443_block",
+                lambda: upsert_redirect_to_443_block(tree, name),
+            ),
+            ("dumps", lambda: dumps(tree)),
+            ("iter_dumps", lambda: "".join(iter_dumps(tree))),
+            ("diff", lambda: diff(tree, edited)),
+            (
+                "dumps + unified_diff",
+                lambda: list(
+                    unified_diff(dumps(tree).splitlines(), dumps(edited).splitlines())
+                ),
+            ),
+        )
+    )
+
+
+def measure(f, repeat=3):  # type: (Callable[[], Any], int) -> dict
+    """
+    Best seconds per call over `repeat` runs, and peak bytes allocated by one call
+    """
+    timer = Timer(f)
+    number = timer.autorange()[0]
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    try:
+        f()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def run(sizes, locations, only=None):  # type: ([int], int, Optional[set]) -> dict
+    results = OrderedDict()
+    for servers in sizes:
+        for name, f in cases(servers, locations).items():
+            if only is None or name in only:
+                results.setdefault(name, OrderedDict())[str(servers)] = measure(f)
+    return results
+
+
+def exponent(by_size):  # type: (dict) -> Optional[float]
+    """
+    Slope of log(time) against log(size) from the smallest size to the largest: 1 is
+    linear, 2 quadratic
+    """
+    sizes = sorted(by_size, key=int)
+    if len(sizes) < 2:
+        return None
+    first, last = by_size[sizes[0]], by_size[sizes[-1]]
+    return log(last["seconds"] / first["seconds"]) / log(
+        float(sizes[-1]) / float(sizes[0])
+    )
+
+
+def report(results):  # type: (dict) -> None
+    sizes = sorted(
+        set(size for by_size in results.values() for size in by_size), key=int
+    )
+    print(
+        "{:>30} ".format("ops/s (peak KiB) by servers")
+        + "".join("{:>22}".format(size) for size in sizes)
+        + "{:>10}".format("scaling")
+    )
+    for name, by_size in results.items():
+        cells = []
+        for size in sizes:
+            result = by_size.get(size)
+            cells.append(
+                "{:>22}".format(
+                    ""
+                    if result is None
+                    else "{:.1f} ({:.0f})".format(
+                        1 / result["seconds"], result["peak_bytes"] / 1024.0
+                    )
+                )
+            )
+        slope = exponent(by_size)
+        print(
+            "{:>30} ".format(name)
+            + "".join(cells)
+            + "{:>10}".format("" if slope is None else "n^{:.2f}".format(slope))
+        )
+
+
+def compare(results, baseline, tolerance):  # type: (dict, dict, float) -> [str]
+    """
+    :return: One line per case at least `tolerance` slower, or using that much more
+      memory, than in `baseline`
+    :rtype: ```[str]```
+    """
+    regressions = []
+    for name, by_size in results.items():
+        for size, result in by_size.items():
+            before = baseline["results"].get(name, {}).get(size)
+            if before is None:
+                continue
+            for key in "seconds", "peak_bytes":
+                ratio = result[key] / float(before[key] or 1)
+                if ratio > 1 + tolerance:
+                    regressions.append(
+                        "{} at {} servers: {} x{:.2f}".format(name, size, key, ratio)
+                    )
+    return regressions
+
+
+def main(argv=None):  # type: (Optional[List[str]]) -> int
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="10,100,1000",
+        help="Comma-separated server counts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--locations", type=int, default=2, help="Location blocks per server"
+    )
+    parser.add_argument("--parser", default=get_parser_backend(), help="Backend")
+    parser.add_argument("--only", help="Comma-separated cases to run")
+    parser.add_argument("--save", metavar="JSON", help="Store the results as baseline")
+    parser.add_argument("--compare", metavar="JSON", help="Baseline to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Slowdown that counts as a regression (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    set_parser_backend(args.parser)
+    results = run(
+        list(map(int, args.sizes.split(","))),
+        args.locations,
+        None if args.only is None else set(args.only.split(",")),
+    )
+    report(results)
+
+    if args.save:
+        with open(args.save, "wt") as f:
+            json.dump(
+                {
+                    "parser": args.parser,
+                    "python": python_version(),
+                    "locations": args.locations,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare, "rt") as f:
+            baseline = json.load(f)
+        for key in "parser", "locations":
+            if baseline.get(key) != getattr(args, key):
+                print("Baseline has {} {!r}".format(key, baseline.get(key)))
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
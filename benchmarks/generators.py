@@ -0,0 +1,74 @@
+"""
+Synthetic configs of any size, assembled from the `emit` blocks: `servers` server
+blocks, each with `locations` location blocks, every `ssl_every`th listening on 443
+with a certificate, and every `redirect_every`th preceded by a port 80 redirect.
+"""
+
+from itertools import cycle, islice
+
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.emit import (
+    api_proxy_block_tree,
+    autoindex_block_tree,
+    html5_block_tree,
+    proxy_1_1_block_tree,
+    redirect_block_tree,
+    secure_attr_tree,
+    server_block_tree,
+)
+
+_LOCATIONS = (
+    lambda i, j: api_proxy_block_tree(
+        "/api{}".format(j), "http://127.0.0.1:{}".format(5000 + i % 1000)
+    ),
+    lambda i, j: proxy_1_1_block_tree("/ws{}".format(j), "http://127.0.0.1:5000"),
+    lambda i, j: html5_block_tree("/app{}".format(j), "/var/www/s{}".format(i)),
+    lambda i, j: autoindex_block_tree("/static{}".format(j), "/var/www/static"),
+)
+
+
+def server_name(i):  # type: (int) -> str
+    return "s{}.example.com".format(i)
+
+
+def synthetic_tree(
+    servers, locations=1, ssl_every=2, redirect_every=0
+):  # type: (int, int, int, int) -> list
+    """
+    :param servers: Server blocks
+    :type servers: ```int```
+
+    :param locations: Location blocks in each, cycling through the `emit` kinds
+    :type locations: ```int```
+
+    :param ssl_every: Every this many servers listens on 443 with a certificate; 0 for
+      none
+    :type ssl_every: ```int```
+
+    :param redirect_every: Every this many servers gets a redirect to it; 0 for none
+    :type redirect_every: ```int```
+
+    :return: Parsed tree
+    :rtype: ```list```
+    """
+    tree = []
+    for i in range(servers):
+        ssl = ssl_every and i % ssl_every == ssl_every - 1
+        if redirect_every and i % redirect_every == redirect_every - 1:
+            tree += redirect_block_tree(server_name(i), 80)
+        (server,) = server_block_tree(server_name(i), 443 if ssl else 80)
+        if ssl:
+            server[1] += secure_attr_tree(
+                "/etc/ssl/s{}.pem".format(i), "/etc/ssl/s{}.key".format(i)
+            )[1:]
+        for j, location in enumerate(islice(cycle(_LOCATIONS), locations)):
+            server[1] += location(i, j)
+        tree.append(server)
+    return tree
+
+
+def synthetic_conf(servers, **kwargs):  # type: (int, **int) -> str
+    """
+    Text of `synthetic_tree(servers, **kwargs)`
+    """
+    return "".join(iter_dumps(synthetic_tree(servers, **kwargs)))
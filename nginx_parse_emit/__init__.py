@@ -1,14 +1,31 @@
 #!/usr/bin/env python
 
 import logging
-import logging.config
 from os import path
 
-import yaml
-
 __author__ = "Samuel Marks"
 __version__ = "0.0.11"
 
+_logging_configured = False
+
+
+def configure_logging():
+    """
+    Apply the logging.yml config, once; `get_logger` does so on first use. Importing
+    the package neither configures logging nor imports yaml.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    import logging.config
+
+    import yaml
+
+    with open(path.join(path.dirname(__file__), "_data", "logging.yml"), "rt") as f:
+        data = yaml.load(f, Loader=yaml.SafeLoader)
+    logging.config.dictConfig(data)
+    _logging_configured = True
+
 
 def get_logger(name=None):
     """
@@ -20,12 +37,15 @@ def get_logger(name=None):
     :return: instanceof Logger
     :rtype: ```Logger```
     """
-    with open(path.join(path.dirname(__file__), "_data", "logging.yml"), "rt") as f:
-        data = yaml.load(f, Loader=yaml.SafeLoader)
-    logging.config.dictConfig(data)
+    configure_logging()
     return logging.getLogger(name=name)
 
 
-root_logger = get_logger()
+def __getattr__(name):
+    # `root_logger` used to be created on import; now on first access
+    if name == "root_logger":
+        return get_logger()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
 
-__all__ = ["get_logger", "root_logger"]
+__all__ = ["configure_logging", "get_logger", "root_logger"]
@@ -0,0 +1,194 @@
+"""
+asyncio counterparts of `get_parsed_remote_conf`, `upsert_upload` and `fleet`.
+
+They take an async connection: any object with
+
+  - `await c.get(remote, local)`, writing the bytes of `remote` to file object `local`
+  - `await c.put(local, remote)`, uploading readable binary file object `local`
+  - `await c.run(command)`, with `exit_status` (asyncssh) or `exited` (invoke) on
+    its result
+
+Parsing is CPU-bound, so it goes to a process pool, by default one shared by every
+call here, keeping the event loop free for I/O.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from io import BytesIO
+from shlex import quote
+from threading import Lock
+from timeit import default_timer
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.dumper import DumpReader
+from nginx_parse_emit.fleet import FAILED, OK, UNCHANGED, HostResult, host_of
+from nginx_parse_emit.parser import BACKENDS, get_parser_backend
+from nginx_parse_emit.remote import NO_CHANGE, SITES_ENABLED
+from nginx_parse_emit.utils import _emits_source
+
+# Anything with the async `get`, `put` and `run` described above
+AsyncConnection = Any
+
+_executor = None
+_executor_lock = Lock()
+
+
+def default_executor():  # type: () -> ProcessPoolExecutor
+    """
+    Process pool for parsing, created on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor()
+        return _executor
+
+
+def _parse(backend, source):  # type: (str, str) -> list
+    # The backend is passed along as worker processes don't see `set_parser_backend`
+    return BACKENDS[backend](source)
+
+
+async def parse(source, executor=None):  # type: (str, Optional[Executor]) -> list
+    """
+    `loads(source)` on `executor`, or on `default_executor()` if None
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        executor or default_executor(), _parse, get_parser_backend(), source
+    )
+
+
+async def _resolve(c, conf_name):  # type: (AsyncConnection, str) -> str
+    if conf_name.endswith(".conf"):
+        return conf_name
+    result = await c.run("test -e {}".format(quote(conf_name)))
+    exit_status = getattr(result, "exit_status", getattr(result, "exited", None))
+    return conf_name if exit_status == 0 else conf_name + ".conf"
+
+
+async def _get_text(c, remote):  # type: (AsyncConnection, str) -> str
+    buf = BytesIO()
+    await c.get(remote, buf)
+    return buf.getvalue().decode("utf-8")
+
+
+async def get_parsed_remote_conf(
+    c, conf_name, executor=None
+):  # type: (AsyncConnection, str, Optional[Executor]) -> list
+    """
+    :param c: Async connection
+    :type c: ```AsyncConnection```
+
+    :param conf_name: Remote path, with ".conf" appended unless it ends so or exists
+    :type conf_name: ```str```
+
+    :param executor: Where to parse; `default_executor()` if None
+    :type executor: ```Optional[concurrent.futures.Executor]```
+
+    :return: Parsed conf
+    :rtype: ```list```
+    """
+    conf_name = await _resolve(c, conf_name)
+    return await parse(await _get_text(c, conf_name), executor)
+
+
+async def upsert_upload(
+    c, new_conf, name="default", executor=None
+):  # type: (AsyncConnection, Callable[[list], list], str, Optional[Executor]) -> Any
+    """
+    :param c: Async connection
+    :type c: ```AsyncConnection```
+
+    :param new_conf: Transform from the parsed remote conf to the one to upload
+    :type new_conf: ```Callable[[list], list]```
+
+    :param name: Name of the conf in sites-enabled
+    :type name: ```str```
+
+    :param executor: Where to parse; `default_executor()` if None
+    :type executor: ```Optional[concurrent.futures.Executor]```
+
+    :return: What `c.put` returned, or `NO_CHANGE` if there was nothing to upload
+    :rtype: ```Any```
+    """
+    conf_name = await _resolve(c, "{}/{}".format(SITES_ENABLED, name))
+    source = await _get_text(c, conf_name)
+    conf = ParsedConfig(await parse(source, executor), source)
+    conf = new_conf(conf)
+    if _emits_source(conf, source):
+        return NO_CHANGE
+    return await c.put(DumpReader(conf), conf_name)
+
+
+async def rollout(
+    connections, new_conf, name="default", limit=16, executor=None
+):  # type: (Iterable[AsyncConnection], Callable[[list], list], str, int, Optional[Executor]) -> [HostResult]
+    """
+    `upsert_upload` on every connection, at most `limit` at once
+
+    :return: One result per connection, in order, as from `fleet.rollout`
+    :rtype: ```[HostResult]```
+    """
+    return await gather_bounded(
+        connections,
+        lambda c: upsert_upload(c, new_conf, name=name, executor=executor),
+        limit,
+    )
+
+
+async def fetch_all(
+    connections, conf_name, limit=16, executor=None
+):  # type: (Iterable[AsyncConnection], str, int, Optional[Executor]) -> [HostResult]
+    """
+    `get_parsed_remote_conf` on every connection; `result` is the parsed conf
+    """
+    return await gather_bounded(
+        connections,
+        lambda c: get_parsed_remote_conf(c, conf_name, executor=executor),
+        limit,
+    )
+
+
+async def gather_bounded(
+    connections, task, limit=16
+):  # type: (Iterable[AsyncConnection], Callable[[AsyncConnection], Awaitable], int) -> [HostResult]
+    """
+    Await `task(c)` for every connection, at most `limit` at once
+
+    :param connections: Async connections
+    :type connections: ```Iterable[AsyncConnection]```
+
+    :param task: What to do on one host; an exception marks that host failed
+    :type task: ```Callable[[AsyncConnection], Awaitable]```
+
+    :param limit: Hosts in flight at once
+    :type limit: ```int```
+
+    :return: One result per connection, in order
+    :rtype: ```[HostResult]```
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def timed(c):
+        async with semaphore:
+            start = default_timer()
+            try:
+                result = await task(c)
+            except Exception as e:
+                return HostResult(host_of(c), FAILED, None, e, default_timer() - start)
+            status = UNCHANGED if result is NO_CHANGE else OK
+            return HostResult(host_of(c), status, result, None, default_timer() - start)
+
+    return list(await asyncio.gather(*map(timed, connections)))
+
+
+__all__ = [
+    "default_executor",
+    "fetch_all",
+    "gather_bounded",
+    "get_parsed_remote_conf",
+    "parse",
+    "rollout",
+    "upsert_upload",
+]
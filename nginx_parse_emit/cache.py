@@ -0,0 +1,232 @@
+import marshal
+import os
+from collections import OrderedDict, namedtuple
+from hashlib import sha256
+from os import fdopen, listdir, makedirs, path, remove
+from sys import version_info
+from tempfile import mkstemp
+from threading import Lock
+from typing import Callable, Hashable, Optional, Union
+
+from nginx_parse_emit.instrument import count
+
+CacheInfo = namedtuple("CacheInfo", ("hits", "misses", "maxsize", "currsize"))
+
+
+class ParseCache(object):
+    """
+    Bounded LRU of parsed trees, keyed by `file_key` or `content_key`.
+
+    Trees are held `marshal`led, and every lookup unmarshals a tree of its own: a deep
+    copy, made in C, that callers may edit however they like without reaching the
+    cache.
+
+    Misses are passed on to `parent`, e.g., a `DiskParseCache`, when given.
+    """
+
+    def __init__(
+        self, maxsize=128, parent=None
+    ):  # type: (int, Optional[DiskParseCache]) -> None
+        self.maxsize = maxsize
+        self.parent = parent
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def lookup(self, key, parse):  # type: (Hashable, Callable[[], list]) -> list
+        """
+        Cached tree for `key`, calling `parse` to produce it on a miss
+
+        :param key: From `file_key` or `content_key`
+        :type key: ```Hashable```
+
+        :param parse: Parses the source that `key` identifies
+        :type parse: ```Callable[[], list]```
+
+        :return: Copy of the parsed tree
+        :rtype: ```list```
+        """
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries[key] = data
+        count("cache_misses" if data is None else "cache_hits")
+        if data is not None:
+            return marshal.loads(data)
+
+        tree = parse() if self.parent is None else self.parent.lookup(key, parse)
+        data = marshal.dumps(_plain(tree))
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return marshal.loads(data)
+
+    def info(self):  # type: () -> CacheInfo
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):  # type: () -> None
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+class DiskParseCache(object):
+    """
+    Parsed trees marshalled to files in `directory`, so that a new process skips
+    parsing. Entries are named by a hash of the key and `version`; the default version
+    names the parser and Python, so upgrading either starts afresh.
+
+    Keys are hashes of the config's text, so a file rewritten in place—even keeping
+    its size and mtime, as `cp -p` or `rsync` do—never finds a stale tree; checking
+    an entry costs one read and hash of the file, far less than parsing it.
+    """
+
+    def __init__(self, directory, version=None):  # type: (str, Optional[str]) -> None
+        self.directory = directory
+        self.version = parser_version() if version is None else version
+        self.hits = 0
+        self.misses = 0
+        if not path.isdir(directory):
+            makedirs(directory)
+
+    def _entry(self, key):  # type: (Hashable) -> str
+        name = sha256(repr((self.version, key)).encode("utf-8")).hexdigest()
+        return path.join(self.directory, name + _EXT)
+
+    def lookup(self, key, parse):  # type: (Hashable, Callable[[], list]) -> list
+        """
+        Tree stored for `key`, else `parse()` written out for next time
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry, "rb") as f:
+                tree = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            tree = None
+        count("disk_cache_misses" if tree is None else "disk_cache_hits")
+        if tree is not None:
+            self.hits += 1
+            return tree
+
+        self.misses += 1
+        tree = _plain(parse())
+        fd, temp_file = mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with fdopen(fd, "wb") as f:
+                marshal.dump(tree, f)
+            _replace(temp_file, entry)
+        except BaseException:
+            remove(temp_file)
+            raise
+        return tree
+
+    def info(self):  # type: () -> CacheInfo
+        return CacheInfo(self.hits, self.misses, None, len(self._entries()))
+
+    def _entries(self):  # type: () -> [str]
+        return [
+            path.join(self.directory, name)
+            for name in listdir(self.directory)
+            if name.endswith(_EXT)
+        ]
+
+    def clear(self):  # type: () -> None
+        for entry in self._entries():
+            remove(entry)
+        self.hits = self.misses = 0
+
+
+_EXT = ".marshal"
+
+_replace = getattr(os, "replace", os.rename)
+
+
+def _plain(tree):  # type: (list) -> list
+    """
+    `tree` as builtin lists and strings only, which is all `marshal` takes
+    """
+    if isinstance(tree, list):
+        return [_plain(node) for node in tree]
+    return tree
+
+
+def parser_version():  # type: () -> str
+    """
+    Names the parser backend in use, its version and Python's
+    """
+    from nginx_parse_emit.parser import get_parser_backend
+
+    backend = get_parser_backend()
+    if backend != "nginxparser_eb":
+        from nginx_parse_emit import __version__
+
+        return "{}-{}.python-{}.{}".format(backend, __version__, *version_info[:2])
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import get_distribution
+
+        def version(name):
+            return get_distribution(name).version
+
+    try:
+        parser = version("nginxparser_eb")
+    except Exception:
+        parser = "unknown"
+    return "nginxparser_eb-{}.python-{}.{}".format(parser, *version_info[:2])
+
+
+def file_key(filename):  # type: (str) -> tuple
+    """
+    Key for a file on disk: `content_key` of its bytes, so that a rewrite is a miss
+    whatever its size and mtime
+    """
+    with open(filename, "rb") as f:
+        return content_key(f.read())
+
+
+def content_key(content):  # type: (Union[str, bytes]) -> tuple
+    if not isinstance(content, bytes):
+        content = content.encode("utf-8")
+    return "sha256", sha256(content).hexdigest()
+
+
+_parse_cache = None
+
+
+def get_parse_cache():  # type: () -> Optional[ParseCache]
+    return _parse_cache
+
+
+def set_parse_cache(cache):  # type: (Optional[ParseCache]) -> Optional[ParseCache]
+    """
+    Opt in to caching in `ensure_nginxparser_instance`—off by default—or opt out
+    with `None`
+
+    :param cache: Cache for every later parse
+    :type cache: ```Optional[ParseCache]```
+
+    :return: The previous cache
+    :rtype: ```Optional[ParseCache]```
+    """
+    global _parse_cache
+    previous, _parse_cache = _parse_cache, cache
+    return previous
+
+
+__all__ = [
+    "CacheInfo",
+    "DiskParseCache",
+    "ParseCache",
+    "content_key",
+    "file_key",
+    "get_parse_cache",
+    "parser_version",
+    "set_parse_cache",
+]
@@ -0,0 +1,311 @@
+from collections import defaultdict
+from hashlib import sha256
+from typing import Optional, Tuple
+
+INDEXED_VALUES = frozenset(("server_name", "listen"))
+
+
+def is_block(node):  # type: (list) -> bool
+    return len(node) == 2 and isinstance(node[0], list) and isinstance(node[1], list)
+
+
+def fingerprint(node):  # type: (list) -> bytes
+    """
+    Hash of what `node` holds, nested lists included; from its `repr`, which is built
+    in C, so cheaper than rendering the node
+    """
+    return sha256(repr(node).encode("utf-8")).digest()
+
+
+def listen_port(value):  # type: (str) -> str
+    return value.split(None, 1)[0] if value else value
+
+
+class ParsedConfig(list):
+    """
+    nginxparser tree—a list of top-level blocks—with indexes from `server_name`,
+    `listen` port and `location` path to the top-level blocks that contain them.
+
+    Top-level list operations (`append`, `insert`, `del`, …) keep the indexes current.
+    The helpers in `utils` and `emit` replace a top-level block with a path-copied one
+    rather than editing it, so `list(conf)` is a cheap snapshot that later edits leave
+    intact. After editing the body of a block in place, call `touch` with that block.
+
+    Given the `source` text `tree` was parsed from, it also remembers where each
+    top-level node came from, and a `fingerprint` of it, so that
+    `nginx_parse_emit.dumper` can copy the nodes still in the tree and holding what
+    they were parsed to verbatim—formatting and all—and render only the others.
+    """
+
+    def __init__(self, tree=(), source=None):  # type: (list, Optional[str]) -> None
+        super(ParsedConfig, self).__init__(tree)
+        self.reindex()
+        self.remember_source(source)
+
+    @classmethod
+    def from_source(cls, source):  # type: (str) -> ParsedConfig
+        """
+        Parse `source` with the selected parser backend, remembering it
+        """
+        from nginx_parse_emit.parser import loads
+
+        return cls(loads(source), source)
+
+    def __copy__(self):
+        conf = type(self)(self)
+        conf.source, conf.source_spans = self.source, self.source_spans
+        conf._spans = dict(self._spans)
+        return conf
+
+    def __deepcopy__(self, memo):
+        from copy import deepcopy
+
+        return type(self)(deepcopy(list(self), memo))
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    def reindex(self):
+        """
+        Rebuild every index from scratch
+        """
+        self._by_name = defaultdict(dict)
+        self._by_value = defaultdict(dict)
+        self._by_port = defaultdict(dict)
+        self._by_location = defaultdict(dict)
+        self._by_block = defaultdict(dict)
+        self._keys = {}
+        self._positions = None
+        for block in list.__iter__(self):
+            self._index(block)
+
+    def remember_source(self, source):  # type: (Optional[str]) -> None
+        """
+        Record the text this config was parsed from; `None` forgets it
+
+        :param source: Text that parses to this config's nodes, in order
+        :type source: ```Optional[str]```
+        """
+        from nginx_parse_emit.parser import top_level_spans
+
+        self.source, self.source_spans, self._spans = None, [], {}
+        spans = top_level_spans(source) if source is not None else ()
+        if len(spans) == len(self):
+            self.source, self.source_spans = source, spans
+            self._spans = {
+                id(node): (node, i, start, end, fingerprint(node))
+                for i, (node, (start, end)) in enumerate(zip(self, spans))
+            }
+
+    def source_span(self, node):  # type: (list) -> Optional[Tuple[int, int, int]]
+        """
+        (original position, start, end) of an unchanged top-level node in `source`
+
+        :param node: Top-level node
+        :type node: ```list```
+
+        :return: Where `node` came from; None if it is new, or was edited since—in
+          place or not
+        :rtype: ```Optional[Tuple[int, int, int]]```
+        """
+        span = self._spans.get(id(node))
+        if span is None or span[0] is not node:
+            return None
+        if span[4] is not None and fingerprint(node) != span[4]:
+            return None
+        return span[1:4]
+
+    def touch(self, block):
+        """
+        Re-index a top-level block after its body was edited in place
+
+        :param block: Top-level block of this config
+        :type block: ```list```
+        """
+        self._unindex(block)
+        self._index(block)
+        self._spans.pop(id(block), None)
+
+    def _index(self, block):
+        if not is_block(block):
+            return
+        keys = []
+        for node in block[1]:
+            if not node:
+                continue
+            head = node[0]
+            if isinstance(head, list):
+                self._by_block[head[0]][id(block)] = block
+                keys.append((self._by_block, head[0], id(block)))
+                if len(head) > 1:
+                    self._by_location[head[1]][id(node)] = block, node
+                    keys.append((self._by_location, head[1], id(node)))
+                continue
+            self._index_directive(block, node, keys)
+        self._keys[id(block)] = keys
+
+    def _index_directive(self, block, node, keys):  # type: (list, list, list) -> None
+        head = node[0]
+        self._by_name[head][id(block)] = block
+        keys.append((self._by_name, head, id(block)))
+        if head in INDEXED_VALUES and len(node) > 1:
+            self._by_value[head, node[1]][id(block)] = block
+            keys.append((self._by_value, (head, node[1]), id(block)))
+            if head == "listen":
+                port = listen_port(node[1])
+                self._by_port[port][id(block)] = block
+                keys.append((self._by_port, port, id(block)))
+
+    def _unindex(self, block):
+        for index, key, member in self._keys.pop(id(block), ()):
+            members = index.get(key)
+            if members is not None:
+                members.pop(member, None)
+                if not members:
+                    del index[key]
+
+    def _ordered(self, members):
+        return sorted(members, key=self.position)
+
+    def position(self, block):  # type: (list) -> int
+        """
+        Index of a top-level block in this config, by identity
+
+        :param block: Top-level block of this config
+        :type block: ```list```
+
+        :return: Its position
+        :rtype: ```int```
+        """
+        if self._positions is None:
+            self._positions = {id(b): i for i, b in enumerate(list.__iter__(self))}
+        return self._positions[id(block)]
+
+    def servers_by_name(self, server_name):  # type: (str) -> [list]
+        """
+        Top-level blocks with a `server_name` of exactly this value, in document order
+        """
+        return self._ordered(
+            self._by_value.get(("server_name", server_name), {}).values()
+        )
+
+    def servers_by_listen(self, port):  # type: (str) -> [list]
+        """
+        Top-level blocks listening on this port, e.g., "443" matches "443 ssl"
+        """
+        return self._ordered(self._by_port.get(str(port), {}).values())
+
+    def servers_by_directive(
+        self, name, value=None
+    ):  # type: (str, str or None) -> [list]
+        """
+        Top-level blocks containing directive `name`—with exactly `value` if
+        given—in document order
+        """
+        if value is None:
+            return self._ordered(self._by_name.get(name, {}).values())
+        if name not in INDEXED_VALUES:
+            return [
+                block
+                for block in self.servers_by_directive(name)
+                if any(node[0] == name and node[1:2] == [value] for node in block[1])
+            ]
+        return self._ordered(self._by_value.get((name, value), {}).values())
+
+    def servers_by_block(self, name):  # type: (str) -> [list]
+        """
+        Top-level blocks containing a block of type `name`, e.g., "location", in
+        document order
+        """
+        return self._ordered(self._by_block.get(name, {}).values())
+
+    def locations(self, location):  # type: (str) -> [(list, list)]
+        """
+        (top-level block, nested block) pairs whose nested header argument is `location`
+        """
+        return sorted(
+            self._by_location.get(location, {}).values(),
+            key=lambda pair: self.position(pair[0]),
+        )
+
+    def has_directive(self, name, value):  # type: (str, str) -> bool
+        """
+        Whether a top-level block contains directive `name` with exactly `value`;
+        answered from the indexes alone for `INDEXED_VALUES`
+        """
+        if name in INDEXED_VALUES:
+            return (name, value) in self._by_value
+        return bool(self.servers_by_directive(name, value))
+
+    def has_server_name(self, server_name):  # type: (str) -> bool
+        return self.has_directive("server_name", server_name)
+
+    # Top-level list operations that keep the indexes current
+
+    def _structure_changed(self):
+        self._positions = None
+
+    def append(self, block):
+        super(ParsedConfig, self).append(block)
+        if self._positions is not None:
+            self._positions[id(block)] = len(self) - 1
+        self._index(block)
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def __iadd__(self, blocks):
+        self.extend(blocks)
+        return self
+
+    def insert(self, i, block):
+        super(ParsedConfig, self).insert(i, block)
+        self._structure_changed()
+        self._index(block)
+
+    def pop(self, i=-1):
+        block = super(ParsedConfig, self).pop(i)
+        self._unindex(block)
+        self._structure_changed()
+        return block
+
+    def remove(self, block):
+        self.pop(self.position(block))
+
+    def clear(self):
+        super(ParsedConfig, self).__init__()
+        self.reindex()
+
+    def __setitem__(self, i, value):
+        old = self[i]
+        if isinstance(i, slice):
+            value = list(value)
+        super(ParsedConfig, self).__setitem__(i, value)
+        for block in old if isinstance(i, slice) else (old,):
+            self._unindex(block)
+        for block in value if isinstance(i, slice) else (value,):
+            self._index(block)
+        if isinstance(i, slice) or self._positions is None:
+            self._structure_changed()
+        else:
+            del self._positions[id(old)]
+            self._positions[id(value)] = i % len(self)
+
+    def __delitem__(self, i):
+        old = self[i]
+        super(ParsedConfig, self).__delitem__(i)
+        for block in old if isinstance(i, slice) else (old,):
+            self._unindex(block)
+        self._structure_changed()
+
+    def reverse(self):
+        super(ParsedConfig, self).reverse()
+        self._structure_changed()
+
+    def sort(self, *args, **kwargs):
+        super(ParsedConfig, self).sort(*args, **kwargs)
+        self._structure_changed()
+
+
+__all__ = ["ParsedConfig", "is_block", "listen_port"]
@@ -0,0 +1,321 @@
+"""
+Structural diff between two versions of a config, as edit operations that `patch` can
+apply to the same config—or to another host's.
+
+Blocks are matched by key rather than by position: a `server` by its `server_name`s and
+`listen`s—or, failing that, by its `server_name`s alone—and any other block, e.g., a
+`location`, by its header. Each body is grouped by key in one pass, and subtrees shared
+by identity, as path-copying edits leave them, are skipped unvisited, so diffing costs
+time roughly linear in the size of the config and far less after a small edit.
+Comments are ignored.
+
+An operation's `path` is the keys of the blocks enclosing it, outermost first, e.g.,
+`(("server", ("example.com",), ("443 ssl",)), ("location", "/api"))`.
+"""
+
+from collections import Counter, OrderedDict, namedtuple
+from typing import Iterable, List, Optional, Union
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.instrument import count, instrumented
+from nginx_parse_emit.nodes import is_nodes, to_lists
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.persistent import assoc_in
+from nginx_parse_emit.utils import _copy_or_marshal
+
+AddBlock = namedtuple("AddBlock", ("path", "block"))
+RemoveBlock = namedtuple("RemoveBlock", ("path", "block"))
+AddDirective = namedtuple("AddDirective", ("path", "name", "value"))
+RemoveDirective = namedtuple("RemoveDirective", ("path", "name", "value"))
+SetDirective = namedtuple("SetDirective", ("path", "name", "old", "new"))
+
+
+def block_key(block):  # type: (list) -> tuple
+    """
+    What a block is matched by: `("server", server_names, listens)`, each sorted, for
+    a `server` block; its header words otherwise
+    """
+    header = tuple(block[0])
+    if header != ("server",):
+        return header
+    names, listens = [], []
+    for node in block[1]:
+        if node and node[0] == "server_name" and len(node) > 1:
+            names.append(node[1])
+        elif node and node[0] == "listen" and len(node) > 1:
+            listens.append(node[1])
+    return header + (tuple(sorted(names)), tuple(sorted(listens)))
+
+
+def _is_comment(node):  # type: (list) -> bool
+    return len(node) == 2 and node[0].startswith("#") and node[1] == "\n"
+
+
+def _value(node):  # type: (list) -> Optional[str]
+    return node[1] if len(node) > 1 else None
+
+
+def _as_tree(conf):  # type: (Union[str, list]) -> list
+    if isinstance(conf, str):
+        return loads(conf)
+    return to_lists(conf) if is_nodes(conf) else conf
+
+
+@instrumented
+def diff(old, new):  # type: (Union[str, list], Union[str, list]) -> List[tuple]
+    """
+    Edit operations taking `old` to `new`
+
+    :param old: Earlier version
+    :type old: ```Union[str, list]```
+
+    :param new: Later version, e.g., `merge_into(…, old, …)`
+    :type new: ```Union[str, list]```
+
+    :return: `AddBlock`, `RemoveBlock`, `AddDirective`, `RemoveDirective` and
+      `SetDirective` instances; empty if the two are equivalent
+    :rtype: ```List[tuple]```
+    """
+    operations = []
+    _diff_body(_as_tree(old), _as_tree(new), (), operations)
+    return operations
+
+
+def _group(body, shared):  # type: (list, set) -> (OrderedDict, OrderedDict)
+    """
+    Directive values by name, and blocks by key, of the nodes of `body` not in `shared`
+    """
+    directives, blocks = OrderedDict(), OrderedDict()
+    # Looks at the list as is, so that a `LazyConfig` parses only what differs
+    for i, node in enumerate(list.__iter__(body)):
+        if id(node) in shared:
+            continue
+        node = body[i]
+        count("nodes_visited")
+        if not node:
+            continue
+        if isinstance(node[0], list):
+            blocks.setdefault(block_key(node), []).append(node)
+        elif not _is_comment(node):
+            directives.setdefault(node[0], []).append(_value(node))
+    return directives, blocks
+
+
+def _diff_body(old, new, path, operations):  # type: (list, list, tuple, list) -> None
+    if old is new:
+        return
+    shared = set(map(id, list.__iter__(old))) & set(map(id, list.__iter__(new)))
+    old_directives, old_blocks = _group(old, shared)
+    new_directives, new_blocks = _group(new, shared)
+
+    for name in OrderedDict.fromkeys(list(old_directives) + list(new_directives)):
+        before, after = old_directives.get(name, []), new_directives.get(name, [])
+        if len(before) == len(after) == 1:
+            if before != after:
+                operations.append(SetDirective(path, name, before[0], after[0]))
+            continue
+        removed = Counter(before) - Counter(after)
+        added = Counter(after) - Counter(before)
+        for value in before:
+            if removed[value]:
+                removed[value] -= 1
+                operations.append(RemoveDirective(path, name, value))
+        for value in after:
+            if added[value]:
+                added[value] -= 1
+                operations.append(AddDirective(path, name, value))
+
+    pairs, unmatched_old, unmatched_new = [], [], []
+    for key, blocks in old_blocks.items():
+        others = new_blocks.get(key, [])
+        pairs += zip(blocks, others)
+        unmatched_old += blocks[len(others) :]
+    for key, blocks in new_blocks.items():
+        unmatched_new += blocks[len(old_blocks.get(key, ())) :]
+
+    # A `server` whose `listen` changed is still the same `server`
+    by_names = OrderedDict()
+    for block in unmatched_new:
+        if tuple(block[0]) == ("server",):
+            by_names.setdefault(block_key(block)[1], []).append(block)
+    for block in list(unmatched_old):
+        if tuple(block[0]) == ("server",) and by_names.get(block_key(block)[1]):
+            other = by_names[block_key(block)[1]].pop(0)
+            pairs.append((block, other))
+            unmatched_old.remove(block)
+            unmatched_new.remove(other)
+
+    # Report in document order
+    position = {id(node): i for i, node in enumerate(list.__iter__(old))}
+    unmatched_old.sort(key=lambda block: position[id(block)])
+    pairs.sort(key=lambda pair: position[id(pair[0])])
+    position = {id(node): i for i, node in enumerate(list.__iter__(new))}
+    unmatched_new.sort(key=lambda block: position[id(block)])
+    for block in unmatched_old:
+        operations.append(RemoveBlock(path, block))
+    for block, other in pairs:
+        _diff_body(block[1], other[1], path + (block_key(block),), operations)
+    for block in unmatched_new:
+        operations.append(AddBlock(path, block))
+
+
+def find_block(body, key):  # type: (list, tuple) -> Optional[int]
+    """
+    Index in `body` of the first block with `key`; for a `server` key, else of the
+    only `server` with the same `server_name`s
+
+    :param body: Tree or block body
+    :type body: ```list```
+
+    :param key: As from `block_key`
+    :type key: ```tuple```
+
+    :return: Its index, if found
+    :rtype: ```Optional[int]```
+    """
+    candidates = []
+    for i, node in enumerate(body):
+        if node and isinstance(node[0], list) and node[0][0] == key[0]:
+            other = block_key(node)
+            if other == key:
+                return i
+            if key[:1] == ("server",) and other[1] == key[1]:
+                candidates.append(i)
+    return candidates[0] if len(candidates) == 1 else None
+
+
+@instrumented
+def patch(
+    parent_block, operations
+):  # type: (Union[str, list], Iterable[tuple]) -> ParsedConfig
+    """
+    Apply the operations of `diff` to a config, path-copying like the helpers in
+    `utils`. Removing what is not there does nothing; `SetDirective` changes the
+    directive with the old value, else the only one of that name, else adds it.
+
+    :param parent_block: Config to edit; a `ParsedConfig` is edited in place
+    :type parent_block: ```Union[str, list]```
+
+    :param operations: As from `diff`
+    :type operations: ```Iterable[tuple]```
+
+    :return: Edited config
+    :rtype: ```ParsedConfig```
+    """
+    conf = _copy_or_marshal(parent_block)
+    if not isinstance(conf, ParsedConfig):
+        conf = ParsedConfig(conf)
+
+    for operation in operations:
+        edit = _EDITS.get(type(operation))
+        if edit is None:
+            raise TypeError("Unknown patch operation: {!r}".format(operation))
+        trail, body = [], conf
+        for key in operation.path:
+            i = find_block(body, key)
+            if i is None:
+                if isinstance(operation, (RemoveBlock, RemoveDirective)):
+                    break
+                raise ValueError("No block {!r} to patch in".format(operation.path))
+            trail.append((body, i))
+            body = body[i][1]
+        else:
+            if not trail:
+                edit(conf, operation)
+                continue
+            body = list(body)
+            if not edit(body, operation):
+                continue
+            for parent, i in reversed(trail[1:]):
+                body = assoc_in(parent, (i, 1), body)
+            i = trail[0][1]
+            conf[i] = assoc_in(conf[i], (1,), body)
+
+    return conf
+
+
+def _directive(name, value):  # type: (str, Optional[str]) -> list
+    return [name] if value is None else [name, value]
+
+
+def _add_block(body, operation):  # type: (list, AddBlock) -> bool
+    body.append(operation.block)
+    return True
+
+
+def _remove_block(body, operation):  # type: (list, RemoveBlock) -> bool
+    i = next((i for i, node in enumerate(body) if node == operation.block), None)
+    if i is None:
+        i = find_block(body, block_key(operation.block))
+    if i is None:
+        return False
+    del body[i]
+    return True
+
+
+def _add_directive(body, operation):  # type: (list, AddDirective) -> bool
+    """
+    Adds after the last directive of the same name, else before the first block
+    """
+    at = None
+    for i, node in enumerate(body):
+        if node and isinstance(node[0], list):
+            if at is None:
+                at = i
+        elif node and node[0] == operation.name:
+            at = i + 1
+    body.insert(len(body) if at is None else at, _directive(*operation[1:]))
+    return True
+
+
+def _remove_directive(body, operation):  # type: (list, RemoveDirective) -> bool
+    for i, node in enumerate(body):
+        if (
+            node
+            and not isinstance(node[0], list)
+            and node[0] == operation.name
+            and _value(node) == operation.value
+        ):
+            del body[i]
+            return True
+    return False
+
+
+def _set_directive(body, operation):  # type: (list, SetDirective) -> bool
+    named = [
+        i
+        for i, node in enumerate(body)
+        if node and not isinstance(node[0], list) and node[0] == operation.name
+    ]
+    exact = [i for i in named if _value(body[i]) == operation.old]
+    if exact or len(named) == 1:
+        body[(exact or named)[0]] = _directive(operation.name, operation.new)
+        return True
+    if named:
+        raise ValueError(
+            "{} {!r} not found among {} {!r} directives".format(
+                operation.name, operation.old, len(named), operation.name
+            )
+        )
+    return _add_directive(body, AddDirective(*operation[:2] + operation[3:]))
+
+
+_EDITS = {
+    AddBlock: _add_block,
+    RemoveBlock: _remove_block,
+    AddDirective: _add_directive,
+    RemoveDirective: _remove_directive,
+    SetDirective: _set_directive,
+}
+
+__all__ = [
+    "AddBlock",
+    "AddDirective",
+    "RemoveBlock",
+    "RemoveDirective",
+    "SetDirective",
+    "block_key",
+    "diff",
+    "find_block",
+    "patch",
+]
@@ -0,0 +1,178 @@
+"""
+Streaming counterpart of `nginxparser_eb.dumps`: the same text, produced in chunks
+of about `chunk_size` characters, so that writing a tree out never holds all of it.
+
+A `ParsedConfig` that remembers its source is emitted incrementally instead: its
+unchanged top-level nodes are copied from the source verbatim, along with the text
+between them, and only new or edited nodes—found by content, so edits made in place
+count—are rendered.
+"""
+
+from io import RawIOBase, UnsupportedOperation
+from typing import IO, Iterator
+
+from nginx_parse_emit.instrument import count
+from nginx_parse_emit.nodes import Node
+
+CHUNK_SIZE = 1 << 16
+
+_INDENT = " " * 4
+
+
+def iter_dumps(tree, chunk_size=CHUNK_SIZE):  # type: (list, int) -> Iterator[str]
+    """
+    Text of `tree`, piecewise
+
+    :param tree: Parsed tree
+    :type tree: ```list```
+
+    :param chunk_size: Characters to gather before yielding; 0 yields every line
+    :type chunk_size: ```int```
+
+    :return: Chunks which `"".join` to `dumps(tree)`, or to its incremental re-emit
+    :rtype: ```Iterator[str]```
+    """
+    lines, size = [], 0
+    incremental = getattr(tree, "source", None) is not None
+    for line in _iter_reemit(tree) if incremental else _iter_lines(tree):
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            count("bytes_emitted", size)
+            yield "".join(lines)
+            lines, size = [], 0
+    if lines:
+        count("bytes_emitted", size)
+        yield "".join(lines)
+
+
+def _iter_lines(tree):  # type: (list) -> Iterator[str]
+    # Every line but the first starts with its "\n", so there is no trailing newline;
+    # an explicit stack avoids a generator per nesting level
+    newline = ""
+    stack = [(iter(tree), "")]
+    while stack:
+        nodes, indent = stack[-1]
+        node = next(nodes, None)
+        if node is None:
+            stack.pop()
+            if stack:
+                yield "{}{}}}".format(newline, stack[-1][1])
+            continue
+        if isinstance(node, Node):
+            node = node.as_list()
+        key = node[0]
+        if isinstance(key, list):
+            if indent:
+                yield newline + " "
+            yield "{}{}{} {{".format(newline, indent, " ".join(key))
+            stack.append((iter(node[1]), indent + _INDENT))
+        elif key.startswith("#"):
+            yield newline + indent + key
+        elif len(node) == 1 or node[1] is None:
+            yield "{}{}{};".format(newline, indent, key)
+        else:
+            yield "{}{}{} {};".format(newline, indent, key, node[1])
+        newline = "\n"
+
+
+def _iter_reemit(conf):  # type: (ParsedConfig) -> Iterator[str]
+    # Each node takes an original slot: its own if unchanged, else the next one if
+    # that node is gone, i.e., it replaced that node. Consecutive slots keep the text
+    # between them; other neighbours get the "\n" that `dumps` puts between nodes.
+    # Nodes are read from the list as is, so that a `LazyConfig` parses none of them
+    source, spans, nodes = conf.source, conf.source_spans, list(list.__iter__(conf))
+    own = list(map(conf.source_span, nodes))
+    taken = set(span[0] for span in own if span is not None)
+    previous = -1
+    for n, (node, span) in enumerate(zip(nodes, own)):
+        if span is not None:
+            slot = span[0]
+        elif (
+            previous is not None
+            and previous + 1 < len(spans)
+            and previous + 1 not in taken
+        ):
+            slot = previous + 1
+            taken.add(slot)
+        else:
+            slot = None
+        if previous is not None and slot == previous + 1:
+            yield source[spans[previous][1] if previous >= 0 else 0 : spans[slot][0]]
+        elif n:
+            yield "\n"
+        if span is None:
+            for line in _iter_lines([node]):
+                yield line
+        else:
+            yield source[span[1] : span[2]]
+        previous = slot
+    if spans and previous == len(spans) - 1:
+        yield source[spans[previous][1] :]
+
+
+def dump_to(tree, fp, chunk_size=CHUNK_SIZE):  # type: (list, IO[str], int) -> None
+    """
+    Write `dumps(tree)` to `fp` without building it whole
+
+    :param tree: Parsed tree
+    :type tree: ```list```
+
+    :param fp: Writable text file object
+    :type fp: ```IO[str]```
+
+    :param chunk_size: Characters per `fp.write`
+    :type chunk_size: ```int```
+    """
+    for chunk in iter_dumps(tree, chunk_size):
+        fp.write(chunk)
+
+
+class DumpReader(RawIOBase):
+    """
+    Readable binary file object over `dumps(tree)`, rendered as it is read; for APIs
+    that pull from a file, like `Connection.put`. Seeking is only supported back to
+    the start, which renders the tree again.
+    """
+
+    def __init__(
+        self, tree, encoding="utf-8", chunk_size=CHUNK_SIZE
+    ):  # type: (list, str, int) -> None
+        super(DumpReader, self).__init__()
+        self.tree = tree
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.seek(0)
+
+    def readable(self):  # type: () -> bool
+        return True
+
+    def readinto(self, b):  # type: (bytearray) -> int
+        n = 0
+        while n < len(b):
+            if not self._pending:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._pending = chunk.encode(self.encoding)
+            taken = self._pending[: len(b) - n]
+            b[n : n + len(taken)] = taken
+            self._pending = self._pending[len(taken) :]
+            n += len(taken)
+        self._position += n
+        return n
+
+    def tell(self):  # type: () -> int
+        return self._position
+
+    def seek(self, offset, whence=0):  # type: (int, int) -> int
+        if whence == 0 and offset == 0:
+            self._chunks = iter_dumps(self.tree, self.chunk_size)
+            self._pending = b""
+            self._position = 0
+        elif offset != (self._position if whence == 0 else 0) or whence == 2:
+            raise UnsupportedOperation("DumpReader only seeks back to the start")
+        return self._position
+
+
+__all__ = ["CHUNK_SIZE", "DumpReader", "dump_to", "iter_dumps"]
@@ -1,10 +1,15 @@
 from collections import namedtuple
 from sys import _getframe, modules
+from typing import Optional
 
-from nginxparser_eb.nginxparser_eb import loads
-
+from nginx_parse_emit.instrument import instrumented
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.persistent import assoc_in
+from nginx_parse_emit.selector import select
 from nginx_parse_emit.utils import (
     DollarTemplate,
+    _copy_or_marshal,
+    _iter_directives,
     _prevent_slash,
     ensure_nginxparser_instance,
     ensure_semicolon,
@@ -12,10 +17,13 @@ from nginx_parse_emit.utils import (
 
 _default_comment = "Emitted by {}".format(modules[__name__].__name__)
 
+_LISTENS_ON_443 = ':root > *[listen="443"], :root > *[listen="443 ssl"]'
 
-def api_proxy_block(location, proxy_pass):  # type: (str, str) -> str
-    return DollarTemplate(
-        """location /$location {
+# Compiled once at import; the `*_tree` variants below skip both the template and the
+# parse, returning what `loads` would produce from the rendered text
+
+_api_proxy_template = DollarTemplate(
+    """location /$location {
         proxy_set_header Host $http_host;
         proxy_set_header X-Real-IP $remote_addr;
         proxy_set_header X-Scheme $scheme;
@@ -24,32 +32,17 @@ def api_proxy_block(location, proxy_pass):  # type: (str, str) -> str
         proxy_pass       $proxy_pass;
         proxy_redirect   off;
     }"""
-    ).safe_substitute(location=_prevent_slash(location), proxy_pass=proxy_pass)
-
+)
 
-def server_block(
-    server_name, listen, comment=None, rest=None
-):  # type: (str, str, str or None, str or None) -> str
-    return DollarTemplate(
-        """server {
+_server_template = DollarTemplate(
+    """server {
          # $comment
          server_name $server_name;
          listen $listen;$rest\n}"""
-    ).safe_substitute(
-        server_name=server_name,
-        listen=listen,
-        comment=comment or "{}.{}".format(_default_comment, _getframe().f_code.co_name),
-        rest=""
-        if rest is None
-        else "".join(
-            "{line}\n".format(line=ensure_semicolon(line)) for line in rest.splitlines()
-        ),
-    )
-
+)
 
-def autoindex_block(location, root):  # type: (str, str) -> str
-    return DollarTemplate(
-        """location /$location {
+_autoindex_template = DollarTemplate(
+    """location /$location {
           if ($request_method = 'OPTIONS') {
                add_header 'Access-Control-Allow-Origin' 'http://localhost:4400';
                add_header 'Access-Control-Allow-Methods' 'GET, POST, OPTIONS';
@@ -71,150 +64,375 @@ def autoindex_block(location, root):  # type: (str, str) -> str
             autoindex_format     json;
             autoindex_localtime  on;
         """
-    ).safe_substitute(location=_prevent_slash(location), root=root)
-
+)
 
-def proxy_1_1_block(location, proxy_pass):  # type: (str, str) -> str
-    return DollarTemplate(
-        """location /$location {
+_proxy_1_1_template = DollarTemplate(
+    """location /$location {
             proxy_pass         $proxy_pass;
             proxy_http_version 1.1;
             proxy_set_header   Upgrade $http_upgrade;
             proxy_set_header   Connection "upgrade";
         }"""
-    ).safe_substitute(location=_prevent_slash(location), proxy_pass=proxy_pass)
-
+)
 
-def html5_block(location, root):  # type: (str, str) -> str
-    return DollarTemplate(
-        """location /$location {
+_html5_template = DollarTemplate(
+    """location /$location {
             try_files  $uri$args $uri$args/ /index.html;
             root       $root;
             index      index.html index.htm;
             add_header 'Cache-Control' 'no-store, no-cache, must-revalidate, proxy-revalidate, max-age=0';
             expires    off;
         }"""
-    ).safe_substitute(location=_prevent_slash(location), root=root)
-
+)
 
-def redirect_block(
-    server_name, port, redirect_to=None
-):  # type: (str, str, str or None) -> str
-    return DollarTemplate(
-        """server {
+_redirect_template = DollarTemplate(
+    """server {
       server_name $server_name;
       listen      $port;
       return      301 $redirect_to;
     }"""
-    ).safe_substitute(
+)
+
+_secure_attr_template = DollarTemplate(
+    """listen $port;
+    ssl                 on;
+    ssl_certificate     $ssl_certificate;
+    ssl_certificate_key $ssl_certificate_key;
+    fastcgi_param       HTTPS               on;
+    fastcgi_param       HTTP_SCHEME         https;"""
+)
+
+
+def api_proxy_block(location, proxy_pass):  # type: (str, str) -> str
+    return _api_proxy_template.safe_substitute(
+        location=_prevent_slash(location), proxy_pass=proxy_pass
+    )
+
+
+def api_proxy_block_tree(location, proxy_pass):  # type: (str, str) -> list
+    return [
+        [
+            ["location", "/" + _prevent_slash(location)],
+            [
+                ["proxy_set_header", "Host $http_host"],
+                ["proxy_set_header", "X-Real-IP $remote_addr"],
+                ["proxy_set_header", "X-Scheme $scheme"],
+                ["proxy_set_header", "X-Forwarded-Proto $scheme"],
+                ["proxy_set_header", "X-Forwarded-For $proxy_add_x_forwarded_for"],
+                ["proxy_pass", proxy_pass],
+                ["proxy_redirect", "off"],
+            ],
+        ]
+    ]
+
+
+def server_block(
+    server_name, listen, comment=None, rest=None
+):  # type: (str, str, str or None, str or None) -> str
+    return _server_template.safe_substitute(
+        server_name=server_name,
+        listen=listen,
+        comment=comment or "{}.{}".format(_default_comment, _getframe().f_code.co_name),
+        rest=""
+        if rest is None
+        else "".join(
+            "{line}\n".format(line=ensure_semicolon(line)) for line in rest.splitlines()
+        ),
+    )
+
+
+def server_block_tree(
+    server_name, listen, comment=None, rest=None
+):  # type: (str, str, str or None, str or None) -> list
+    comment = comment or "{}.{}".format(_default_comment, server_block.__name__)
+    rest_directives = list(map(_directive, (rest or "").splitlines()))
+    if "\n" in comment or None in rest_directives:
+        # Multi-line comment or a `rest` beyond one plain directive per line
+        return loads(server_block(server_name, listen, comment, rest))
+    return [
+        [
+            ["server"],
+            [
+                ["# {}".format(comment), "\n"],
+                ["server_name", server_name],
+                ["listen", str(listen)],
+            ]
+            + [directive for directive in rest_directives if directive],
+        ]
+    ]
+
+
+def _directive(line):  # type: (str) -> Optional[list]
+    """
+    Parse one line of `server_block`'s `rest`: [] if blank, None if not a lone directive
+    """
+    line = ensure_semicolon(line).strip()
+    if not line:
+        return []
+    statement = line[:-1]
+    if any(c in statement for c in "{};#") or not statement.strip():
+        return None
+    return statement.split(None, 1)
+
+
+def autoindex_block(location, root):  # type: (str, str) -> str
+    return _autoindex_template.safe_substitute(
+        location=_prevent_slash(location), root=root
+    )
+
+
+def autoindex_block_tree(location, root):  # type: (str, str) -> list
+    """
+    The `location` block that `autoindex_block` describes (its text leaves it unclosed)
+    """
+    return [
+        [
+            ["location", "/" + _prevent_slash(location)],
+            [
+                [
+                    ["if", "($request_method = 'OPTIONS')"],
+                    [
+                        [
+                            "add_header",
+                            "'Access-Control-Allow-Origin' 'http://localhost:4400'",
+                        ],
+                        [
+                            "add_header",
+                            "'Access-Control-Allow-Methods' 'GET, POST, OPTIONS'",
+                        ],
+                        ["#", "\n"],
+                        [
+                            "# Custom headers and headers various browsers *should* be"
+                            " OK with but aren't",
+                            "\n",
+                        ],
+                        ["#", "\n"],
+                        [
+                            "add_header",
+                            "'Access-Control-Allow-Headers' 'DNT,X-CustomHeader,"
+                            "Keep-Alive,User-Agent,X-Requested-With,If-Modified-Since,"
+                            "Cache-Control,Content-Type,Content-Range,Range'",
+                        ],
+                        ["#", "\n"],
+                        [
+                            "# Tell client that this pre-flight info is valid for"
+                            " 20 days",
+                            "\n",
+                        ],
+                        ["#", "\n"],
+                        ["add_header", "'Access-Control-Max-Age' 1728000"],
+                        ["add_header", "'Content-Type' 'text/plain; charset=utf-8'"],
+                        ["add_header", "'Content-Length' 0"],
+                        ["return", "204"],
+                    ],
+                ],
+                ["root", root],
+                ["autoindex", "on"],
+                ["autoindex_exact_size", "off"],
+                ["autoindex_format", "json"],
+                ["autoindex_localtime", "on"],
+            ],
+        ]
+    ]
+
+
+def proxy_1_1_block(location, proxy_pass):  # type: (str, str) -> str
+    return _proxy_1_1_template.safe_substitute(
+        location=_prevent_slash(location), proxy_pass=proxy_pass
+    )
+
+
+def proxy_1_1_block_tree(location, proxy_pass):  # type: (str, str) -> list
+    return [
+        [
+            ["location", "/" + _prevent_slash(location)],
+            [
+                ["proxy_pass", proxy_pass],
+                ["proxy_http_version", "1.1"],
+                ["proxy_set_header", "Upgrade $http_upgrade"],
+                ["proxy_set_header", 'Connection "upgrade"'],
+            ],
+        ]
+    ]
+
+
+def html5_block(location, root):  # type: (str, str) -> str
+    return _html5_template.safe_substitute(location=_prevent_slash(location), root=root)
+
+
+def html5_block_tree(location, root):  # type: (str, str) -> list
+    return [
+        [
+            ["location", "/" + _prevent_slash(location)],
+            [
+                ["try_files", "$uri$args $uri$args/ /index.html"],
+                ["root", root],
+                ["index", "index.html index.htm"],
+                [
+                    "add_header",
+                    "'Cache-Control' 'no-store, no-cache, must-revalidate,"
+                    " proxy-revalidate, max-age=0'",
+                ],
+                ["expires", "off"],
+            ],
+        ]
+    ]
+
+
+def redirect_block(
+    server_name, port, redirect_to=None
+):  # type: (str, str, str or None) -> str
+    return _redirect_template.safe_substitute(
         server_name=server_name,
         port=port,
         redirect_to=redirect_to or "https://$server_name$request_uri",
     )
 
 
+def redirect_block_tree(
+    server_name, port, redirect_to=None
+):  # type: (str, str, str or None) -> list
+    return [
+        [
+            ["server"],
+            [
+                ["server_name", server_name],
+                ["listen", str(port)],
+                [
+                    "return",
+                    "301 {}".format(redirect_to or "https://$server_name$request_uri"),
+                ],
+            ],
+        ]
+    ]
+
+
 def secure_attr(
     ssl_certificate, ssl_certificate_key, port=None
 ):  # type: (str, str, str or None) -> str
-    return DollarTemplate(
-        """listen $port;
-    ssl                 on;
-    ssl_certificate     $ssl_certificate;
-    ssl_certificate_key $ssl_certificate_key;
-    fastcgi_param       HTTPS               on;
-    fastcgi_param       HTTP_SCHEME         https;"""
-    ).safe_substitute(
+    return _secure_attr_template.safe_substitute(
         port=port or 443,
         ssl_certificate=ssl_certificate,
         ssl_certificate_key=ssl_certificate_key,
     )
 
 
+def secure_attr_tree(
+    ssl_certificate, ssl_certificate_key, port=None
+):  # type: (str, str, str or None) -> list
+    return [
+        ["listen", str(port or 443)],
+        ["ssl", "on"],
+        ["ssl_certificate", ssl_certificate],
+        ["ssl_certificate_key", ssl_certificate_key],
+        ["fastcgi_param", "HTTPS               on"],
+        ["fastcgi_param", "HTTP_SCHEME         https"],
+    ]
+
+
+@instrumented
 def upsert_redirect_to_443_block(conf_file, server_name):  # type: (str, str) -> []
-    conf = ensure_nginxparser_instance(conf_file)
+    conf = _copy_or_marshal(ensure_nginxparser_instance(conf_file))
 
     server_name_idx = None
     found = False
 
     ListenStmIdx = namedtuple("ListenStmIdx", ("return_stm", "i", "j", "k"))
     listen_stm_idx = ListenStmIdx(False, None, None, None)
-    for i, tier in enumerate(conf):
-        for j, statement in enumerate(tier):
-            for k, stm in enumerate(statement):
-                if statement[k][0] == "server_name" and statement[k][1] == server_name:
-                    server_name_idx = i
-                elif statement[k][0] == "listen":
-                    if not listen_stm_idx.return_stm:
-                        listen_stm_idx = ListenStmIdx(return_stm=False, i=i, j=j, k=k)
-                    if str(statement[k][1]).startswith("443"):
-                        found = True
-                    else:
-                        statement[k][1] = "443"
-                elif statement[k][0] == "return":
-                    listen_stm_idx = ListenStmIdx(
-                        return_stm=True,
-                        i=listen_stm_idx.i,
-                        j=listen_stm_idx.j,
-                        k=listen_stm_idx.k,
-                    )
+    for i, j, k in list(_iter_directives(conf, ("server_name", "listen", "return"))):
+        statement = conf[i][j]
+        if statement[k][0] == "server_name" and statement[k][1] == server_name:
+            server_name_idx = i
+        elif statement[k][0] == "listen":
+            if not listen_stm_idx.return_stm:
+                listen_stm_idx = ListenStmIdx(return_stm=False, i=i, j=j, k=k)
+            if str(statement[k][1]).startswith("443"):
+                found = True
+            else:
+                conf[i] = assoc_in(conf[i], (j, k, 1), "443")
+        elif statement[k][0] == "return":
+            listen_stm_idx = ListenStmIdx(
+                return_stm=True,
+                i=listen_stm_idx.i,
+                j=listen_stm_idx.j,
+                k=listen_stm_idx.k,
+            )
     if listen_stm_idx.return_stm:
-        conf[listen_stm_idx.i][listen_stm_idx.j][listen_stm_idx.k][1] = "80"
+        conf[listen_stm_idx.i] = assoc_in(
+            conf[listen_stm_idx.i], (listen_stm_idx.j, listen_stm_idx.k, 1), "80"
+        )
     elif not found and server_name_idx is not None:
         conf.insert(
             server_name_idx,
-            loads(redirect_block(server_name=server_name, port="80"))[0],
+            redirect_block_tree(server_name=server_name, port="80")[0],
         )
     return conf
 
 
+@instrumented
 def upsert_ssl_cert_to_443_block(
     conf_file, server_name, ssl_certificate, ssl_certificate_key
 ):  # type: (str, str, str, str) -> []
-    conf = ensure_nginxparser_instance(conf_file)
+    conf = _copy_or_marshal(ensure_nginxparser_instance(conf_file))
 
-    for i, tier in enumerate(conf):
+    for i, j in list(_iter_443_statements(conf)):
         listen_or_server_name_idx = -1
-        for j, statement in enumerate(tier):
-            if ["listen", "443"] in statement or ["listen", "443 ssl"] in statement:
-                update = False
-                correct_server_name = False
-                last_ssl_certificate = None
-                last_ssl_certificate_key = None
-
-                for k, stm in enumerate(statement):
-                    if (
-                        statement[k][0] == "server_name"
-                        and statement[k][1] == server_name
-                    ):
-                        correct_server_name = True
-                    elif conf[i][j][k][0] == "ssl_certificate":
-                        last_ssl_certificate = i, j, k
-                        update = True
-                    elif conf[i][j][k][0] == "ssl_certificate_key":
-                        last_ssl_certificate_key = i, j, k
-                        update = True
-                    elif conf[i][j][k][0] == "listen":
-                        listen_or_server_name_idx = k
-                        conf[i][j][k][1] = "443 ssl"
-                    elif conf[i][j][k][0] == "server_name":
-                        listen_or_server_name_idx = k
-
-                if correct_server_name:
-                    if update:
-                        conf[last_ssl_certificate[0]][last_ssl_certificate[1]][
-                            last_ssl_certificate[2]
-                        ][1] = ssl_certificate
-                        conf[last_ssl_certificate_key[0]][last_ssl_certificate_key[1]][
-                            last_ssl_certificate_key[2]
-                        ][1] = ssl_certificate_key
-                    elif not update and "ssl_certificate" not in conf[i][j]:
-                        conf[i][j].insert(
-                            listen_or_server_name_idx + 1,
-                            ["ssl_certificate", ssl_certificate],
-                        )
-                        conf[i][j].insert(
-                            listen_or_server_name_idx + 2,
-                            ["ssl_certificate_key", ssl_certificate_key],
-                        )
+        statement = conf[i][j]
+        update = False
+        correct_server_name = False
+        last_ssl_certificate = None
+        last_ssl_certificate_key = None
+
+        for k, stm in enumerate(conf[i][j]):
+            if statement[k][0] == "server_name" and statement[k][1] == server_name:
+                correct_server_name = True
+            elif statement[k][0] == "ssl_certificate":
+                last_ssl_certificate = k
+                update = True
+            elif statement[k][0] == "ssl_certificate_key":
+                last_ssl_certificate_key = k
+                update = True
+            elif statement[k][0] == "listen":
+                listen_or_server_name_idx = k
+                statement = _assoc_value(statement, k, "443 ssl")
+            elif statement[k][0] == "server_name":
+                listen_or_server_name_idx = k
+
+        if correct_server_name:
+            if update:
+                statement = _assoc_value(
+                    statement, last_ssl_certificate, ssl_certificate
+                )
+                statement = _assoc_value(
+                    statement, last_ssl_certificate_key, ssl_certificate_key
+                )
+            elif not update and "ssl_certificate" not in statement:
+                statement = (
+                    statement[: listen_or_server_name_idx + 1]
+                    + [
+                        ["ssl_certificate", ssl_certificate],
+                        ["ssl_certificate_key", ssl_certificate_key],
+                    ]
+                    + statement[listen_or_server_name_idx + 1 :]
+                )
+        if statement is not conf[i][j]:
+            conf[i] = assoc_in(conf[i], (j,), statement)
 
     return conf
+
+
+def _assoc_value(statement, k, value):  # type: (list, int, str) -> list
+    """
+    `statement` with the value of its `k`th directive set, copied only if it differs
+    """
+    if statement[k][1] == value:
+        return statement
+    return assoc_in(statement, (k, 1), value)
+
+
+def _iter_443_statements(conf):  # type: (list) -> Iterator[(int, int)]
+    """
+    (i, j) such that `conf[i][j]` contains `listen 443` or `listen 443 ssl`
+    """
+    for path, _ in list(select(conf, _LISTENS_ON_443)):
+        yield path[0], 1
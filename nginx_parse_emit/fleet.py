@@ -0,0 +1,192 @@
+"""
+`upsert_upload` and `get_parsed_remote_conf` across many hosts at once.
+
+Hosts run on a thread pool, at most `per_group` at a time from any one group (see
+`group_of`), optionally after a canary batch that must all succeed first. Every host
+gets a `HostResult`, in the order the connections were given.
+"""
+
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from timeit import default_timer
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    MutableMapping,
+    Optional,
+)
+
+from nginx_parse_emit.remote import NO_CHANGE, get_parsed_remote_conf, upsert_upload
+
+if TYPE_CHECKING:
+    from fabric2 import Connection
+
+HostResult = namedtuple("HostResult", ("host", "status", "result", "error", "seconds"))
+
+OK, UNCHANGED, FAILED, SKIPPED = "ok", "unchanged", "failed", "skipped"
+
+
+def host_of(c):  # type: (Connection) -> str
+    return getattr(c, "host", None) or str(c)
+
+
+def rollout(
+    connections, new_conf, name="default", use_sudo=True, remote_cache=None, **options
+):  # type: (Iterable[Connection], Callable[[list], list], str, bool, Optional[MutableMapping[str, str]], **Any) -> [HostResult]
+    """
+    `upsert_upload` on every connection
+
+    :param connections: Connections, e.g., a `fabric2.Group`
+    :type connections: ```Iterable[fabric.connection.Connection]```
+
+    :param new_conf: Transform from the parsed remote conf to the one to upload
+    :type new_conf: ```Callable[[list], list]```
+
+    :param name: Name of the conf in sites-enabled
+    :type name: ```str```
+
+    :param use_sudo: Passed on to `upsert_upload`
+    :type use_sudo: ```bool```
+
+    :param remote_cache: Passed on to `upsert_upload`; may be shared by every host
+    :type remote_cache: ```Optional[MutableMapping[str, str]]```
+
+    :param options: `max_workers`, `per_group`, `group_of` and `canary`; see `run`
+    :type options: ```Any```
+
+    :return: One result per connection; `result` is what `put` returned. Hosts
+      whose conf `new_conf` left as it was are `UNCHANGED`, and were not uploaded to
+    :rtype: ```[HostResult]```
+    """
+    return run(
+        connections,
+        partial(
+            upsert_upload,
+            new_conf=new_conf,
+            name=name,
+            use_sudo=use_sudo,
+            remote_cache=remote_cache,
+        ),
+        **options
+    )
+
+
+def fetch_all(
+    connections, conf_name, use_sudo=True, **options
+):  # type: (Iterable[Connection], str, bool, **Any) -> [HostResult]
+    """
+    `get_parsed_remote_conf` on every connection; `result` is the parsed conf
+    """
+    return run(
+        connections,
+        partial(get_parsed_remote_conf, conf_name=conf_name, use_sudo=use_sudo),
+        **options
+    )
+
+
+def run(
+    connections, task, max_workers=8, per_group=None, group_of=None, canary=0
+):  # type: (Iterable[Connection], Callable[[Connection], Any], int, Optional[int], Optional[Callable[[Connection], Hashable]], int) -> [HostResult]
+    """
+    Call `task(c)` for every connection on a bounded thread pool
+
+    :param connections: Connections, e.g., a `fabric2.Group`
+    :type connections: ```Iterable[fabric.connection.Connection]```
+
+    :param task: What to do on one host; an exception marks that host failed
+    :type task: ```Callable[[fabric.connection.Connection], Any]```
+
+    :param max_workers: Hosts in flight at once, overall
+    :type max_workers: ```int```
+
+    :param per_group: Hosts in flight at once within one group; unlimited if None
+    :type per_group: ```Optional[int]```
+
+    :param group_of: Group of a connection, e.g., its datacenter; all one if None
+    :type group_of: ```Optional[Callable[[fabric.connection.Connection], Hashable]]```
+
+    :param canary: Hosts to run first; if any fails, the rest are skipped
+    :type canary: ```int```
+
+    :return: One result per connection, in order
+    :rtype: ```[HostResult]```
+    """
+    if per_group is not None and per_group < 1:
+        raise ValueError("per_group must be at least 1")
+    connections = list(connections)
+    results = [None] * len(connections)
+    canary = min(canary, len(connections))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in range(canary), range(canary, len(connections)):
+            _run_batch(
+                executor,
+                connections,
+                batch,
+                task,
+                results,
+                max_workers,
+                per_group,
+                group_of,
+            )
+            if any(results[i].status not in (OK, UNCHANGED) for i in batch):
+                break
+    return [
+        result or HostResult(host_of(c), SKIPPED, None, None, 0.0)
+        for c, result in zip(connections, results)
+    ]
+
+
+def _run_batch(
+    executor, connections, batch, task, results, max_workers, per_group, group_of
+):
+    # Submits only what may run now, so a full group never ties up a worker
+    queues = OrderedDict()
+    for i in batch:
+        key = None if group_of is None else group_of(connections[i])
+        queues.setdefault(key, deque()).append(i)
+    in_flight = dict.fromkeys(queues, 0)
+    futures = {}
+    while queues or futures:
+        for key in list(queues):
+            while (
+                queues[key]
+                and len(futures) < max_workers
+                and (per_group is None or in_flight[key] < per_group)
+            ):
+                i = queues[key].popleft()
+                futures[executor.submit(_timed, task, connections[i])] = i, key
+                in_flight[key] += 1
+            if not queues[key]:
+                del queues[key]
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, key = futures.pop(future)
+            in_flight[key] -= 1
+            results[i] = future.result()
+
+
+def _timed(task, c):  # type: (Callable[[Connection], Any], Connection) -> HostResult
+    start = default_timer()
+    try:
+        result = task(c)
+    except Exception as e:
+        return HostResult(host_of(c), FAILED, None, e, default_timer() - start)
+    status = UNCHANGED if result is NO_CHANGE else OK
+    return HostResult(host_of(c), status, result, None, default_timer() - start)
+
+
+__all__ = [
+    "FAILED",
+    "HostResult",
+    "OK",
+    "SKIPPED",
+    "UNCHANGED",
+    "fetch_all",
+    "host_of",
+    "rollout",
+    "run",
+]
@@ -0,0 +1,221 @@
+"""
+Loading an nginx.conf along with everything it `include`s, parsed in parallel.
+
+Every file is kept as its own `ParsedConfig`, remembering its source, so that edits
+made to one are written back to that file alone; `IncludeTree.tree` splices them into
+one tree, in place of the `include` directives, for reading the whole config.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from errno import ENOENT
+from glob import glob
+from operator import is_not
+from os import path, strerror
+from typing import Iterator, List, Optional
+
+from nginx_parse_emit.config import ParsedConfig, is_block
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.parser import BACKENDS, get_parser_backend
+
+
+def _read_and_parse(backend, filename):  # type: (str, str) -> (str, list)
+    # Runs in a worker process, so reading happens in parallel too
+    with open(filename, "rt") as f:
+        source = f.read()
+    try:
+        return source, BACKENDS[backend](source)
+    except ValueError as e:
+        raise _in_file(filename, e)
+
+
+def _in_file(filename, error):  # type: (str, ValueError) -> ValueError
+    return ValueError("{}: {}".format(filename, error))
+
+
+def _include_patterns(tree):  # type: (list) -> Iterator[str]
+    stack = [tree]
+    while stack:
+        for node in stack.pop():
+            if is_block(node):
+                stack.append(node[1])
+            elif node and node[0] == "include" and len(node) > 1:
+                yield node[1]
+
+
+class IncludeTree(object):
+    """
+    An nginx.conf and every file it includes, as `ParsedConfig`s by path, root first
+    """
+
+    def __init__(self, root, prefix, files):  # type: (str, str, OrderedDict) -> None
+        self.root = root
+        self.prefix = prefix
+        self.files = files
+        self._origins = {}
+
+    def resolve(self, pattern):  # type: (str) -> List[str]
+        """
+        Files an `include` argument names, as nginx would find them
+
+        :param pattern: Path or glob, relative to `prefix` unless absolute
+        :type pattern: ```str```
+
+        :return: Matching paths, sorted
+        :rtype: ```List[str]```
+        """
+        pattern = path.join(self.prefix, pattern.strip("\"'"))
+        if not any(c in pattern for c in "*?["):
+            if not path.isfile(pattern):
+                raise IOError(ENOENT, strerror(ENOENT), pattern)
+            return [pattern]
+        return sorted(filter(path.isfile, glob(pattern)))
+
+    @property
+    def tree(self):  # type: () -> list
+        """
+        The whole config: `root`, with each `include` replaced by the nodes of the
+        files it names. Built anew on every access, from the current `files`.
+        """
+        self._origins = {}
+        return self._expand(self.root, ())
+
+    def _expand(self, filename, including):  # type: (str, tuple) -> list
+        if filename in including:
+            raise ValueError("{} includes itself".format(filename))
+        including += (filename,)
+
+        def splice(nodes):
+            expanded = []
+            for node in nodes:
+                if is_block(node):
+                    body = splice(node[1])
+                    if len(body) != len(node[1]) or any(map(is_not, body, node[1])):
+                        node = [node[0], body]
+                elif node and node[0] == "include" and len(node) > 1:
+                    for included in self.resolve(node[1]):
+                        expanded.extend(self._expand(included, including))
+                    continue
+                self._origins[id(node)] = node, filename
+                expanded.append(node)
+            return expanded
+
+        return splice(self.files[filename])
+
+    def file_of(self, node):  # type: (list) -> Optional[str]
+        """
+        Which file a node of `tree`, or of one of `files`, was read from
+
+        :param node: Node at any depth
+        :type node: ```list```
+
+        :return: Path of the file whose `ParsedConfig` to edit; None if not found
+        :rtype: ```Optional[str]```
+        """
+        origin = self._origins.get(id(node))
+        if origin is not None and origin[0] is node:
+            return origin[1]
+        for filename, conf in self.files.items():
+            stack = [conf]
+            while stack:
+                for child in stack.pop():
+                    if child is node:
+                        return filename
+                    if is_block(child):
+                        stack.append(child[1])
+        return None
+
+    def changed(self):  # type: () -> List[str]
+        """
+        :return: Paths of the files whose config no longer dumps to their source
+        :rtype: ```List[str]```
+        """
+        from nginx_parse_emit.utils import _emits_source
+
+        return [
+            filename
+            for filename, conf in self.files.items()
+            if conf.source is None or not _emits_source(conf, conf.source)
+        ]
+
+    def write(self):  # type: () -> List[str]
+        """
+        Write each changed file back to where it was read from
+
+        :return: Paths written
+        :rtype: ```List[str]```
+        """
+        written = []
+        for filename, conf in self.files.items():
+            # Rendered to compare, so that nodes edited in place count
+            text = "".join(iter_dumps(conf))
+            if text == conf.source:
+                continue
+            with open(filename, "wt") as f:
+                f.write(text)
+            conf.remember_source(text)
+            written.append(filename)
+        return written
+
+
+def load_includes(
+    root, prefix=None, executor=None
+):  # type: (str, Optional[str], Optional[Executor]) -> IncludeTree
+    """
+    Parse `root` and every file it includes, transitively, on a process pool
+
+    :param root: Path of the main conf, e.g., "/etc/nginx/nginx.conf"
+    :type root: ```str```
+
+    :param prefix: What relative `include` paths are relative to; `root`'s directory
+      if None
+    :type prefix: ```Optional[str]```
+
+    :param executor: Where to read and parse; a `ProcessPoolExecutor` for this call
+      if None
+    :type executor: ```Optional[concurrent.futures.Executor]```
+
+    :return: Every file, parsed, by path; `root` first, then as each was reached
+    :rtype: ```IncludeTree```
+    """
+    root = path.abspath(root)
+    if prefix is None:
+        prefix = path.dirname(root)
+    files = OrderedDict()
+    include_tree = IncludeTree(root, prefix, files)
+    if executor is None:
+        with ProcessPoolExecutor() as executor:
+            return _load(include_tree, executor)
+    return _load(include_tree, executor)
+
+
+def _load(include_tree, executor):  # type: (IncludeTree, Executor) -> IncludeTree
+    # Files are submitted as soon as an include naming them is parsed, so that nested
+    # includes are parsed alongside the rest
+    backend = get_parser_backend()
+    order = [include_tree.root]
+    parsed = {}
+    seen = set(order)
+    futures = {executor.submit(_read_and_parse, backend, include_tree.root): order[0]}
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            filename = futures.pop(future)
+            source, tree = future.result()
+            try:
+                parsed[filename] = ParsedConfig(tree, source)
+            except ValueError as e:
+                raise _in_file(filename, e)
+            for pattern in _include_patterns(tree):
+                for included in include_tree.resolve(pattern):
+                    if included not in seen:
+                        seen.add(included)
+                        order.append(included)
+                        futures[executor.submit(_read_and_parse, backend, included)] = (
+                            included
+                        )
+    include_tree.files.update((filename, parsed[filename]) for filename in order)
+    return include_tree
+
+
+__all__ = ["IncludeTree", "load_includes"]
@@ -0,0 +1,133 @@
+"""
+Optional timing and counters for the public functions of `utils`, `emit` and `remote`.
+
+Each instrumented call is a span, reported to the sink given to `set_sink` with how
+long it took and what was counted during it: `nodes_visited`, `bytes_parsed`,
+`bytes_emitted`, `bytes_downloaded`, `cache_hits`, …. A span's counters include those
+of the spans nested in it. With no sink, the default, an instrumented function costs
+one extra call and a global lookup.
+"""
+
+import logging
+from functools import wraps
+from threading import local
+from timeit import default_timer
+from typing import Callable, Dict, Optional
+
+
+class LoggingSink(object):
+    """
+    Logs each span as one record, with `span`, `seconds` and `counters` attributes for
+    structured handlers; through the `logging.yml` setup by default
+    """
+
+    def __init__(
+        self, logger=None, level=logging.DEBUG
+    ):  # type: (Optional[logging.Logger], int) -> None
+        if logger is None:
+            from nginx_parse_emit import get_logger
+
+            logger = get_logger("nginx_parse_emit.instrument")
+        self.logger = logger
+        self.level = level
+
+    def span(
+        self, name, seconds, counters
+    ):  # type: (str, float, Dict[str, int]) -> None
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(
+                self.level,
+                "%s took %.6fs %s",
+                name,
+                seconds,
+                " ".join("{}={}".format(*item) for item in sorted(counters.items())),
+                extra={"span": name, "seconds": seconds, "counters": counters},
+            )
+
+
+_sink = None
+_spans = local()
+
+
+def get_sink():  # type: () -> Optional[LoggingSink]
+    return _sink
+
+
+def set_sink(sink):  # type: (Optional[LoggingSink]) -> Optional[LoggingSink]
+    """
+    Report spans to `sink`—anything with a `span(name, seconds, counters)` method—or
+    stop with `None`
+
+    :param sink: E.g., `LoggingSink()`
+    :type sink: ```Optional[LoggingSink]```
+
+    :return: The previous sink
+    :rtype: ```Optional[LoggingSink]```
+    """
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+def count(name, n=1):  # type: (str, int) -> None
+    """
+    Add `n` to counter `name` of the innermost span on this thread, if any
+    """
+    if _sink is None:
+        return
+    stack = getattr(_spans, "stack", None)
+    if stack:
+        counters = stack[-1]
+        counters[name] = counters.get(name, 0) + n
+
+
+class span(object):
+    """
+    Context manager timing its body as span `name`
+    """
+
+    __slots__ = ("name", "sink", "start")
+
+    def __init__(self, name):  # type: (str) -> None
+        self.name = name
+        self.sink = _sink
+
+    def __enter__(self):
+        if self.sink is not None:
+            stack = getattr(_spans, "stack", None)
+            if stack is None:
+                stack = _spans.stack = []
+            stack.append({})
+            self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.sink is not None:
+            seconds = default_timer() - self.start
+            stack = _spans.stack
+            counters = stack.pop()
+            if stack:
+                parent = stack[-1]
+                for key, value in counters.items():
+                    parent[key] = parent.get(key, 0) + value
+            self.sink.span(self.name, seconds, counters)
+
+
+def instrumented(f):  # type: (Callable) -> Callable
+    """
+    Decorator making every call of `f` a span named after its module and name, e.g.,
+    "utils.merge_into"
+    """
+    name = "{}.{}".format(f.__module__.rpartition(".")[2], f.__name__)
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if _sink is None:
+            return f(*args, **kwargs)
+        with span(name):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
+__all__ = ["LoggingSink", "count", "get_sink", "instrumented", "set_sink", "span"]
@@ -0,0 +1,226 @@
+"""
+`ParsedConfig` that parses its top-level nodes only when they are used.
+
+Opening one scans the text once, matching braces, to find where each top-level node
+starts and ends and which `server_name`s and `listen`s each block has; nothing else is
+parsed. The helpers in `utils` and `emit` find their blocks through the indexes, so
+only those they read or edit are ever parsed, and `nginx_parse_emit.dumper` copies the
+rest straight from the source. Opened from a file, the source is memory-mapped, so the
+text of untouched blocks is never even read into Python.
+"""
+
+from mmap import ACCESS_READ, mmap
+from typing import Iterable, Optional, Union
+
+from nginx_parse_emit.config import INDEXED_VALUES, ParsedConfig, fingerprint
+from nginx_parse_emit.parser import loads, scan_top_level
+
+
+class _Unparsed(object):
+    """
+    Stands in, within the list, for a top-level node not parsed yet
+    """
+
+    __slots__ = ("start", "end", "directives")
+
+    def __init__(self, start, end, directives):  # type: (int, int, list) -> None
+        self.start = start
+        self.end = end
+        self.directives = directives
+
+
+class MappedText(object):
+    """
+    Slices of a UTF-8 buffer, e.g., an `mmap`, decoded as they are taken; the `source`
+    of a `LazyConfig` opened from a file
+    """
+
+    def __init__(self, buffer):  # type: (Union[bytes, mmap]) -> None
+        self.buffer = buffer
+
+    def __getitem__(self, key):  # type: (slice) -> str
+        return self.buffer[key].decode("utf-8")
+
+    def __len__(self):  # type: () -> int
+        return len(self.buffer)
+
+    def __str__(self):  # type: () -> str
+        return self[:]
+
+    def encode(self, encoding="utf-8"):  # type: (str) -> bytes
+        return self.buffer[:] if encoding == "utf-8" else str(self).encode(encoding)
+
+
+class LazyConfig(ParsedConfig):
+    """
+    `ParsedConfig` of `source` whose top-level nodes are parsed on first access
+
+    Indexing, iterating and comparing parse the nodes they reach. Lookups by
+    `server_name` or `listen` are answered from the scan, parsing only the blocks
+    found; other lookups first parse the blocks whose text mentions what is looked up.
+    Copies and pickles are parsed in full.
+    """
+
+    def __init__(self, source):  # type: (Union[str, bytes, mmap]) -> None
+        scan = scan_top_level(source, INDEXED_VALUES)
+        list.__init__(self, (_Unparsed(*node) for node in scan))
+        self.reindex()
+        self._buffer = source
+        self._mmap = None
+        self.source = source if isinstance(source, str) else MappedText(source)
+        self.source_spans = [(start, end) for start, end, _ in scan]
+        self._spans = {
+            id(node): (node, i, node.start, node.end, None)
+            for i, node in enumerate(list.__iter__(self))
+        }
+
+    @classmethod
+    def open(cls, filename):  # type: (str) -> LazyConfig
+        """
+        Memory-map `filename` and scan it. The file must not change while the config
+        is open; to write the config back to it, render it first, e.g., with
+        `"".join(iter_dumps(conf))`, then `close` it.
+        """
+        with open(filename, "rb") as f:
+            if not f.seek(0, 2):
+                return cls(b"")
+            buffer = mmap(f.fileno(), 0, access=ACCESS_READ)
+        conf = cls(buffer)
+        conf._mmap = buffer
+        return conf
+
+    def close(self):  # type: () -> None
+        """
+        Unmap the file; nodes not parsed by now can no longer be
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def parsed(self):  # type: () -> int
+        """
+        :return: How many top-level nodes have been parsed so far
+        :rtype: ```int```
+        """
+        return sum(type(node) is not _Unparsed for node in list.__iter__(self))
+
+    def _parse_node(self, i):  # type: (int) -> list
+        node = list.__getitem__(self, i)
+        if type(node) is not _Unparsed:
+            return node
+        parsed = loads(self.source[node.start : node.end])
+        if len(parsed) != 1:
+            raise ValueError(
+                "Expected one node at offset {} of nginx conf".format(node.start)
+            )
+        block = parsed[0]
+        list.__setitem__(self, i % len(self), block)
+        self._unindex(node)
+        self._index(block)
+        if self._positions is not None:
+            self._positions[id(block)] = self._positions.pop(id(node))
+        span = self._spans.pop(id(node), None)
+        if span is not None:
+            # Unlike the placeholder, the block can be edited in place from now on
+            self._spans[id(block)] = (block,) + span[1:4] + (fingerprint(block),)
+        return block
+
+    def _parse_mentioning(self, words):  # type: (Iterable[str]) -> None
+        needles = [
+            word if isinstance(self._buffer, str) else word.encode("utf-8")
+            for word in words
+            if word not in INDEXED_VALUES
+        ]
+        for i, node in enumerate(list.__iter__(self)):
+            if type(node) is _Unparsed and any(
+                self._buffer.find(needle, node.start, node.end) != -1
+                for needle in needles
+            ):
+                self._parse_node(i)
+
+    def _index(self, block):
+        if type(block) is not _Unparsed:
+            return super(LazyConfig, self)._index(block)
+        keys = []
+        for node in block.directives:
+            self._index_directive(block, node, keys)
+        self._keys[id(block)] = keys
+
+    def _ordered(self, members):
+        return list(map(self._parse_node, sorted(map(self.position, members))))
+
+    def servers_by_directive(
+        self, name, value=None
+    ):  # type: (str, Optional[str]) -> [list]
+        self._parse_mentioning((name,))
+        return super(LazyConfig, self).servers_by_directive(name, value)
+
+    def servers_by_block(self, name):  # type: (str) -> [list]
+        self._parse_mentioning((name,))
+        return super(LazyConfig, self).servers_by_block(name)
+
+    def locations(self, location):  # type: (str) -> [(list, list)]
+        self._parse_mentioning((location,))
+        return super(LazyConfig, self).locations(location)
+
+    # Whole-list access parses what it reaches
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(map(self._parse_node, range(*i.indices(len(self)))))
+        return self._parse_node(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._parse_node(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self._parse_node(i)
+
+    def __contains__(self, node):
+        return any(block == node for block in self)
+
+    def __eq__(self, other):
+        return list(self) == (list(other) if isinstance(other, list) else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __add__(self, other):
+        return list(self) + other
+
+    def index(self, node, *args):
+        return list(self).index(node, *args)
+
+    def count(self, node):
+        return list(self).count(node)
+
+    def pop(self, i=-1):
+        self._parse_node(i)
+        return super(LazyConfig, self).pop(i)
+
+    def __copy__(self):
+        conf = ParsedConfig(self)
+        conf.source, conf.source_spans = self.source, self.source_spans
+        conf._spans = dict(self._spans)
+        return conf
+
+    def __deepcopy__(self, memo):
+        from copy import deepcopy
+
+        return ParsedConfig(deepcopy(list(self), memo))
+
+    def __reduce__(self):
+        return ParsedConfig, (list(self),)
+
+
+__all__ = ["LazyConfig", "MappedText"]
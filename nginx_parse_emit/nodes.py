@@ -0,0 +1,177 @@
+"""
+Compact alternative to the nginxparser tree: `Block`, `Directive` and `Comment`
+objects with `__slots__` in place of nested lists, so that a node is told apart by its
+type rather than by `isinstance(node[0], list)`.
+
+`Directive`s and `Comment`s are immutable, so `from_lists` gives every occurrence of
+the same one—`proxy_set_header Host $host;` in each of a thousand `location`s—as one
+shared object, interns directive names and shares header words. Together with the
+smaller nodes that takes a large config to a fraction of the memory of nested lists.
+`from_lists` and `to_lists` convert losslessly between the two forms; the functions in
+`utils` and `emit`, and `dumper`, accept either.
+"""
+
+from sys import intern
+from typing import Dict, Optional, Tuple
+
+
+class Node(object):
+    """
+    Base of the node types
+    """
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__,
+            ", ".join(repr(getattr(self, name)) for name in self.__slots__),
+        )
+
+
+class _Frozen(Node):
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+
+class Directive(_Frozen):
+    """
+    `name value;`, or `name;` when `value` is None
+    """
+
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value=None):  # type: (str, Optional[str]) -> None
+        object.__setattr__(self, "name", intern(name))
+        object.__setattr__(self, "value", value)
+
+    def as_list(self):  # type: () -> list
+        return [self.name] if self.value is None else [self.name, self.value]
+
+
+class Comment(_Frozen):
+    """
+    `# text`; `text` keeps its "#"
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):  # type: (str) -> None
+        object.__setattr__(self, "text", text)
+
+    def as_list(self):  # type: () -> list
+        return [self.text, "\n"]
+
+
+class Block(Node):
+    """
+    `header… { children… }`, e.g., `Block(("location", "/api"), [Directive(…)])`
+    """
+
+    __slots__ = ("header", "children")
+
+    def __init__(
+        self, header, children=None
+    ):  # type: (Tuple[str], Optional[list]) -> None
+        self.header = tuple(header)
+        self.children = [] if children is None else children
+
+    def as_list(self):  # type: () -> list
+        """
+        `[header, children]`, with `children` still nodes
+        """
+        return [list(self.header), self.children]
+
+
+def from_lists(tree, shared=None):  # type: (list, Optional[Dict]) -> list
+    """
+    Nodes for an nginxparser tree
+
+    :param tree: Parsed tree, e.g., from `loads`
+    :type tree: ```list```
+
+    :param shared: Directives, comments and header words seen so far, to reuse; one
+      for this tree if None
+    :type shared: ```Optional[dict]```
+
+    :return: `Block`s, `Directive`s and `Comment`s, nested as in `tree`
+    :rtype: ```list```
+    """
+    if shared is None:
+        shared = {}
+    nodes = []
+    for node in tree:
+        key = node[0]
+        if isinstance(key, list):
+            header = tuple(shared.setdefault(word, word) for word in key)
+            node = Block(header, from_lists(node[1], shared))
+            nodes.append(node)
+            continue
+        elif len(node) == 2 and key.startswith("#") and node[1] == "\n":
+            node = Comment(key)
+        elif len(node) == 1 or len(node) == 2 and node[1] is None:
+            node = Directive(key)
+        elif len(node) == 2:
+            node = Directive(key, node[1])
+        else:
+            raise ValueError("Not an nginxparser node: {!r}".format(node))
+        nodes.append(shared.setdefault(node, node))
+    return nodes[:]
+
+
+def to_lists(nodes):  # type: (list) -> list
+    """
+    nginxparser tree for nodes; `to_lists(from_lists(tree)) == tree`
+
+    :param nodes: `Block`s, `Directive`s and `Comment`s
+    :type nodes: ```list```
+
+    :return: Parsed tree, as from `loads`
+    :rtype: ```list```
+    """
+    return [
+        (
+            [list(node.header), to_lists(node.children)]
+            if type(node) is Block
+            else node.as_list()
+        )
+        for node in nodes
+    ]
+
+
+def is_nodes(tree):  # type: (list) -> bool
+    """
+    Whether `tree` is in the form `from_lists` gives, rather than nested lists
+    """
+    # Looks at the list as is, so that a `LazyConfig` parses nothing
+    return isinstance(tree, Node) or (
+        isinstance(tree, list)
+        and bool(tree)
+        and isinstance(list.__getitem__(tree, 0), Node)
+    )
+
+
+__all__ = [
+    "Block",
+    "Comment",
+    "Directive",
+    "Node",
+    "from_lists",
+    "is_nodes",
+    "to_lists",
+]
@@ -0,0 +1,228 @@
+"""
+Parser backends producing the nginxparser tree that `utils` and `emit` work on.
+
+`"nginxparser_eb"`, the default, is the pyparsing grammar from `nginxparser_eb`.
+`"fast"` is a single-pass lexer over one regular expression which builds the same
+nested lists: `[[header...], [body...]]` blocks, `[key, value]`/`[key]` directives and
+`["# text", "\\n"]` comments. Select one with `set_parser_backend` or the
+`NGINX_PARSE_EMIT_PARSER` environment variable.
+"""
+
+import re
+from os import environ
+from typing import AnyStr
+
+from nginx_parse_emit.instrument import count
+
+# Unrolled so that each text has one way to match, which keeps failures linear
+_word = (
+    r"""(?=[^\s{};#])[^\s{};"'\\]*"""
+    r"""(?:(?:\\.|"[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*')[^\s{};"'\\]*)*"""
+)
+_words = re.compile(_word)
+
+# One match per statement: a comment, or words up to the `;`, `{` or `}` ending them
+_statement = re.compile(
+    r"""
+    \s*(?:
+        (\#[^\n]*)
+      | ((?:{word})(?:\s+(?:{word}))*)?\s*([{{}};])
+    )
+    """.format(word=_word),
+    re.VERBOSE,
+)
+_trailing_space = re.compile(r"\s*\Z")
+
+# The same over UTF-8 bytes, for `scan_top_level` on memory-mapped files
+_statement_bytes = re.compile(_statement.pattern.encode("ascii"), re.VERBOSE)
+_trailing_space_bytes = re.compile(rb"\s*\Z")
+
+
+def fast_loads(source):  # type: (str) -> list
+    """
+    Parse nginx conf text without pyparsing
+
+    :param source: nginx conf text
+    :type source: ```str```
+
+    :return: The tree `nginxparser_eb.loads` gives for `source`
+    :rtype: ```list```
+    """
+    root = body = []
+    parents = []
+    match_statement = _statement.match
+    pos, end = 0, len(source)
+    while pos < end:
+        match = match_statement(source, pos)
+        if match is None:
+            if _trailing_space.match(source, pos):
+                break
+            _syntax_error(source, pos)
+        pos = match.end()
+        comment, words, punctuation = match.groups()
+        if comment is not None:
+            body.append([comment.rstrip(), "\n"])
+        elif punctuation == "}":
+            if words is not None or not parents:
+                _syntax_error(source, match.start(3))
+            body = parents.pop()
+        elif words is None:
+            _syntax_error(source, match.start(3))
+        elif punctuation == ";":
+            # Value keeps its inner whitespace verbatim, as does an `if` condition
+            body.append(words.split(None, 1))
+        else:
+            header = words.split(None, 1)
+            if header[0] != "if" and len(header) > 1:
+                header = [header[0]] + _words.findall(header[1])
+            block = [header, []]
+            body.append(block)
+            parents.append(body)
+            body = block[1]
+    if parents:
+        raise ValueError("Unexpected end of nginx conf; unclosed block")
+    return root
+
+
+def top_level_spans(source):  # type: (str) -> [(int, int)]
+    """
+    Where each top-level node of `source` starts and ends, by scanning statements
+    and matching braces without building the tree
+
+    :param source: nginx conf text
+    :type source: ```str```
+
+    :return: (start, end) offsets, one pair per node of `loads(source)`
+    :rtype: ```[(int, int)]```
+    """
+    return [(start, end) for start, end, _ in scan_top_level(source)]
+
+
+def scan_top_level(source, keys=frozenset()):  # type: (AnyStr, frozenset) -> list
+    """
+    `top_level_spans`, along with the directives named in `keys` directly in each
+    top-level block, e.g., its `server_name`s, sliced out of `source` one by one
+
+    :param source: nginx conf text, or its UTF-8 bytes—e.g., an `mmap`—in which case
+      offsets are byte offsets
+    :type source: ```Union[str, bytes, mmap.mmap]```
+
+    :param keys: Names of the directives to extract
+    :type keys: ```frozenset```
+
+    :return: (start, end, [[key, value], …]) per node of `loads(source)`
+    :rtype: ```[(int, int, list)]```
+    """
+    text = isinstance(source, str)
+    match_statement = (_statement if text else _statement_bytes).match
+    trailing_space = (_trailing_space if text else _trailing_space_bytes).match
+    open_brace, close_brace = ("{", "}") if text else (b"{", b"}")
+    longest = max(map(len, keys)) + 1 if keys else 0
+    nodes = []
+    depth = 0
+    start = directives = None
+    pos, end = 0, len(source)
+    while pos < end:
+        match = match_statement(source, pos)
+        if match is None:
+            if trailing_space(source, pos):
+                break
+            _syntax_error(source, pos)
+        pos = match.end()
+        comment = match.start(1) != -1
+        words_start, words_end = match.span(2)
+        if start is None:
+            start = match.start(1 if comment else 2 if words_start != -1 else 3)
+        punctuation = None if comment else source[pos - 1 : pos]
+        if punctuation == open_brace:
+            if not depth:
+                directives = []
+            depth += 1
+            continue
+        elif punctuation == close_brace:
+            if words_start != -1 or not depth:
+                _syntax_error(source, match.start(3))
+            depth -= 1
+        elif depth == 1 and longest and words_start != -1:
+            # Only the first word is sliced out of a statement that isn't wanted
+            head = source[words_start : min(words_end, words_start + longest)]
+            key = (head if text else head.decode("latin-1")).split(None, 1)[0]
+            if key in keys:
+                words = source[words_start:words_end]
+                directives.append(
+                    (words if text else words.decode("utf-8")).split(None, 1)
+                )
+        if not depth:
+            nodes.append((start, pos, directives or []))
+            start = directives = None
+    if depth:
+        raise ValueError("Unexpected end of nginx conf; unclosed block")
+    return nodes
+
+
+def _syntax_error(source, pos):  # type: (AnyStr, int) -> None
+    if isinstance(source, str):
+        near, line = source[pos : pos + 16], source.count("\n", 0, pos) + 1
+    else:
+        near = source[pos : pos + 16].decode("utf-8", "replace")
+        line = bytes(source[:pos]).count(b"\n") + 1
+    raise ValueError("Unexpected {!r} on line {} of nginx conf".format(near, line))
+
+
+def _nginxparser_eb_loads(source):  # type: (str) -> list
+    from nginxparser_eb.nginxparser_eb import loads
+
+    return loads(source)
+
+
+BACKENDS = {"fast": fast_loads, "nginxparser_eb": _nginxparser_eb_loads}
+
+_backend = environ.get("NGINX_PARSE_EMIT_PARSER", "nginxparser_eb")
+if _backend not in BACKENDS:
+    raise ValueError(
+        "NGINX_PARSE_EMIT_PARSER must be one of {}".format(", ".join(sorted(BACKENDS)))
+    )
+
+
+def get_parser_backend():  # type: () -> str
+    return _backend
+
+
+def set_parser_backend(name):  # type: (str) -> str
+    """
+    Parse with `name` from now on
+
+    :param name: One of `BACKENDS`
+    :type name: ```str```
+
+    :return: The previous backend
+    :rtype: ```str```
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(
+            "Parser backend must be one of {}".format(", ".join(sorted(BACKENDS)))
+        )
+    previous, _backend = _backend, name
+    return previous
+
+
+def loads(source):  # type: (str) -> list
+    count("bytes_parsed", len(source))
+    return BACKENDS[_backend](source)
+
+
+def load(f):  # type: (file) -> list
+    return loads(f.read())
+
+
+__all__ = [
+    "BACKENDS",
+    "fast_loads",
+    "get_parser_backend",
+    "load",
+    "loads",
+    "scan_top_level",
+    "set_parser_backend",
+    "top_level_spans",
+]
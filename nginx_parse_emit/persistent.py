@@ -0,0 +1,108 @@
+"""
+Path-copying edits over the nginxparser nested-list tree.
+
+Each edit copies only the lists on the path from the root to the changed node; every
+other subtree is shared with the input, which is left untouched. So older versions
+stay valid and cost nothing extra to keep, and `changed_paths` can compare two
+versions by identity, skipping every shared subtree.
+"""
+
+
+def assoc_in(tree, path, value):  # type: (list, Tuple[int], Any) -> list
+    """
+    Replace the node at `path`
+
+    :param tree: Tree (or any node of it)
+    :type tree: ```list```
+
+    :param path: Indices from `tree` down to the node
+    :type path: ```Tuple[int]```
+
+    :param value: Replacement node
+    :type value: ```Any```
+
+    :return: New tree sharing every subtree off the path with `tree`
+    :rtype: ```list```
+    """
+    if not path:
+        return value
+    node = list(tree)
+    node[path[0]] = assoc_in(tree[path[0]], path[1:], value)
+    return node
+
+
+def update_in(tree, path, f):  # type: (list, Tuple[int], Callable[[Any], Any]) -> list
+    """
+    Replace the node at `path` with `f(node)`
+    """
+    return assoc_in(tree, path, f(get_in(tree, path)))
+
+
+def insert_in(tree, path, value):  # type: (list, Tuple[int], Any) -> list
+    """
+    Insert `value` so that it ends up at `path`
+    """
+    parent, i = path[:-1], path[-1]
+    return update_in(tree, parent, lambda node: node[:i] + [value] + node[i:])
+
+
+def remove_in(tree, path):  # type: (list, Tuple[int]) -> list
+    """
+    Remove the node at `path`
+    """
+    parent, i = path[:-1], path[-1]
+    return update_in(
+        tree, parent, lambda node: node[:i] + node[i + 1 :] if i != -1 else node[:-1]
+    )
+
+
+def get_in(tree, path):  # type: (list, Tuple[int]) -> Any
+    for i in path:
+        tree = tree[i]
+    return tree
+
+
+def changed_paths(
+    old, new, path=()
+):  # type: (list, list, Tuple[int]) -> Iterator[tuple]
+    """
+    Paths of the deepest nodes that differ between two versions of a tree. Subtrees
+    shared by identity are skipped without being looked at, so comparing a version
+    with one made from it by path-copying edits costs time proportional to the edits.
+
+    :param old: Earlier version
+    :type old: ```list```
+
+    :param new: Later version
+    :type new: ```list```
+
+    :param path: Path of `old`/`new` in their trees
+    :type path: ```Tuple[int]```
+
+    :return: Paths whose nodes were replaced, inserted or removed
+    :rtype: ```Iterator[Tuple[int]]```
+    """
+    if old is new:
+        return
+    if (
+        not isinstance(old, list)
+        or not isinstance(new, list)
+        or len(old) != len(new)
+        or not any(a is b for a, b in zip(old, new))
+    ):
+        if old != new:
+            yield path
+        return
+    for i, (a, b) in enumerate(zip(old, new)):
+        for changed in changed_paths(a, b, path + (i,)):
+            yield changed
+
+
+__all__ = [
+    "assoc_in",
+    "changed_paths",
+    "get_in",
+    "insert_in",
+    "remove_in",
+    "update_in",
+]
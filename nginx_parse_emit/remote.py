@@ -0,0 +1,300 @@
+"""
+Helpers that read and write confs on remote hosts over a `fabric2.Connection`.
+
+Kept apart from `utils` so that parsing and emitting never import fabric, paramiko
+or patchwork; `patchwork` itself is only imported once a remote path is checked.
+"""
+
+import tarfile
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from hashlib import sha256
+from io import BytesIO, StringIO
+from shlex import quote
+from time import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Mapping,
+    MutableMapping,
+    Optional,
+)
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.dumper import DumpReader, iter_dumps
+from nginx_parse_emit.instrument import count, instrumented, span
+from nginx_parse_emit.lazy import LazyConfig
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.utils import _emits_source
+
+if TYPE_CHECKING:
+    from fabric2 import Connection
+
+SITES_ENABLED = "/etc/nginx/sites-enabled"
+
+NO_CHANGE = "no change"
+
+UPLOADED = "uploaded"
+
+
+def _resolve(c, conf_name):  # type: (Connection, str) -> str
+    """
+    `conf_name`, with ".conf" appended unless it ends so or exists as is
+    """
+    if conf_name.endswith(".conf"):
+        return conf_name
+    from patchwork.files import exists
+
+    return conf_name if exists(c, runner=c.run, path=conf_name) else conf_name + ".conf"
+
+
+@instrumented
+def upsert_upload(
+    c, new_conf, name="default", use_sudo=True, remote_cache=None
+):  # type: (Connection, Callable[[list], list], str, bool, Optional[MutableMapping[str, str]]) -> Any
+    """
+    :param c: Connection
+    :type c: ```fabric.connection.Connection```
+
+    :param remote_cache: Remote conf texts by sha256 hex digest. If given, the remote
+      `sha256sum` is asked for first, and the download skipped when it is cached
+    :type remote_cache: ```Optional[MutableMapping[str, str]]```
+
+    :return: What `c.put` returned, or `NO_CHANGE` if there was nothing to upload
+    :rtype: ```Any```
+    """
+    conf_name = _resolve(c, "{}/{}".format(SITES_ENABLED, name))
+    if remote_cache is None:
+        source = _get_text(c, conf_name)
+    else:
+        source = _get_text_cached(c, conf_name, remote_cache)
+    # Only the blocks `new_conf` looks up are parsed
+    conf = LazyConfig(source)
+    new_conf = new_conf(conf)
+    # Compared by the text it renders, so that nodes edited in place count
+    if _emits_source(new_conf, source):
+        return NO_CHANGE
+
+    # Rendered as `put` reads it, rather than as one string; blocks that `new_conf`
+    # left alone are copied from the remote file as they were
+    if remote_cache is None:
+        with span("remote.put"):
+            return c.put(DumpReader(new_conf), conf_name)  # , use_sudo=use_sudo)
+
+    # Cached too, so the next run need not download what it uploaded
+    text = "".join(iter_dumps(new_conf)).encode("utf-8")
+    with span("remote.put"):
+        result = c.put(BytesIO(text), conf_name)  # , use_sudo=use_sudo)
+    remote_cache[sha256(text).hexdigest()] = text.decode("utf-8")
+    return result
+
+
+@instrumented
+def get_parsed_remote_conf(
+    c, conf_name, suffix="nginx", use_sudo=True
+):  # type: (Connection, str, str, bool) -> [str]
+    """
+    :param suffix: Unused; downloads no longer go through a temporary file
+    :type suffix: ```str```
+    """
+    conf_name = _resolve(c, conf_name)
+    return loads(_get_text(c, conf_name, use_sudo=use_sudo))
+
+
+# Appends "$f" to the files to archive, failing the command if it cannot be read
+_ADD = (
+    'if [ ! -r "$f" ]; then echo "$f: missing or unreadable" >&2; exit 1; fi; '
+    'set -- "$@" "$f"'
+)
+
+
+@instrumented
+def get_parsed_remote_confs(
+    c, names=None, directory=SITES_ENABLED
+):  # type: (Connection, Optional[Iterable[str]], str) -> OrderedDict
+    """
+    Fetch and parse many confs with one remote command, tarred over stdout
+
+    :param c: Connection
+    :type c: ```fabric.connection.Connection```
+
+    :param names: Confs in `directory`; each gets ".conf" appended unless it ends so
+      or exists as is, like `get_parsed_remote_conf`. Every file there if None.
+    :type names: ```Optional[Iterable[str]]```
+
+    :param directory: Remote directory of the confs
+    :type directory: ```str```
+
+    :return: Each file's name in `directory` to its `ParsedConfig`, which remembers
+      the fetched text
+    :rtype: ```OrderedDict```
+
+    :raises IOError: If a conf named is missing or unreadable
+    """
+    if names is None:
+        # Skips the "*" left when nothing matches, and subdirectories
+        select = ['for f in *; do if [ -f "$f" ]; then {}; fi; done'.format(_ADD)]
+    else:
+        names = list(names)
+        select = [
+            (
+                "f={}".format(quote(name))
+                if name.endswith(".conf")
+                else "if [ -e {0} ]; then f={0}; else f={1}; fi".format(
+                    quote(name), quote(name + ".conf")
+                )
+            )
+            + "; "
+            + _ADD
+            for name in names
+        ]
+    # Archived to a file first, as `sh` may lack `pipefail` to fail on a failed `tar`
+    archive = c.run(
+        "; ".join(
+            ["cd {} || exit 1".format(quote(directory)), "set --"]
+            + select
+            + [
+                'if [ "$#" -gt 0 ]; then t="$(mktemp)" && tar -czhf "$t" -- "$@" && '
+                'base64 < "$t"; s=$?; rm -f "$t"; exit "$s"; fi'
+            ]
+        ),
+        hide=True,
+    ).stdout
+    confs = OrderedDict()
+    if archive.strip():
+        with tarfile.open(fileobj=BytesIO(b64decode(archive)), mode="r:gz") as tar:
+            for member in tar:
+                if member.isfile():
+                    source = tar.extractfile(member).read().decode("utf-8")
+                    confs[member.name] = ParsedConfig.from_source(source)
+    missing = [
+        name
+        for name in names or ()
+        if name not in confs and name + ".conf" not in confs
+    ]
+    if missing:
+        raise IOError(
+            "Missing from {}: {}".format(directory, ", ".join(map(repr, missing)))
+        )
+    return confs
+
+
+@instrumented
+def upload_confs(
+    c, confs, directory=SITES_ENABLED
+):  # type: (Connection, Mapping[str, list], str) -> [str]
+    """
+    Write back every conf that changed with one remote command, tarred over stdin.
+    A conf that is a symlink, as enabled sites often are, is written through to its
+    target; existing files keep their mode and owner, and new ones get mode 0644.
+
+    :param c: Connection
+    :type c: ```fabric.connection.Connection```
+
+    :param confs: File name in `directory` to its conf, e.g., as from
+      `get_parsed_remote_confs`; a `ParsedConfig` rendering its source as it was is
+      skipped
+    :type confs: ```Mapping[str, list]```
+
+    :param directory: Remote directory of the confs
+    :type directory: ```str```
+
+    :return: Names of the files written
+    :rtype: ```[str]```
+    """
+    buf = BytesIO()
+    written = []
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, conf in confs.items():
+            source = getattr(conf, "source", None)
+            if source is not None and _emits_source(conf, source):
+                continue
+            data = "".join(iter_dumps(conf)).encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size, info.mode, info.mtime = len(data), 0o644, time()
+            tar.addfile(info, BytesIO(data))
+            written.append(name)
+    if written:
+        # Unpacked aside, then copied over each file's contents rather than replacing it
+        c.run(
+            "; ".join(
+                (
+                    "cd {} || exit 1".format(quote(directory)),
+                    "umask 022",
+                    't="$(mktemp -d)" || exit 1',
+                    'if base64 -d | tar -xzf - -C "$t"'
+                    + "".join(
+                        ' && cat "$t"/{0} > "$(readlink -f {0})"'.format(quote(name))
+                        for name in written
+                    )
+                    + "; then s=0; else s=1; fi",
+                    'rm -rf "$t"',
+                    'exit "$s"',
+                )
+            ),
+            in_stream=StringIO(b64encode(buf.getvalue()).decode("ascii")),
+            hide=True,
+        )
+    return written
+
+
+@instrumented
+def upsert_upload_many(
+    c, new_conf, names=None, directory=SITES_ENABLED
+):  # type: (Connection, Callable[[list], list], Optional[Iterable[str]], str) -> OrderedDict
+    """
+    `upsert_upload` for many confs on one host: one command to fetch them all, one
+    to write back those that `new_conf` changed
+
+    :return: Each file's name to `UPLOADED` or `NO_CHANGE`
+    :rtype: ```OrderedDict```
+    """
+    confs = OrderedDict(
+        (name, new_conf(conf))
+        for name, conf in get_parsed_remote_confs(c, names, directory).items()
+    )
+    written = frozenset(upload_confs(c, confs, directory))
+    return OrderedDict(
+        (name, UPLOADED if name in written else NO_CHANGE) for name in confs
+    )
+
+
+def _get_text_cached(
+    c, remote, remote_cache
+):  # type: (Connection, str, MutableMapping[str, str]) -> str
+    """
+    `_get_text`, skipped when `remote_cache` has the text `sha256sum` reports
+    """
+    digest = c.run("sha256sum {}".format(quote(remote)), hide=True).stdout.split()[0]
+    text = remote_cache.get(digest)
+    count("remote_cache_hits" if text is not None else "remote_cache_misses")
+    if text is None:
+        text = _get_text(c, remote)
+        remote_cache[sha256(text.encode("utf-8")).hexdigest()] = text
+    return text
+
+
+def _get_text(c, remote, **kwargs):  # type: (Connection, str, **Any) -> str
+    """
+    Download `remote` into memory. `Connection.get` writes bytes to a file object,
+    hence `BytesIO` where text buffers fail.
+    """
+    buf = BytesIO()
+    with span("remote.get"):
+        c.get(remote=remote, local=buf, **kwargs)
+    count("bytes_downloaded", len(buf.getvalue()))
+    return buf.getvalue().decode("utf-8")
+
+
+__all__ = [
+    "NO_CHANGE",
+    "SITES_ENABLED",
+    "UPLOADED",
+    "get_parsed_remote_conf",
+    "get_parsed_remote_confs",
+    "upload_confs",
+    "upsert_upload",
+    "upsert_upload_many",
+]
@@ -0,0 +1,436 @@
+"""
+CSS-like selectors over parsed configs, compiled once into matchers, e.g.,
+
+    server[server_name=offscale.io][listen^=443] > location[/api0]
+
+A compound names a block type or a directive, or is `*` for any block, followed by
+any number of conditions:
+
+    [name]          has a directive `name`
+    [name=value]    …whose value is exactly `value`; `^=` starts with it, `$=` ends
+                    with it, `*=` contains it and `~=` has it as a whitespace-separated
+                    word, e.g., `[server_name~=www.offscale.io]`
+    [/api0]         its arguments—a block's header after its type, or a directive's
+                    value—are exactly "/api0"; also `[^=/api]` and the other operators
+
+Values may be quoted with `"` or `'`, and must be if they contain `]`. A space between
+compounds means a descendant, `>` a child, and `,` separates alternatives. `:root` is
+the tree itself, so `:root > server` selects top-level servers only; on a
+`ParsedConfig`, selectors starting so are answered from its indexes, visiting only
+the top-level blocks that can match.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple, Union
+
+from nginx_parse_emit.config import INDEXED_VALUES, ParsedConfig
+from nginx_parse_emit.instrument import count
+
+ROOT = ":root"
+
+Compound = namedtuple("Compound", ("name", "conditions", "combinator"))
+Condition = namedtuple("Condition", ("name", "op", "value"))
+
+_OPS = {
+    "=": lambda actual, value: actual == value,
+    "^=": lambda actual, value: actual.startswith(value),
+    "$=": lambda actual, value: actual.endswith(value),
+    "*=": lambda actual, value: value in actual,
+    "~=": lambda actual, value: value in actual.split(),
+}
+
+_VALUE = r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[^\]"']*)"""
+_TYPE = re.compile(r"\s*(\*|:root|[A-Za-z_]\w*)?")
+_NAME_CONDITION = re.compile(
+    r"\[\s*([A-Za-z_]\w*)\s*(?:([~^$*]?=)\s*" + _VALUE + r")?\]"
+)
+_ARGS_CONDITION = re.compile(r"\[\s*(?:([~^$*]?=)\s*)?" + _VALUE + r"\]")
+_COMBINATOR = re.compile(r"\s*([>,])\s*|\s+")
+
+
+def _unquote(value):  # type: (str) -> str
+    value = value.strip()
+    if value[:1] in ("'", '"'):
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def quote_value(value):  # type: (str) -> str
+    """
+    `value` quoted for use in a condition, e.g., `"*[server_name={}]".format(…)`
+    """
+    return '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+def parse_selector(text):  # type: (str) -> Tuple[Tuple[Compound]]
+    """
+    :param text: Selector, e.g., `server[listen^=443] > location[/api0]`
+    :type text: ```str```
+
+    :return: Its alternatives, each a tuple of compounds, outermost first
+    :rtype: ```Tuple[Tuple[Compound]]```
+    """
+    alternatives, compounds, combinator, at = [], [], None, 0
+    while True:
+        match = _TYPE.match(text, at)
+        name, at = match.group(1), match.end()
+        conditions = []
+        while text.startswith("[", at):
+            match = _NAME_CONDITION.match(text, at)
+            if match is not None:
+                condition_name, op, value = match.groups()
+                conditions.append(
+                    Condition(
+                        condition_name, op, None if op is None else _unquote(value)
+                    )
+                )
+            else:
+                match = _ARGS_CONDITION.match(text, at)
+                if match is None or not match.group(2).strip():
+                    raise ValueError(
+                        "Invalid condition at {} of selector {!r}".format(at, text)
+                    )
+                op, value = match.groups()
+                conditions.append(Condition(None, op or "=", _unquote(value)))
+            at = match.end()
+        if name is None and not conditions:
+            raise ValueError("Expected a compound at {} of {!r}".format(at, text))
+        if name == ROOT and (conditions or compounds):
+            raise ValueError("{} must start a selector: {!r}".format(ROOT, text))
+        compounds.append(
+            Compound(None if name == "*" else name, tuple(conditions), combinator)
+        )
+
+        match = _COMBINATOR.match(text, at)
+        if match is None and at != len(text):
+            raise ValueError(
+                "Unexpected {!r} at {} of selector {!r}".format(text[at], at, text)
+            )
+        if match is None or match.end() == len(text):
+            if match is not None and match.group(1):
+                raise ValueError("Selector {!r} ends with a combinator".format(text))
+            alternatives.append(tuple(compounds))
+            return tuple(alternatives)
+        at = match.end()
+        if match.group(1) == ",":
+            alternatives.append(tuple(compounds))
+            compounds, combinator = [], None
+        else:
+            combinator = match.group(1) or " "
+
+
+def _is_comment(node):  # type: (list) -> bool
+    return len(node) == 2 and node[0].startswith("#") and node[1] == "\n"
+
+
+def _compile_condition(condition):  # type: (Condition) -> callable
+    name, op, value = condition
+    if name is None:
+        test = _OPS[op]
+
+        def matches(node):
+            head = node[0]
+            if isinstance(head, list):
+                return test(" ".join(head[1:]), value)
+            return test(node[1] if len(node) > 1 and node[1] is not None else "", value)
+
+        return matches
+
+    test = None if op is None else _OPS[op]
+
+    def matches(node):
+        if not isinstance(node[0], list):
+            return False
+        for statement in node[1]:
+            if (
+                statement
+                and statement[0] == name
+                and (
+                    test is None
+                    or len(statement) > 1
+                    and statement[1] is not None
+                    and test(statement[1], value)
+                )
+            ):
+                return True
+        return False
+
+    return matches
+
+
+def _compile_compound(compound):  # type: (Compound) -> callable
+    name = compound.name
+    conditions = tuple(map(_compile_condition, compound.conditions))
+
+    def matches(node):
+        head = node[0]
+        if isinstance(head, list):
+            if name is not None and head[0] != name:
+                return False
+        elif name is None or head != name:
+            return False
+        for condition in conditions:
+            if not condition(node):
+                return False
+        return True
+
+    return matches
+
+
+class Selector(object):
+    """
+    A selector compiled to one matcher per compound. Alternatives are matched
+    together in a single walk, tracking which compounds the ancestors of each node
+    matched as bits of an `int`.
+    """
+
+    __slots__ = (
+        "text",
+        "alternatives",
+        "_matchers",
+        "_child",
+        "_descendant",
+        "_first",
+        "_last",
+        "_root",
+    )
+
+    def __init__(self, text):  # type: (str) -> None
+        self.text = text
+        self.alternatives = parse_selector(text)
+        self._matchers = []
+        self._child = self._descendant = self._first = self._last = self._root = 0
+        for compounds in self.alternatives:
+            for k, compound in enumerate(compounds):
+                bit = 1 << len(self._matchers)
+                self._matchers.append(_compile_compound(compound))
+                if compound.name == ROOT:
+                    self._root |= bit
+                elif k == 0:
+                    self._first |= bit
+                elif compound.combinator == ">":
+                    self._child |= bit
+                else:
+                    self._descendant |= bit
+            self._last |= bit
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.text)
+
+    def _allowed(self, matched, ancestors):  # type: (int, int) -> int
+        # Compounds a child can match, given what its parent and ancestors matched
+        return (
+            ((matched << 1) & self._child)
+            | ((ancestors << 1) & self._descendant)
+            | self._first
+        )
+
+    def select(self, tree):  # type: (list) -> Iterator[Tuple[tuple, list]]
+        """
+        Every node matching, in document order. Collect them before editing `tree`.
+
+        :param tree: Parsed tree, e.g., from `loads`, or a `ParsedConfig`
+        :type tree: ```list```
+
+        :return: `(path, node)` pairs, `path` being indices from `tree` down to
+          `node`, as `nginx_parse_emit.persistent` takes them
+        :rtype: ```Iterator[Tuple[tuple, list]]```
+        """
+        if self._root & self._last:
+            yield (), tree
+        allowed = self._allowed(self._root, self._root)
+        if not allowed:
+            return
+        positions = self._positions(tree)
+        stack = [
+            (
+                tree,
+                iter(range(len(tree)) if positions is None else positions),
+                (),
+                self._root,
+                allowed,
+            )
+        ]
+        matchers, last = self._matchers, self._last
+        # Counted once per query, when it ends or is abandoned, not once per node
+        visited = 0
+        try:
+            while stack:
+                nodes, indices, path, ancestors, allowed = stack[-1]
+                i = next(indices, None)
+                if i is None:
+                    stack.pop()
+                    continue
+                node = nodes[i]
+                visited += 1
+                if not node or not isinstance(node[0], list) and _is_comment(node):
+                    continue
+                matched, bits = 0, allowed
+                while bits:
+                    bit = bits & -bits
+                    if matchers[bit.bit_length() - 1](node):
+                        matched |= bit
+                    bits ^= bit
+                if matched & last:
+                    yield path + (i,), node
+                if isinstance(node[0], list):
+                    within = self._allowed(matched, ancestors | matched)
+                    if within:
+                        stack.append(
+                            (
+                                node[1],
+                                iter(range(len(node[1]))),
+                                path + (i, 1),
+                                ancestors | matched,
+                                within,
+                            )
+                        )
+        finally:
+            count("nodes_visited", visited)
+
+    def first(self, tree):  # type: (list) -> Optional[Tuple[tuple, list]]
+        """
+        The first `(path, node)` matching, if any
+        """
+        return next(self.select(tree), None)
+
+    def exists(self, tree):  # type: (list) -> bool
+        """
+        Whether any node of `tree` matches. On a `ParsedConfig`, alternatives like
+        `:root > *[server_name=offscale.io]` are answered from its indexes, without
+        visiting—or, on a `LazyConfig`, parsing—a block.
+        """
+        if isinstance(tree, ParsedConfig) and all(map(_by_value, self.alternatives)):
+            return any(
+                tree.has_directive(*_by_value(compounds))
+                for compounds in self.alternatives
+            )
+        return self.first(tree) is not None
+
+    def _positions(self, tree):  # type: (list) -> Optional[list]
+        """
+        Top-level positions that can hold a match, from the indexes of a
+        `ParsedConfig`; None to visit them all
+        """
+        if not isinstance(tree, ParsedConfig):
+            return None
+        blocks = {}
+        for compounds in self.alternatives:
+            found = _indexed(tree, compounds)
+            if found is None:
+                return None
+            blocks.update((id(block), block) for block in found)
+        return sorted(map(tree.position, blocks.values()))
+
+
+def _by_value(compounds):  # type: (Tuple[Compound]) -> Optional[Tuple[str, str]]
+    """
+    `(name, value)` if `compounds` are `:root > *[name=value]` for an indexed `name`
+    """
+    if len(compounds) != 2 or compounds[0].name != ROOT:
+        return None
+    compound = compounds[1]
+    if compound.name is not None or compound.combinator != ">":
+        return None
+    if len(compound.conditions) != 1:
+        return None
+    name, op, value = compound.conditions[0]
+    if name not in INDEXED_VALUES or op != "=":
+        return None
+    return name, value
+
+
+def _indexed(
+    conf, compounds
+):  # type: (ParsedConfig, Tuple[Compound]) -> Optional[list]
+    """
+    Top-level blocks of `conf` that can hold a match of `compounds`, or None if the
+    indexes cannot tell
+    """
+    if (
+        len(compounds) < 2
+        or compounds[0].name != ROOT
+        or compounds[1].combinator != ">"
+    ):
+        return None
+    found = None
+
+    def narrow(blocks):
+        nonlocal found
+        ids = {id(block): block for block in blocks}
+        found = ids if found is None else {k: v for k, v in found.items() if k in ids}
+
+    for condition in compounds[1].conditions:
+        if condition.name is not None:
+            narrow(
+                conf.servers_by_directive(
+                    condition.name, condition.value if condition.op == "=" else None
+                )
+            )
+
+    nested = compounds[2] if len(compounds) > 2 else None
+    if nested is not None and nested.combinator == ">":
+        value = next(
+            (
+                condition.value
+                for condition in nested.conditions
+                if condition.name is None
+                and condition.op == "="
+                and condition.value.split()
+            ),
+            None,
+        )
+        if value is not None:
+            blocks = [
+                block
+                for block, node in conf.locations(value.split()[0])
+                if nested.name in (None, node[0][0])
+            ]
+        elif nested.name is not None:
+            blocks = conf.servers_by_block(nested.name)
+        if nested.name is not None:
+            blocks = blocks + conf.servers_by_directive(nested.name, value)
+        if value is not None or nested.name is not None:
+            narrow(blocks)
+
+    return None if found is None else list(found.values())
+
+
+compile_selector = lru_cache(maxsize=512)(Selector)
+compile_selector.__doc__ = """
+`Selector(text)`, reused for the same `text`
+"""
+
+
+def select(
+    tree, selector
+):  # type: (list, Union[str, Selector]) -> Iterator[Tuple[tuple, list]]
+    """
+    `(path, node)` for every node of `tree` matching `selector`; see `Selector.select`
+    """
+    if not isinstance(selector, Selector):
+        selector = compile_selector(selector)
+    return selector.select(tree)
+
+
+def select_one(
+    tree, selector
+):  # type: (list, Union[str, Selector]) -> Optional[Tuple[tuple, list]]
+    """
+    The first `(path, node)` of `tree` matching `selector`, if any
+    """
+    return next(select(tree, selector), None)
+
+
+__all__ = [
+    "Compound",
+    "Condition",
+    "Selector",
+    "compile_selector",
+    "parse_selector",
+    "quote_value",
+    "select",
+    "select_one",
+]
@@ -0,0 +1,171 @@
+"""
+Finding block bodies repeated within a config or across many—every `location` made
+by `api_proxy_block`, say—and moving each into a shared snippet file that the blocks
+`include` instead.
+
+Subtrees are hashed bottom-up, each node once, so finding repeats costs time linear in
+the size of the configs. Only the outermost repeats are extracted: a repeated `server`
+body takes its `location`s along with it.
+"""
+
+from collections import Counter, OrderedDict, namedtuple
+from hashlib import sha256
+from typing import Dict, Iterator, List, Tuple
+
+from nginx_parse_emit.config import is_block
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.instrument import count, instrumented
+from nginx_parse_emit.persistent import assoc_in
+from nginx_parse_emit.utils import _copy_or_marshal
+
+Repeat = namedtuple("Repeat", ("digest", "body", "size", "occurrences"))
+Repeat.__doc__ = """
+A block body found more than once: `size` nodes, at `occurrences`, each a `(tree
+index, path)` with `path` the indices down to the block, e.g., `(3, 1, 5)` for the 6th
+node of the body of the 4th top-level block
+"""
+
+
+def _digests(tree, memo):  # type: (list, Dict[int, Tuple[bytes, int]]) -> None
+    """
+    Memoise, by identity, the structural hash and node count of `tree` and of every
+    block body in it
+    """
+    h = sha256(b"L")
+    size = 0
+    for node in tree:
+        count("nodes_visited")
+        size += 1
+        if is_block(node):
+            if id(node[1]) not in memo:
+                _digests(node[1], memo)
+            body_digest, body_size = memo[id(node[1])]
+            size += body_size
+            h.update(b"B")
+            h.update("\0".join(node[0]).encode("utf-8"))
+            h.update(b"\1")
+            h.update(body_digest)
+        else:
+            h.update(b"D")
+            h.update("\0".join(filter(None, node)).encode("utf-8"))
+            h.update(b"\1")
+    memo[id(tree)] = h.digest(), size
+
+
+def _bodies(tree):  # type: (list) -> Iterator[list]
+    for node in tree:
+        if is_block(node):
+            yield node[1]
+            for body in _bodies(node[1]):
+                yield body
+
+
+def _outermost(tree, digests, memo, path, found):
+    # Occurrences of `digests` not nested in another
+    for i, node in enumerate(tree):
+        if is_block(node):
+            digest = memo[id(node[1])][0]
+            if digest in digests:
+                found.setdefault(digest, []).append(path + (i,))
+            else:
+                _outermost(node[1], digests, memo, path + (i, 1), found)
+
+
+@instrumented
+def find_repeats(
+    trees, min_count=2, min_nodes=2
+):  # type: (list, int, int) -> List[Repeat]
+    """
+    Block bodies found at least `min_count` times across `trees`, outermost only
+
+    :param trees: Parsed trees, e.g., one per host
+    :type trees: ```List[list]```
+
+    :param min_count: Fewest occurrences worth sharing
+    :type min_count: ```int```
+
+    :param min_nodes: Fewest nodes, nested ones included, in a body worth sharing
+    :type min_nodes: ```int```
+
+    :return: Repeats, those saving the most nodes first
+    :rtype: ```List[Repeat]```
+    """
+    memo, bodies, counts = {}, {}, Counter()
+    for tree in trees:
+        _digests(tree, memo)
+        for body in _bodies(tree):
+            digest, size = memo[id(body)]
+            if size >= min_nodes:
+                bodies.setdefault(digest, body)
+                counts[digest] += 1
+
+    # Dropping a repeat found too few times outside others exposes what it contains
+    digests = {digest for digest, n in counts.items() if n >= min_count}
+    while True:
+        found = OrderedDict()
+        for t, tree in enumerate(trees):
+            _outermost(tree, digests, memo, (t,), found)
+        rare = {digest for digest, paths in found.items() if len(paths) < min_count}
+        if not rare:
+            break
+        digests -= rare
+
+    repeats = [
+        Repeat(
+            digest,
+            bodies[digest],
+            memo[id(bodies[digest])][1],
+            [(path[0], path[1:]) for path in paths],
+        )
+        for digest, paths in found.items()
+    ]
+    repeats.sort(key=lambda repeat: -(len(repeat.occurrences) - 1) * repeat.size)
+    return repeats
+
+
+def snippet_name(repeat, directory="snippets"):  # type: (Repeat, str) -> str
+    """
+    Path, relative to the nginx prefix, of the snippet file for `repeat`
+    """
+    return "{}/{}.conf".format(directory, repeat.digest.hex()[:16])
+
+
+@instrumented
+def extract_snippets(
+    trees, min_count=2, min_nodes=2, directory="snippets"
+):  # type: (list, int, int, str) -> (List[list], OrderedDict)
+    """
+    Replace every repeated block body with an `include` of a snippet file holding it
+
+    :param trees: Parsed trees, e.g., one per host; a `ParsedConfig` is edited in place
+    :type trees: ```List[list]```
+
+    :param min_count: Fewest occurrences worth sharing
+    :type min_count: ```int```
+
+    :param min_nodes: Fewest nodes, nested ones included, in a body worth sharing
+    :type min_nodes: ```int```
+
+    :param directory: Where the snippets go, relative to the nginx prefix
+    :type directory: ```str```
+
+    :return: The trees with `include`s, path-copied, and the text of each snippet by
+      its path
+    :rtype: ```(List[list], OrderedDict)```
+    """
+    trees = list(trees)
+    repeats = find_repeats(trees, min_count, min_nodes)
+    edited = list(map(_copy_or_marshal, trees))
+    snippets = OrderedDict()
+    for repeat in repeats:
+        name = snippet_name(repeat, directory)
+        snippets[name] = "".join(iter_dumps(repeat.body)) + "\n"
+        for t, path in repeat.occurrences:
+            conf = edited[t]
+            conf[path[0]] = assoc_in(
+                conf[path[0]], path[1:] + (1,), [["include", name]]
+            )
+    return edited, snippets
+
+
+__all__ = ["Repeat", "extract_snippets", "find_repeats", "snippet_name"]
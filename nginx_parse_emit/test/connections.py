@@ -0,0 +1,122 @@
+"""
+Stand-ins for the connections the remote helpers take, shared by the tests
+"""
+
+import asyncio
+from collections import Counter, namedtuple
+from functools import partial
+from hashlib import sha256
+from subprocess import PIPE, Popen
+from threading import Lock
+from time import sleep
+from typing import Optional
+
+Result = namedtuple("Result", ("stdout", "exit_status"))
+
+
+class FakeConnection(object):
+    """
+    Stands in for `fabric2.Connection`, with remote files kept in a dict. Counts its
+    calls, and the most `get`s in flight at once per `group`.
+    """
+
+    active = Counter()
+    peak = Counter()
+    lock = Lock()
+
+    def __init__(
+        self, files, host="localhost", group=None, fail=False, delay=0
+    ):  # type: (dict, str, Optional[str], bool, float) -> None
+        self.files = files
+        self.host = host
+        self.group = group
+        self.fail = fail
+        self.delay = delay
+        self.calls = Counter()
+
+    def run(self, command, **kwargs):
+        self.calls["run"] += 1
+        program, remote = command.split()
+        assert program == "sha256sum"
+        digest = sha256(self.files[remote].encode("utf-8")).hexdigest()
+        return Result("{}  {}\n".format(digest, remote), 0)
+
+    def get(self, remote, local, **kwargs):
+        self.calls["get"] += 1
+        with self.lock:
+            self.active[self.group] += 1
+            self.peak[self.group] = max(self.peak[self.group], self.active[self.group])
+        try:
+            sleep(self.delay)
+            if self.fail:
+                raise IOError("{} is unreachable".format(self.host))
+            content = self.files[remote]
+            if hasattr(local, "write"):
+                local.write(content.encode("utf-8"))
+            else:
+                with open(local, "wt") as f:
+                    f.write(content)
+        finally:
+            with self.lock:
+                self.active[self.group] -= 1
+
+    def put(self, local, remote):
+        # Read in chunks from the start, then put back, the way paramiko does
+        self.calls["put"] += 1
+        pointer = local.tell()
+        local.seek(0)
+        chunks = []
+        for chunk in iter(partial(local.read, 32768), b""):
+            chunks.append(chunk)
+        local.seek(pointer)
+        self.files[remote] = b"".join(chunks).decode("utf-8")
+        return remote
+
+
+class FakeAsyncConnection(object):
+    """
+    Async connection keeping remote files in a dict, counting hosts in flight
+    """
+
+    in_flight = peak = 0
+
+    def __init__(self, host, files):
+        self.host = host
+        self.files = files
+
+    async def run(self, command):
+        remote = command.split()[-1]
+        return Result("", 0 if remote in self.files else 1)
+
+    async def get(self, remote, local):
+        cls = type(self)
+        cls.in_flight += 1
+        cls.peak = max(cls.peak, cls.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            local.write(self.files[remote].encode("utf-8"))
+        finally:
+            cls.in_flight -= 1
+
+    async def put(self, local, remote):
+        self.files[remote] = local.read().decode("utf-8")
+        return remote
+
+
+class LocalConnection(object):
+    """
+    Stands in for `fabric2.Connection`, running commands in a local shell
+    """
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def run(self, command, hide=False, in_stream=None):
+        self.commands["run"] += 1
+        process = Popen(["sh", "-c", command], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = process.communicate(
+            None if in_stream is None else in_stream.read().encode("utf-8")
+        )
+        if process.returncode:
+            raise IOError(stderr.decode("utf-8"))
+        return Result(stdout.decode("utf-8"), process.returncode)
@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.aio import fetch_all, get_parsed_remote_conf, rollout
+from nginx_parse_emit.emit import upsert_ssl_cert_to_443_block
+from nginx_parse_emit.fleet import FAILED, OK, UNCHANGED
+from nginx_parse_emit.parser import set_parser_backend
+from nginx_parse_emit.test.connections import FakeAsyncConnection
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestAio(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        FakeAsyncConnection.peak = 0
+        self.conf_name = "/etc/nginx/sites-enabled/default.conf"
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.source = f.read()
+        self.connections = [
+            FakeAsyncConnection("edge{}".format(i), {self.conf_name: self.source})
+            for i in range(10)
+        ]
+        self.new_conf = partial(
+            upsert_ssl_cert_to_443_block,
+            server_name="offscale.io",
+            ssl_certificate="fullchain.pem",
+            ssl_certificate_key="privkey.pem",
+        )
+
+    def tearDown(self):
+        set_parser_backend("nginxparser_eb")
+
+    def rollout(self, **kwargs):
+        return asyncio.run(
+            rollout(self.connections, self.new_conf, executor=self.executor, **kwargs)
+        )
+
+    def test_rollout(self):
+        results = self.rollout(limit=3)
+        self.assertEqual([r.status for r in results], [OK] * 10)
+        self.assertEqual(FakeAsyncConnection.peak, 3)
+        self.assertEqual(
+            loads(self.connections[0].files[self.conf_name]),
+            self.new_conf(loads(self.source)),
+        )
+        self.assertEqual({r.status for r in self.rollout()}, {UNCHANGED})
+
+    def test_fetch_with_fast_parser_and_failures(self):
+        set_parser_backend("fast")
+        self.connections[3].files = {}
+        results = asyncio.run(
+            fetch_all(
+                self.connections,
+                "/etc/nginx/sites-enabled/default",
+                limit=4,
+                executor=self.executor,
+            )
+        )
+        self.assertEqual(results[0].result, loads(self.source))
+        self.assertEqual([r.status for r in results], [OK] * 3 + [FAILED] + [OK] * 6)
+        self.assertIsInstance(results[3].error, KeyError)
+        self.assertEqual(
+            asyncio.run(
+                get_parsed_remote_conf(
+                    self.connections[0], self.conf_name, self.executor
+                )
+            ),
+            results[0].result,
+        )
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,117 @@
+from functools import partial
+from os import listdir, path, remove, stat, utime
+from shutil import rmtree
+from tempfile import mkdtemp, mkstemp
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginx_parse_emit.cache import (
+    CacheInfo,
+    DiskParseCache,
+    ParseCache,
+    set_parse_cache,
+)
+from nginx_parse_emit.emit import server_block, upsert_ssl_cert_to_443_block
+from nginx_parse_emit.utils import ensure_nginxparser_instance
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestParseCache(TestCase):
+    def setUp(self):
+        self.two_roots = configs_dir("two_roots.conf")
+        self.cache = ParseCache(maxsize=2)
+
+    def tearDown(self):
+        set_parse_cache(None)
+
+    def test_hits_misses_eviction(self):
+        first = ensure_nginxparser_instance(self.two_roots, cache=self.cache)
+        second = ensure_nginxparser_instance(self.two_roots, cache=self.cache)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(self.cache.info(), CacheInfo(1, 1, 2, 1))
+
+        for server_name in "a.io", "b.io":
+            ensure_nginxparser_instance(
+                server_block(server_name=server_name, listen="80"), cache=self.cache
+            )
+        self.assertEqual(self.cache.info(), CacheInfo(1, 3, 2, 2))
+        ensure_nginxparser_instance(self.two_roots, cache=self.cache)
+        self.assertEqual(self.cache.info().misses, 4)
+
+    def test_entries_not_corrupted(self):
+        set_parse_cache(self.cache)
+        pristine = ensure_nginxparser_instance(self.two_roots)
+        upsert_ssl_cert_to_443_block(
+            self.two_roots, "offscale.io", "fullchain.pem", "privkey.pem"
+        )
+        self.assertEqual(pristine, ensure_nginxparser_instance(self.two_roots))
+
+        # Nor by editing nested nodes in place
+        tree = ensure_nginxparser_instance(self.two_roots)
+        tree[0][1].append(["listen", "8080"])
+        tree[1][1][0][1] = "example.com"
+        self.assertEqual(pristine, ensure_nginxparser_instance(self.two_roots))
+        self.assertEqual(self.cache.info().misses, 1)
+
+    def test_file_rewrite_is_a_miss(self):
+        temp_file = mkstemp(suffix=".conf")[1]
+        try:
+            for listen in "80", "8080":
+                with open(temp_file, "wt") as f:
+                    f.write(server_block(server_name="a.io", listen=listen))
+                self.assertEqual(
+                    ensure_nginxparser_instance(temp_file, cache=self.cache)[0][1][2],
+                    ["listen", listen],
+                )
+            self.assertEqual(self.cache.info().misses, 2)
+
+            # Same size and mtime, as `cp -p` leaves it, from another process
+            directory = mkdtemp()
+            try:
+                st = stat(temp_file)
+                for listen in "81", "82":
+                    with open(temp_file, "wt") as f:
+                        f.write(server_block(server_name="a.io", listen=listen))
+                    utime(temp_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+                    tree = ensure_nginxparser_instance(
+                        temp_file, cache=DiskParseCache(directory)
+                    )
+                    self.assertEqual(tree[0][1][2], ["listen", listen])
+            finally:
+                rmtree(directory)
+        finally:
+            remove(temp_file)
+
+    def test_disk_cache(self):
+        directory = mkdtemp()
+        try:
+            parsed = ensure_nginxparser_instance(
+                self.two_roots, cache=DiskParseCache(directory)
+            )
+            self.assertEqual(len(listdir(directory)), 1)
+
+            # As a fresh process would see it
+            disk = DiskParseCache(directory)
+            memory = ParseCache(parent=disk)
+            for _ in range(2):
+                self.assertEqual(
+                    parsed, ensure_nginxparser_instance(self.two_roots, cache=memory)
+                )
+            self.assertEqual(disk.info(), CacheInfo(1, 0, None, 1))
+            self.assertEqual(memory.info(), CacheInfo(1, 1, 128, 1))
+
+            upgraded = DiskParseCache(directory, version="next")
+            ensure_nginxparser_instance(self.two_roots, cache=upgraded)
+            self.assertEqual(upgraded.info(), CacheInfo(0, 1, None, 2))
+            upgraded.clear()
+            self.assertEqual(listdir(directory), [])
+        finally:
+            rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest_main()
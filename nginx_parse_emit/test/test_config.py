@@ -0,0 +1,89 @@
+from copy import deepcopy
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.emit import (
+    api_proxy_block,
+    redirect_block,
+    server_block,
+    upsert_redirect_to_443_block,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.utils import remove_by_location
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestParsedConfig(TestCase):
+    def setUp(self):
+        self.server_name = "offscale.io"
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.two_roots = loads(f.read())
+        self.many = loads(
+            "\n".join(
+                server_block(
+                    server_name="s{}.io".format(i), listen="443" if i % 2 else "80"
+                )
+                for i in range(10)
+            )
+        )
+
+    def test_indexes(self):
+        conf = ParsedConfig(self.two_roots)
+        self.assertEqual(conf, self.two_roots)
+        self.assertEqual(conf.servers_by_name(self.server_name), self.two_roots)
+        self.assertEqual(conf.servers_by_listen("443"), [self.two_roots[1]])
+        self.assertEqual(
+            conf.locations("/api0"), [(self.two_roots[1], self.two_roots[1][1][-1])]
+        )
+        self.assertEqual(conf.servers_by_name("nope"), [])
+
+    def test_top_level_edits_keep_indexes(self):
+        conf = ParsedConfig(self.many)
+        conf.insert(
+            0, loads(redirect_block(server_name="s3.io", port="80", redirect_to="x"))[0]
+        )
+        self.assertEqual(conf.position(conf.servers_by_name("s3.io")[0]), 0)
+        self.assertEqual(len(conf.servers_by_name("s3.io")), 2)
+        del conf[0]
+        self.assertEqual(len(conf.servers_by_name("s3.io")), 1)
+        conf.append(loads(api_proxy_block("/api0", "http://localhost"))[0])
+        self.assertEqual(len(conf.servers_by_listen("443")), 5)
+        block = conf.servers_by_name("s1.io")[0]
+        block[1].append(["listen", "8080"])
+        conf.touch(block)
+        self.assertEqual(conf.servers_by_listen("8080"), [block])
+
+    def test_helpers_match_plain_lists(self):
+        tree = self.many + self.two_roots
+        for server_name in "s1.io", "s2.io", self.server_name:
+            expected = upsert_ssl_cert_to_443_block(
+                upsert_redirect_to_443_block(deepcopy(tree), server_name),
+                server_name,
+                "fullchain.pem",
+                "privkey.pem",
+            )
+            conf = upsert_ssl_cert_to_443_block(
+                upsert_redirect_to_443_block(ParsedConfig(deepcopy(tree)), server_name),
+                server_name,
+                "fullchain.pem",
+                "privkey.pem",
+            )
+            self.assertIsInstance(conf, ParsedConfig)
+            self.assertEqual(expected, conf)
+            self.assertEqual(
+                remove_by_location(expected, "/api0"),
+                remove_by_location(conf, "/api0"),
+            )
+            self.assertEqual(conf.locations("/api0"), [])
+
+
+if __name__ == "__main__":
+    unittest_main()
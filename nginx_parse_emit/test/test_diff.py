@@ -0,0 +1,123 @@
+from copy import deepcopy
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginx_parse_emit.diff import (
+    AddBlock,
+    AddDirective,
+    RemoveBlock,
+    RemoveDirective,
+    SetDirective,
+    diff,
+    patch,
+)
+from nginx_parse_emit.emit import api_proxy_block_tree, upsert_ssl_cert_to_443_block
+from nginx_parse_emit.lazy import LazyConfig
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.utils import remove_by_location
+
+SOURCE = """server {
+    server_name a.io;
+    listen 443;
+    # Comments are ignored
+    location / {
+        root /var/www;
+    }
+    location /old {
+        return 404;
+    }
+}
+server {
+    server_name b.io;
+    listen 80;
+    add_header X-A 1;
+    add_header X-B 2;
+}
+"""
+
+A = ("server", ("a.io",), ("443",))
+B = ("server", ("b.io",), ("80",))
+
+
+class TestDiff(TestCase):
+    def setUp(self):
+        self.old = loads(SOURCE)
+        self.original = deepcopy(self.old)
+
+    def test_no_change(self):
+        self.assertEqual(diff(self.old, self.old), [])
+        self.assertEqual(diff(self.old, loads(SOURCE.replace("Comments", "C"))), [])
+
+    def test_edit_helpers(self):
+        new = upsert_ssl_cert_to_443_block(self.old, "a.io", "a.pem", "a.key")
+        new = remove_by_location(new, "/old")
+        self.assertEqual(
+            diff(self.old, new),
+            [
+                SetDirective((A,), "listen", "443", "443 ssl"),
+                AddDirective((A,), "ssl_certificate", "a.pem"),
+                AddDirective((A,), "ssl_certificate_key", "a.key"),
+                RemoveBlock((A,), [["location", "/old"], [["return", "404"]]]),
+            ],
+        )
+        self.assertEqual(diff(patch(self.old, diff(self.old, new)), new), [])
+        self.assertEqual(self.old, self.original)
+
+    def test_nested_and_repeated(self):
+        new = deepcopy(self.old)
+        new[0][1][3][1].append(["index", "index.html"])
+        new[1][1][2:4] = [["add_header", "X-B 2"], ["add_header", "X-C 3"]]
+        new[1][1] += api_proxy_block_tree("/api", "http://127.0.0.1:5000")
+        ops = diff(self.old, new)
+        self.assertEqual(
+            ops,
+            [
+                AddDirective((A, ("location", "/")), "index", "index.html"),
+                RemoveDirective((B,), "add_header", "X-A 1"),
+                AddDirective((B,), "add_header", "X-C 3"),
+                AddBlock(
+                    (B,), api_proxy_block_tree("/api", "http://127.0.0.1:5000")[0]
+                ),
+            ],
+        )
+        self.assertEqual(patch(self.old, ops), new)
+
+    def test_patch_other_host(self):
+        new = upsert_ssl_cert_to_443_block(self.old, "a.io", "a.pem", "a.key")
+        other = loads(SOURCE.replace("listen 80", "listen 8080"))
+        other[0][1].insert(2, ["ssl_protocols", "TLSv1.2"])
+        patched = patch(
+            other, diff(self.old, new) + [SetDirective((B,), "gzip", None, "on")]
+        )
+        self.assertEqual(
+            patched[0][1][:6],
+            [
+                ["server_name", "a.io"],
+                ["listen", "443 ssl"],
+                ["ssl_protocols", "TLSv1.2"],
+                ["# Comments are ignored", "\n"],
+                ["ssl_certificate", "a.pem"],
+                ["ssl_certificate_key", "a.key"],
+            ],
+        )
+        # b.io is found by its `server_name` though it listens elsewhere
+        self.assertIn(["gzip", "on"], patched[1][1])
+        self.assertIs(patched[1][0], other[1][0])
+        # Removing what is not there does nothing; adding to it fails
+        self.assertEqual(
+            patch(other, [RemoveBlock(((("http",),)), [["x"], []])]), other
+        )
+        with self.assertRaises(ValueError):
+            patch(other, [AddDirective((("http",),), "gzip", "on")])
+
+    def test_lazy_parses_only_what_differs(self):
+        lazy = LazyConfig(SOURCE)
+        new = list.__getitem__(lazy, slice(None))
+        new[1] = loads(SOURCE)[1]
+        new[1][1].append(["gzip", "on"])
+        self.assertEqual(diff(lazy, new), [AddDirective((B,), "gzip", "on")])
+        self.assertEqual(lazy.parsed(), 1)
+
+
+if __name__ == "__main__":
+    unittest_main()
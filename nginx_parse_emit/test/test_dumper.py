@@ -0,0 +1,147 @@
+from functools import partial
+from io import StringIO
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import dumps, loads
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.dumper import DumpReader, dump_to, iter_dumps
+from nginx_parse_emit.emit import (
+    api_proxy_block,
+    autoindex_block_tree,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.remote import NO_CHANGE, upsert_upload
+from nginx_parse_emit.test.connections import FakeConnection
+from nginx_parse_emit.utils import _emits_source, merge_into, remove_by_location
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestDumper(TestCase):
+    def setUp(self):
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.two_roots = loads(f.read())
+        self.children = (
+            loads(api_proxy_block("/api1", "http://127.0.0.1:5001")),
+            autoindex_block_tree("/static", "/var/www/static"),
+        )
+        self.tree = merge_into("offscale.io", self.two_roots, *self.children)
+        self.conf_name = "/etc/nginx/sites-enabled/default.conf"
+
+    def connection(self):
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            return FakeConnection({self.conf_name: f.read()})
+
+    def test_iter_dumps(self):
+        for tree in self.two_roots, self.tree:
+            for chunk_size in 0, 7, 1 << 16:
+                self.assertEqual("".join(iter_dumps(tree, chunk_size)), dumps(tree))
+        chunks = list(iter_dumps(self.tree, 256))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(256 <= len(chunk) < 512 for chunk in chunks[:-1]))
+
+        sio = StringIO()
+        dump_to(self.tree, sio, chunk_size=100)
+        self.assertEqual(sio.getvalue(), dumps(self.tree))
+
+    def test_dump_reader(self):
+        reader = DumpReader(self.tree, chunk_size=10)
+        self.assertEqual(reader.read(5), b"serve")
+        self.assertEqual(reader.tell(), 5)
+        self.assertRaises(IOError, reader.seek, 2)
+        reader.seek(0)
+        self.assertEqual(reader.read().decode("utf-8"), dumps(self.tree))
+
+    def test_upsert_upload_streams(self):
+        c = self.connection()
+        upsert_upload(
+            c,
+            lambda conf: merge_into("offscale.io", conf, *self.children),
+            name="default.conf",
+        )
+        # Only the server that changed is rendered anew
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            source = f.read()
+        second = source.index("\nserver {") + 1
+        self.assertEqual(c.calls["put"], 1)
+        self.assertEqual(
+            c.files[self.conf_name],
+            source[:second] + dumps(self.tree[1:]) + source[source.rindex("}") + 1 :],
+        )
+
+    def test_upsert_upload_in_place(self):
+        def add_root(conf):
+            conf[-1][1].append(["root", "/var/www"])
+            return conf
+
+        c = self.connection()
+        self.assertNotEqual(upsert_upload(c, add_root, name="default.conf"), NO_CHANGE)
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.assertEqual(loads(c.files[self.conf_name]), add_root(loads(f.read())))
+
+        c = self.connection()
+        self.assertEqual(
+            upsert_upload(c, lambda conf: conf, name="default.conf"), NO_CHANGE
+        )
+        self.assertEqual(c.calls["put"], 0)
+
+    def test_incremental_reemit(self):
+        blocks = [
+            "server {\n  server_name a.io;   listen 80;\n}",
+            "server{server_name b.io;listen 443;location /x{return 204;}}",
+            "server {\n\tserver_name c.io; listen 80;  # plain\n}",
+        ]
+        source = "# fleet\n\n{}\n\n# b\n{}\n{}\n".format(*blocks)
+        conf = ParsedConfig.from_source(source)
+        self.assertEqual("".join(iter_dumps(conf)), source)
+
+        edited = upsert_ssl_cert_to_443_block(
+            conf, "b.io", "fullchain.pem", "privkey.pem"
+        )
+        self.assertIs(edited, conf)
+        self.assertEqual(
+            "".join(iter_dumps(conf, 0)),
+            source.replace(blocks[1], dumps([conf[3]])),
+        )
+
+        conf.touch(conf[1])
+        text = "".join(iter_dumps(remove_by_location(conf, "/x")))
+        self.assertEqual(
+            text,
+            source.replace(blocks[0], dumps(conf[1:2])).replace(
+                blocks[1], dumps(conf[3:4])
+            ),
+        )
+        conf.insert(0, conf.pop())
+        self.assertEqual(
+            "".join(iter_dumps(conf)),
+            "\n".join((blocks[2], text[: text.index(blocks[2]) - 1])),
+        )
+        self.assertEqual(conf.locations("/x"), [])
+
+    def test_reemit_after_in_place_edit(self):
+        blocks = [
+            "server {\n  server_name a.io;   listen 80;\n}",
+            "server{server_name b.io;listen 443;location /x{return 204;}}",
+        ]
+        source = "{}\n\n{}\n".format(*blocks)
+        conf = ParsedConfig.from_source(source)
+        conf[0][1].append(["root", "/var/www"])
+        conf[1][1][2][1][0][1] = "404"
+        self.assertEqual(
+            "".join(iter_dumps(conf)),
+            source.replace(blocks[0], dumps(conf[:1])).replace(
+                blocks[1], dumps(conf[1:])
+            ),
+        )
+        self.assertFalse(_emits_source(conf, source))
+        self.assertTrue(_emits_source(ParsedConfig.from_source(source), source))
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,114 @@
+from collections import Counter
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import dumps, loads
+
+from nginx_parse_emit.emit import upsert_ssl_cert_to_443_block
+from nginx_parse_emit.fleet import (
+    FAILED,
+    OK,
+    SKIPPED,
+    UNCHANGED,
+    fetch_all,
+    rollout,
+    run,
+)
+from nginx_parse_emit.test.connections import FakeConnection
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestFleet(TestCase):
+    def setUp(self):
+        FakeConnection.peak.clear()
+        self.conf_name = "/etc/nginx/sites-enabled/default.conf"
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.source = f.read()
+        self.connections = [
+            FakeConnection(
+                {self.conf_name: self.source},
+                "edge{}".format(i),
+                "dc{}".format(i % 3),
+                delay=0.01,
+            )
+            for i in range(12)
+        ]
+        self.new_conf = partial(
+            upsert_ssl_cert_to_443_block,
+            server_name="offscale.io",
+            ssl_certificate="fullchain.pem",
+            ssl_certificate_key="privkey.pem",
+        )
+
+    def test_rollout(self):
+        results = rollout(
+            self.connections,
+            self.new_conf,
+            name="default.conf",
+            max_workers=6,
+            per_group=1,
+            group_of=lambda c: c.group,
+        )
+        self.assertEqual([r.host for r in results], [c.host for c in self.connections])
+        self.assertEqual({r.status for r in results}, {OK})
+        self.assertTrue(all(r.seconds > 0 for r in results))
+        self.assertEqual(set(FakeConnection.peak.values()), {1})
+
+        expected = self.new_conf(loads(self.source))
+        for result in fetch_all(self.connections, self.conf_name):
+            self.assertEqual(result.result, expected)
+
+    def test_canary_failure_skips_the_rest(self):
+        self.connections[1].fail = True
+        results = rollout(
+            self.connections, self.new_conf, name="default.conf", canary=2
+        )
+        self.assertEqual([r.status for r in results], [OK, FAILED] + [SKIPPED] * 10)
+        self.assertIsInstance(results[1].error, IOError)
+        self.assertEqual(self.connections[2].files[self.conf_name], self.source)
+
+    def test_failures_after_canary_are_per_host(self):
+        self.connections[5].fail = True
+        results = run(self.connections, lambda c: c.host, canary=2, max_workers=3)
+        self.assertEqual([r.status for r in results].count(OK), 12)
+        results = rollout(
+            self.connections, self.new_conf, name="default.conf", canary=2
+        )
+        self.assertEqual([r.status for r in results].count(FAILED), 1)
+        self.assertEqual(results[5].status, FAILED)
+
+    def test_unchanged_hosts_are_not_uploaded(self):
+        remote_cache = {}
+        for status in OK, UNCHANGED:
+            results = rollout(
+                self.connections,
+                self.new_conf,
+                name="default.conf",
+                remote_cache=remote_cache,
+                canary=1,
+            )
+            self.assertEqual({r.status for r in results}, {status})
+        self.assertEqual(
+            self.connections[0].calls, Counter({"run": 2, "get": 1, "put": 1})
+        )
+        # Only the canary downloaded; the others had its conf and it the upload
+        self.assertEqual(sum(c.calls["get"] for c in self.connections), 1)
+        self.assertEqual(len(remote_cache), 2)
+
+        results = rollout(self.connections, lambda conf: conf, name="default.conf")
+        self.assertEqual({r.status for r in results}, {UNCHANGED})
+        # A fresh tree rendering the same text is no change either
+        for c in self.connections:
+            c.files[self.conf_name] = dumps(loads(c.files[self.conf_name]))
+        results = rollout(self.connections, list, name="default.conf")
+        self.assertEqual({r.status for r in results}, {UNCHANGED})
+        self.assertEqual(self.connections[0].calls["put"], 1)
+
+
+if __name__ == "__main__":
+    unittest_main()
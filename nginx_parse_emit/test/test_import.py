@@ -0,0 +1,54 @@
+from subprocess import check_output
+from sys import executable
+from unittest import TestCase
+from unittest import main as unittest_main
+
+
+def run_python(source):  # type: (str) -> str
+    return check_output([executable, "-c", source]).decode("utf-8").strip()
+
+
+class TestImport(TestCase):
+    def test_parse_emit_imports_nothing_remote(self):
+        self.assertEqual(
+            run_python(
+                "import logging, sys\n"
+                "import nginx_parse_emit.emit, nginx_parse_emit.utils\n"
+                "print(sorted(m for m in ('fabric2', 'paramiko', 'patchwork', 'yaml')"
+                " if m in sys.modules), logging.getLogger().handlers)"
+            ),
+            "[] []",
+        )
+
+    def test_fleet_and_aio_import_no_ssh(self):
+        self.assertEqual(
+            run_python(
+                "import sys\n"
+                "import nginx_parse_emit.aio, nginx_parse_emit.fleet\n"
+                "print(sorted(m for m in ('fabric2', 'paramiko', 'patchwork')"
+                " if m in sys.modules))"
+            ),
+            "[]",
+        )
+
+    def test_remote_helpers_still_importable_from_utils(self):
+        from nginx_parse_emit import remote, utils
+
+        self.assertIs(utils.upsert_upload, remote.upsert_upload)
+        self.assertEqual(utils.NO_CHANGE, remote.NO_CHANGE)
+        with self.assertRaises(AttributeError):
+            utils.no_such_helper
+
+    def test_root_logger_configures_logging(self):
+        self.assertEqual(
+            run_python(
+                "import sys, nginx_parse_emit\n"
+                "nginx_parse_emit.root_logger\n"
+                "print('yaml' in sys.modules)"
+            ),
+            "True",
+        )
+
+
+if __name__ == "__main__":
+    unittest_main()
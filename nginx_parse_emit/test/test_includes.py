@@ -0,0 +1,135 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import makedirs, path
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.emit import upsert_ssl_cert_to_443_block
+from nginx_parse_emit.includes import load_includes
+from nginx_parse_emit.utils import OTemplate
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestIncludes(TestCase):
+    def setUp(self):
+        self.prefix = mkdtemp()
+        for directory in "conf.d", "sites-enabled":
+            makedirs(path.join(self.prefix, directory))
+        with open(configs_dir("nginx.conf"), "rt") as f:
+            nginx = OTemplate(f.read())
+        with open(path.join(self.prefix, "nginx.conf"), "wt") as f:
+            f.write(
+                nginx.substitute(
+                    SERVER_BLOCK="include conf.d/*.conf;\n    include sites-enabled/*;"
+                )
+            )
+        with open(path.join(self.prefix, "conf.d", "gzip.conf"), "wt") as f:
+            f.write("gzip on;\ninclude snippets/types.conf;\n")
+        makedirs(path.join(self.prefix, "snippets"))
+        with open(path.join(self.prefix, "snippets", "types.conf"), "wt") as f:
+            f.write("default_type application/octet-stream;\n")
+        for name in "two_roots.conf", "one_root.conf":
+            copyfile(configs_dir(name), path.join(self.prefix, "sites-enabled", name))
+        self.executor = ProcessPoolExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        rmtree(self.prefix)
+
+    def test_load_includes(self):
+        include_tree = load_includes(
+            path.join(self.prefix, "nginx.conf"), executor=self.executor
+        )
+        self.assertEqual(
+            list(map(partial(path.relpath, start=self.prefix), include_tree.files)),
+            [
+                "nginx.conf",
+                "conf.d/gzip.conf",
+                "sites-enabled/one_root.conf",
+                "sites-enabled/two_roots.conf",
+                "snippets/types.conf",
+            ],
+        )
+        sites = [
+            loads(open(path.join(self.prefix, "sites-enabled", name)).read())
+            for name in ("one_root.conf", "two_roots.conf")
+        ]
+        tree = include_tree.tree
+        self.assertEqual(
+            tree[1],
+            [
+                ["http"],
+                [
+                    ["gzip", "on"],
+                    ["default_type", "application/octet-stream"],
+                ]
+                + sites[0]
+                + sites[1],
+            ],
+        )
+        self.assertEqual(include_tree.changed(), [])
+
+        # Edits to a node found in the combined tree go to the file it came from
+        server = tree[1][1][-1]
+        two_roots = path.join(self.prefix, "sites-enabled", "two_roots.conf")
+        self.assertEqual(include_tree.file_of(server), two_roots)
+        self.assertEqual(include_tree.file_of(server[1][0]), two_roots)
+        self.assertEqual(
+            include_tree.file_of(tree[0]), path.join(self.prefix, "nginx.conf")
+        )
+        upsert_ssl_cert_to_443_block(
+            include_tree.files[two_roots],
+            "offscale.io",
+            "fullchain.pem",
+            "privkey.pem",
+        )
+        self.assertEqual(include_tree.write(), [two_roots])
+        self.assertEqual(include_tree.changed(), [])
+        with open(two_roots, "rt") as f:
+            self.assertEqual(loads(f.read()), include_tree.files[two_roots])
+        self.assertEqual(
+            include_tree.tree[1][1][-len(include_tree.files[two_roots]) :],
+            include_tree.files[two_roots],
+        )
+
+        # As are edits made in place
+        gzip = path.join(self.prefix, "conf.d", "gzip.conf")
+        include_tree.files[gzip][0][1] = "off"
+        self.assertEqual(include_tree.changed(), [gzip])
+        self.assertEqual(include_tree.write(), [gzip])
+        with open(gzip, "rt") as f:
+            self.assertEqual(f.read(), "gzip off;\ninclude snippets/types.conf;\n")
+
+    def test_errors(self):
+        with open(path.join(self.prefix, "conf.d", "loop.conf"), "wt") as f:
+            f.write("include conf.d/loop.conf;\n")
+        include_tree = load_includes(
+            path.join(self.prefix, "nginx.conf"), executor=self.executor
+        )
+        self.assertRaises(ValueError, lambda: include_tree.tree)
+
+        with open(path.join(self.prefix, "conf.d", "loop.conf"), "wt") as f:
+            f.write("include missing.conf;\n")
+        self.assertRaises(
+            IOError,
+            load_includes,
+            path.join(self.prefix, "nginx.conf"),
+            executor=self.executor,
+        )
+
+        with open(path.join(self.prefix, "conf.d", "loop.conf"), "wt") as f:
+            f.write("server {\n")
+        with self.assertRaises(ValueError) as cm:
+            load_includes(path.join(self.prefix, "nginx.conf"), executor=self.executor)
+        self.assertIn("loop.conf", str(cm.exception))
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,102 @@
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginx_parse_emit.cache import ParseCache
+from nginx_parse_emit.emit import api_proxy_block, upsert_ssl_cert_to_443_block
+from nginx_parse_emit.instrument import LoggingSink, set_sink
+from nginx_parse_emit.remote import upsert_upload
+from nginx_parse_emit.test.connections import FakeConnection
+from nginx_parse_emit.utils import ensure_nginxparser_instance, merge_into
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class ListSink(object):
+    def __init__(self):
+        self.spans = []
+
+    def span(self, name, seconds, counters):
+        self.spans.append((name, counters))
+
+
+class TestInstrument(TestCase):
+    def setUp(self):
+        self.sink = ListSink()
+        self.previous = set_sink(self.sink)
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.source = f.read()
+
+    def tearDown(self):
+        set_sink(self.previous)
+
+    def test_spans(self):
+        conf_name = "/etc/nginx/sites-enabled/default.conf"
+        c = FakeConnection({conf_name: self.source})
+        upsert_upload(
+            c,
+            lambda conf: upsert_ssl_cert_to_443_block(
+                conf, "offscale.io", "fullchain.pem", "privkey.pem"
+            ),
+            name="default.conf",
+        )
+        names = [name for name, _ in self.sink.spans]
+        self.assertEqual(
+            names,
+            [
+                "remote.get",
+                "utils.ensure_nginxparser_instance",
+                "emit.upsert_ssl_cert_to_443_block",
+                "remote.put",
+                "remote.upsert_upload",
+            ],
+        )
+        # Nested spans' counters add up in the outer one
+        counters = self.sink.spans[-1][1]
+        self.assertEqual(counters["bytes_downloaded"], len(self.source))
+        self.assertGreater(counters["bytes_parsed"], 0)
+        self.assertEqual(
+            self.sink.spans[-2],
+            (
+                "remote.put",
+                {"bytes_emitted": len(c.files[conf_name])},
+            ),
+        )
+        # Rendered for the no-change check too
+        self.assertGreater(
+            counters["bytes_emitted"], self.sink.spans[-2][1]["bytes_emitted"]
+        )
+
+        del self.sink.spans[:]
+        tree = ensure_nginxparser_instance(self.source, cache=ParseCache())
+        merge_into("offscale.io", tree, api_proxy_block("/api1", "http://a"))
+        self.assertEqual(
+            self.sink.spans[0],
+            (
+                "utils.ensure_nginxparser_instance",
+                {"cache_misses": 1, "bytes_parsed": len(self.source)},
+            ),
+        )
+        self.assertEqual(self.sink.spans[-1][0], "utils.merge_into")
+        self.assertGreater(self.sink.spans[-1][1]["nodes_visited"], 0)
+
+    def test_logging_sink_and_disabled(self):
+        set_sink(LoggingSink())
+        with self.assertLogs("nginx_parse_emit.instrument", "DEBUG") as cm:
+            ensure_nginxparser_instance(self.source)
+        (record,) = cm.records
+        self.assertEqual(record.span, "utils.ensure_nginxparser_instance")
+        self.assertEqual(record.counters, {"bytes_parsed": len(self.source)})
+        self.assertIn("bytes_parsed={}".format(len(self.source)), record.getMessage())
+
+        set_sink(None)
+        ensure_nginxparser_instance(self.source)
+        self.assertEqual(self.sink.spans, [])
+        self.assertEqual(merge_into.__name__, "merge_into")
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,98 @@
+from os import remove
+from tempfile import mkstemp
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.emit import api_proxy_block, upsert_ssl_cert_to_443_block
+from nginx_parse_emit.lazy import LazyConfig
+from nginx_parse_emit.utils import merge_into, upsert_by_location
+
+
+def server(i):  # type: (int) -> str
+    return (
+        "server {{\n"
+        "    # s{i}.io—café\n"
+        "    server_name s{i}.io;\n"
+        "    listen {port};\n"
+        "    location /{i} {{ return 204; }}\n"
+        "}}\n".format(i=i, port=443 if i % 10 == 3 else 80)
+    )
+
+
+class TestLazy(TestCase):
+    def setUp(self):
+        self.source = "# fleet\n\n" + "\n".join(map(server, range(50)))
+        fd, self.filename = mkstemp(suffix=".conf")
+        with open(fd, "wb") as f:
+            f.write(self.source.encode("utf-8"))
+
+    def tearDown(self):
+        remove(self.filename)
+
+    def assertSameEdit(self, edit):
+        with LazyConfig.open(self.filename) as conf:
+            eager = ParsedConfig.from_source(self.source)
+            edit(conf)
+            edit(eager)
+            self.assertEqual("".join(iter_dumps(conf)), "".join(iter_dumps(eager)))
+            self.assertEqual(conf, eager)
+        return conf
+
+    def test_open(self):
+        with LazyConfig.open(self.filename) as conf:
+            self.assertEqual(len(conf), 51)
+            self.assertEqual(conf.source[:7], "# fleet")
+            self.assertEqual("".join(iter_dumps(conf)), self.source)
+            self.assertEqual(conf.parsed(), 0)
+            self.assertEqual(conf.servers_by_name("s3.io"), [loads(server(3))[0]])
+            self.assertEqual(conf.parsed(), 1)
+            self.assertEqual(conf, loads(self.source))
+            self.assertEqual(conf.parsed(), 51)
+        self.assertEqual(LazyConfig(self.source)[-1], loads(server(49))[0])
+
+    def test_in_place_edit(self):
+        def edit(conf):
+            conf[8][1].append(["root", "/var/www"])
+            conf[9][1][2][1] = "s8.io"
+
+        self.assertSameEdit(edit)
+        with LazyConfig.open(self.filename) as conf:
+            edit(conf)
+            self.assertEqual(conf.parsed(), 2)
+            self.assertIn("root /var/www;", "".join(iter_dumps(conf)))
+            self.assertEqual(conf.parsed(), 2)
+
+    def test_ssl(self):
+        conf = self.assertSameEdit(
+            lambda conf: upsert_ssl_cert_to_443_block(
+                conf, "s13.io", "fullchain.pem", "privkey.pem"
+            )
+        )
+        with LazyConfig.open(self.filename) as conf:
+            upsert_ssl_cert_to_443_block(conf, "s13.io", "fullchain.pem", "privkey.pem")
+            self.assertEqual(conf.parsed(), 5)
+            self.assertEqual(
+                [node[0] for node in conf[14][1]][:4],
+                ["# s13.io—café", "server_name", "listen", "ssl_certificate"],
+            )
+
+    def test_merge_and_location(self):
+        child = api_proxy_block("/api", "http://127.0.0.1:5000")
+        self.assertSameEdit(lambda conf: merge_into("s7.io", conf, child))
+        self.assertSameEdit(
+            lambda conf: upsert_by_location("s7.io", "/17", conf, child)
+        )
+        with LazyConfig.open(self.filename) as conf:
+            merge_into("s7.io", conf, child)
+            self.assertEqual(conf.parsed(), 1)
+            upsert_by_location("s7.io", "/17", conf, child)
+            self.assertEqual(conf.parsed(), 2)
+            self.assertEqual(conf.locations("/17"), [])
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,120 @@
+import tracemalloc
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import dumps, loads
+
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.emit import (
+    api_proxy_block,
+    autoindex_block_tree,
+    secure_attr_tree,
+    server_block,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.nodes import Block, Comment, Directive, from_lists, to_lists
+from nginx_parse_emit.parser import fast_loads
+from nginx_parse_emit.utils import (
+    apply_attributes,
+    merge_into,
+    remove_by_location,
+    upsert_by_location,
+)
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestNodes(TestCase):
+    def setUp(self):
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.tree = loads(f.read())
+        self.nodes = from_lists(self.tree)
+
+    def test_round_trip(self):
+        self.assertEqual(to_lists(self.nodes), self.tree)
+        self.assertEqual("".join(iter_dumps(self.nodes)), dumps(self.tree))
+        tree = [["include", "mime.types"], ["gzip"], [["if", "($x)"], []]]
+        self.assertEqual(to_lists(from_lists(tree)), tree)
+        self.assertRaises(ValueError, from_lists, [["a", "b", "c"]])
+
+        server = self.nodes[1]
+        self.assertIsInstance(server, Block)
+        self.assertEqual(server.header, ("server",))
+        self.assertEqual(
+            server.children[:3],
+            [
+                Comment("# Emitted by nginx_parse_emit.emit.server_block"),
+                Directive("server_name", "offscale.io"),
+                Directive("listen", "443"),
+            ],
+        )
+        # Equal directives are one object, which is why they can't be changed
+        self.assertIs(self.nodes[0].children[1], server.children[1])
+        with self.assertRaises(AttributeError):
+            server.children[1].value = "example.com"
+
+    def test_helpers_accept_nodes(self):
+        child = api_proxy_block("/api1", "http://127.0.0.1:5001")
+        for edit in (
+            lambda conf: merge_into("offscale.io", conf, child),
+            lambda conf: merge_into("offscale.io", conf, from_lists(loads(child))),
+            lambda conf: upsert_by_location(
+                "offscale.io", "/api0", conf, autoindex_block_tree("/api0", "/var")
+            ),
+            lambda conf: remove_by_location(conf, "/api0"),
+            lambda conf: apply_attributes(
+                conf, from_lists(secure_attr_tree("fullchain.pem", "privkey.pem"))
+            ),
+            lambda conf: upsert_ssl_cert_to_443_block(
+                conf, "offscale.io", "fullchain.pem", "privkey.pem"
+            ),
+        ):
+            self.assertEqual(edit(self.nodes), edit(self.tree))
+        self.assertEqual(to_lists(self.nodes), self.tree)
+
+    def test_memory(self):
+        # No directive repeats here, so nothing is shared: only the smaller nodes count
+        source = "\n".join(
+            "server {{\n    server_name s{0}.example.com;\n    listen {1};\n"
+            "    root /var/www/s{0};\n    location /api{0} {{\n"
+            "        proxy_pass http://10.0.0.{0}:{1};\n    }}\n}}".format(i, 8000 + i)
+            for i in range(250)
+        )
+
+        def allocated(parse):
+            tracemalloc.start()
+            try:
+                parsed = parse(source)
+                return tracemalloc.get_traced_memory()[0], parsed
+            finally:
+                tracemalloc.stop()
+
+        lists_size, lists = allocated(fast_loads)
+        nodes_size, nodes = allocated(lambda s: from_lists(fast_loads(s)))
+        self.assertEqual(to_lists(nodes), lists)
+        self.assertGreater(lists_size / nodes_size, 1.2)
+
+    def test_equal_directives_shared(self):
+        source = "\n".join(
+            server_block(server_name="s{}.example.com".format(i), listen="443")[:-1]
+            + api_proxy_block("/api{}".format(i), "http://127.0.0.1:5000")
+            + "\n}"
+            for i in range(3)
+        )
+        servers = from_lists(fast_loads(source))
+        first, last = (
+            server.children[-1].children for server in (servers[0], servers[-1])
+        )
+        self.assertEqual(len(first), 7)
+        for a, b in zip(first, last):
+            self.assertIs(a, b)
+        self.assertIs(servers[0].children[2], servers[1].children[2])
+        self.assertIsNot(servers[0].children[1], servers[1].children[1])
+
+
+if __name__ == "__main__":
+    unittest_main()
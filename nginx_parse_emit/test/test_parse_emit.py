@@ -1,3 +1,4 @@
+from copy import deepcopy
 from unittest import TestCase
 from unittest import main as unittest_main
 
@@ -5,11 +6,28 @@ from nginxparser_eb.nginxparser_eb import dumps, loads
 
 from nginx_parse_emit.emit import (
     api_proxy_block,
+    api_proxy_block_tree,
+    proxy_1_1_block,
+    proxy_1_1_block_tree,
     redirect_block,
+    redirect_block_tree,
     secure_attr,
+    secure_attr_tree,
     server_block,
+    server_block_tree,
+)
+from nginx_parse_emit.utils import (
+    ApplyAttributes,
+    RemoveLocation,
+    UpsertLocation,
+    apply_attributes,
+    apply_batch,
+    apply_batch_str,
+    merge_into,
+    remove_by_location,
+    uniq,
+    upsert_by_location,
 )
-from nginx_parse_emit.utils import apply_attributes, merge_into, upsert_by_location
 
 
 class TestParseEmit(TestCase):
@@ -96,6 +114,36 @@ class TestParseEmit(TestCase):
             ],
         )
 
+    def test_tree_variants(self):
+        self.assertEqual(
+            self.parsed_api_block,
+            api_proxy_block_tree(location=self.location, proxy_pass=self.proxy_pass),
+        )
+        self.assertEqual(
+            self.parsed_server_block_no_rest,
+            server_block_tree(server_name=self.server_name, listen=self.listen),
+        )
+        rest = """
+         goodbye
+         cruel world
+        """
+        self.assertEqual(
+            loads(server_block(self.server_name, self.listen, "hi", rest)),
+            server_block_tree(self.server_name, self.listen, "hi", rest),
+        )
+        self.assertEqual(
+            loads(proxy_1_1_block(self.location, self.proxy_pass)),
+            proxy_1_1_block_tree(self.location, self.proxy_pass),
+        )
+        self.assertEqual(
+            loads(redirect_block(server_name=self.server_name, port="80")),
+            redirect_block_tree(server_name=self.server_name, port="80"),
+        )
+        self.assertEqual(
+            loads(secure_attr(self.ssl_certificate, self.ssl_certificate_key)),
+            secure_attr_tree(self.ssl_certificate, self.ssl_certificate_key),
+        )
+
     def test_server_block_rest(self):
         server_name = "offscale.io"
         listen = "443"
@@ -453,6 +501,61 @@ server {
             ),
         )
 
+    def test_apply_batch(self):
+        operations = [
+            UpsertLocation(
+                self.server_name,
+                "/api{}".format(i % 3),
+                loads(
+                    api_proxy_block(
+                        location="/api{}".format(i % 3),
+                        proxy_pass="{}{}".format(self.proxy_pass, i),
+                    )
+                ),
+            )
+            for i in range(6)
+        ]
+        operations.insert(4, RemoveLocation("/api1"))
+        operations.append(
+            ApplyAttributes(secure_attr(self.ssl_certificate, self.ssl_certificate_key))
+        )
+
+        expect = deepcopy(self.two_roots)
+        for operation in operations:
+            if isinstance(operation, UpsertLocation):
+                expect = upsert_by_location(
+                    operation.server_name,
+                    operation.location,
+                    expect,
+                    operation.child_block,
+                )
+            elif isinstance(operation, RemoveLocation):
+                expect = remove_by_location(expect, operation.location)
+            else:
+                expect = apply_attributes(expect, operation.attribute)
+
+        self.assertEqual(expect, apply_batch(deepcopy(self.two_roots), operations))
+        self.assertEqual(
+            dumps(expect), apply_batch_str(deepcopy(self.two_roots), operations)
+        )
+
+    def test_uniq(self):
+        self.assertEqual(uniq([]), [])
+        self.assertEqual(uniq([3, 1, 3, 2, 1]), [3, 1, 2])
+        self.assertEqual(uniq([3, 1, 3, 2, 1], keep="last"), [3, 2, 1])
+        body = self.two_roots[1][1] + self.parsed_api_block + [["listen", "80"]]
+        self.assertEqual(
+            uniq(body, key=lambda node: node[0], keep="last"),
+            [
+                ["# Emitted by nginx_parse_emit.emit.server_block", "\n"],
+                ["server_name", self.server_name],
+                self.parsed_api_block[0],
+                ["listen", "80"],
+            ],
+        )
+        self.assertEqual(uniq([["a"], ("a",), ["a"]]), [["a"], ("a",)])
+        self.assertRaises(ValueError, uniq, [], keep="middle")
+
 
 if __name__ == "__main__":
     unittest_main()
@@ -0,0 +1,98 @@
+from functools import partial
+from os import path
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.emit import (
+    api_proxy_block,
+    autoindex_block,
+    autoindex_block_tree,
+    html5_block,
+    proxy_1_1_block,
+    redirect_block,
+    secure_attr,
+    server_block,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.parser import fast_loads, get_parser_backend, set_parser_backend
+from nginx_parse_emit.utils import OTemplate, ensure_nginxparser_instance
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestFastParser(TestCase):
+    def setUp(self):
+        # `NGINX_PARSE_EMIT_PARSER` may have picked another at import
+        self.previous_backend = set_parser_backend("nginxparser_eb")
+        self.configs = {}
+        for name in (
+            "merged_roots.conf",
+            "nginx.conf",
+            "one_root.conf",
+            "two_roots.conf",
+        ):
+            with open(configs_dir(name), "rt") as f:
+                self.configs[name] = f.read()
+        # nginx.conf is a template for the others
+        nginx = OTemplate(self.configs.pop("nginx.conf"))
+        self.sources = list(self.configs.values())
+        self.sources += [
+            nginx.substitute(SERVER_BLOCK=source) for source in tuple(self.sources)
+        ]
+        self.sources += [
+            api_proxy_block("/api0", "http://127.0.0.1:5000/awesome"),
+            html5_block("/", "/var/www/html"),
+            proxy_1_1_block("/ws", "http://127.0.0.1:5000"),
+            redirect_block(server_name="offscale.io", port="80"),
+            secure_attr("fullchain.pem", "privkey.pem"),
+            server_block("offscale.io", "443", rest="root /var/www;\nautoindex on"),
+        ]
+
+    def tearDown(self):
+        set_parser_backend(self.previous_backend)
+
+    def test_conformance(self):
+        for source in self.sources:
+            self.assertEqual(loads(source), fast_loads(source))
+
+    def test_quotes_comments_and_modifiers(self):
+        self.assertEqual(
+            fast_loads(autoindex_block("/", "/var/www") + "}"),
+            autoindex_block_tree("/", "/var/www"),
+        )
+        self.assertEqual(
+            fast_loads("location = /x { return 200 'a;b{}'; } # done"),
+            [
+                [["location", "=", "/x"], [["return", "200 'a;b{}'"]]],
+                ["# done", "\n"],
+            ],
+        )
+        for source in "server {", "}", "listen 80", ";", "return 'unclosed;":
+            self.assertRaises(ValueError, fast_loads, source)
+
+    def test_backend_flag(self):
+        self.assertEqual(get_parser_backend(), "nginxparser_eb")
+        self.assertRaises(ValueError, set_parser_backend, "nope")
+        two_roots = configs_dir("two_roots.conf")
+        expected = upsert_ssl_cert_to_443_block(
+            two_roots, "offscale.io", "fullchain.pem", "privkey.pem"
+        )
+        self.assertEqual(set_parser_backend("fast"), "nginxparser_eb")
+        self.assertEqual(
+            upsert_ssl_cert_to_443_block(
+                two_roots, "offscale.io", "fullchain.pem", "privkey.pem"
+            ),
+            expected,
+        )
+        self.assertEqual(
+            ensure_nginxparser_instance(two_roots),
+            ensure_nginxparser_instance(self.configs["two_roots.conf"]),
+        )
+
+
+if __name__ == "__main__":
+    unittest_main()
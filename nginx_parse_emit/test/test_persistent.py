@@ -0,0 +1,61 @@
+from copy import deepcopy
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import loads
+
+from nginx_parse_emit.emit import (
+    api_proxy_block,
+    secure_attr,
+    server_block,
+    upsert_ssl_cert_to_443_block,
+)
+from nginx_parse_emit.persistent import (
+    assoc_in,
+    changed_paths,
+    insert_in,
+    remove_in,
+)
+from nginx_parse_emit.utils import apply_attributes, remove_by_location
+
+
+class TestPersistent(TestCase):
+    def setUp(self):
+        self.tree = loads(
+            "\n".join(
+                server_block(server_name="s{}.io".format(i), listen="443")
+                for i in range(3)
+            )
+        )
+        self.tree[1][1].append(loads(api_proxy_block("/api0", "http://localhost"))[0])
+
+    def test_path_copying(self):
+        original = deepcopy(self.tree)
+        new = assoc_in(self.tree, (1, 1, 2, 1), "8443")
+        self.assertEqual(original, self.tree)
+        self.assertEqual(new[1][1][2], ["listen", "8443"])
+        self.assertIs(new[0], self.tree[0])
+        self.assertIs(new[1][1][3], self.tree[1][1][3])
+        self.assertEqual(list(changed_paths(self.tree, new)), [(1, 1, 2, 1)])
+
+        inserted = insert_in(new, (1, 1, 0), ["ssl", "on"])
+        self.assertEqual(inserted[1][1][0], ["ssl", "on"])
+        self.assertEqual(remove_in(inserted, (1, 1, 0)), new)
+        self.assertEqual(list(changed_paths(new, inserted)), [(1, 1)])
+
+    def test_helpers_leave_input_intact(self):
+        original = deepcopy(self.tree)
+        removed = remove_by_location(self.tree, "/api0")
+        secured = apply_attributes(removed, secure_attr("fullchain.pem", "privkey.pem"))
+        certified = upsert_ssl_cert_to_443_block(
+            self.tree, "s0.io", "fullchain.pem", "privkey.pem"
+        )
+        self.assertEqual(original, self.tree)
+        self.assertIs(removed[0], self.tree[0])
+        self.assertIs(secured[1], removed[1])
+        self.assertIsNot(certified[0], self.tree[0])
+        self.assertEqual(len(remove_by_location(self.tree, "/nope")), len(self.tree))
+
+
+if __name__ == "__main__":
+    unittest_main()
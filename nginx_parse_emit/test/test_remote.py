@@ -0,0 +1,140 @@
+from functools import partial
+from os import chmod, listdir, mkdir, path, stat, symlink
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginxparser_eb.nginxparser_eb import dumps
+
+from nginx_parse_emit.emit import upsert_ssl_cert_to_443_block
+from nginx_parse_emit.remote import (
+    NO_CHANGE,
+    UPLOADED,
+    get_parsed_remote_confs,
+    upload_confs,
+    upsert_upload_many,
+)
+from nginx_parse_emit.test.connections import LocalConnection
+
+configs_dir = partial(
+    path.join, path.join(path.dirname(path.dirname(__file__)), "configs")
+)
+
+
+class TestRemoteBulk(TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        # nginx.conf is a template rather than a conf
+        for name in "merged_roots.conf", "one_root.conf", "two_roots.conf":
+            copyfile(configs_dir(name), path.join(self.directory, name))
+        copyfile(configs_dir("two_roots.conf"), path.join(self.directory, "default"))
+        self.c = LocalConnection()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read(self, name):
+        with open(path.join(self.directory, name), "rt") as f:
+            return f.read()
+
+    def test_fetch_and_upload_in_one_command_each(self):
+        confs = get_parsed_remote_confs(
+            self.c, ("default", "one_root", "two_roots.conf"), self.directory
+        )
+        self.assertEqual(list(confs), ["default", "one_root.conf", "two_roots.conf"])
+        self.assertEqual(confs["default"], confs["two_roots.conf"])
+        self.assertEqual(confs["one_root.conf"].source, self.read("one_root.conf"))
+        self.assertEqual(self.c.commands["run"], 1)
+
+        confs["two_roots.conf"] = upsert_ssl_cert_to_443_block(
+            confs["two_roots.conf"], "offscale.io", "fullchain.pem", "privkey.pem"
+        )
+        confs["new.conf"] = list(confs["one_root.conf"])
+        self.assertEqual(
+            upload_confs(self.c, confs, self.directory), ["two_roots.conf", "new.conf"]
+        )
+        self.assertEqual(self.c.commands["run"], 2)
+        self.assertEqual(self.read("new.conf"), dumps(confs["new.conf"]))
+        self.assertIn("ssl_certificate fullchain.pem;", self.read("two_roots.conf"))
+        with open(configs_dir("two_roots.conf"), "rt") as f:
+            self.assertEqual(self.read("default"), f.read())
+
+    def test_upload_through_symlink(self):
+        available = path.join(self.directory, "available")
+        mkdir(available)
+        target = path.join(available, "two_roots.conf")
+        copyfile(configs_dir("two_roots.conf"), target)
+        chmod(target, 0o600)
+        enabled = path.join(self.directory, "enabled")
+        mkdir(enabled)
+        link = path.join(enabled, "two_roots.conf")
+        symlink(target, link)
+
+        confs = get_parsed_remote_confs(self.c, None, enabled)
+        confs["two_roots.conf"] = upsert_ssl_cert_to_443_block(
+            confs["two_roots.conf"], "offscale.io", "fullchain.pem", "privkey.pem"
+        )
+        self.assertEqual(upload_confs(self.c, confs, enabled), ["two_roots.conf"])
+        self.assertTrue(path.islink(link))
+        with open(target, "rt") as f:
+            self.assertIn("ssl_certificate fullchain.pem;", f.read())
+        self.assertEqual(stat(target).st_mode & 0o777, 0o600)
+
+    def test_fetch_errors(self):
+        with self.assertRaises(IOError):
+            get_parsed_remote_confs(self.c, ("one_root", "missing"), self.directory)
+        with self.assertRaises(IOError):
+            get_parsed_remote_confs(self.c, None, path.join(self.directory, "none"))
+
+        empty = path.join(self.directory, "empty")
+        mkdir(empty)
+        self.assertEqual(get_parsed_remote_confs(self.c, None, empty), {})
+        self.assertEqual(get_parsed_remote_confs(self.c, (), empty), {})
+
+        # Enabled sites are often links to the available ones
+        symlink(path.join(self.directory, "one_root.conf"), path.join(empty, "a.conf"))
+        confs = get_parsed_remote_confs(self.c, None, empty)
+        self.assertEqual(list(confs), ["a.conf"])
+        self.assertEqual(confs["a.conf"].source, self.read("one_root.conf"))
+
+    def test_upsert_upload_many(self):
+        before = {name: self.read(name) for name in listdir(self.directory)}
+        statuses = upsert_upload_many(
+            self.c,
+            partial(
+                upsert_ssl_cert_to_443_block,
+                server_name="offscale.io",
+                ssl_certificate="fullchain.pem",
+                ssl_certificate_key="privkey.pem",
+            ),
+            directory=self.directory,
+        )
+        self.assertEqual(self.c.commands["run"], 2)
+        self.assertEqual(
+            dict(statuses),
+            {
+                "default": UPLOADED,
+                "merged_roots.conf": UPLOADED,
+                "one_root.conf": NO_CHANGE,
+                "two_roots.conf": UPLOADED,
+            },
+        )
+        self.assertEqual(self.read("one_root.conf"), before["one_root.conf"])
+        self.assertNotEqual(self.read("default"), before["default"])
+
+    def test_upsert_upload_many_in_place(self):
+        def add_root(conf):
+            for block in conf:
+                block[1].append(["root", "/var/www"])
+            return conf
+
+        statuses = upsert_upload_many(
+            self.c, add_root, ("one_root.conf",), directory=self.directory
+        )
+        self.assertEqual(dict(statuses), {"one_root.conf": UPLOADED})
+        self.assertIn("root /var/www;", self.read("one_root.conf"))
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,146 @@
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.lazy import LazyConfig
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.selector import (
+    Compound,
+    Condition,
+    compile_selector,
+    parse_selector,
+    quote_value,
+    select,
+    select_one,
+)
+from nginx_parse_emit.utils import remove_by_location
+
+SOURCE = """upstream app {
+    server 127.0.0.1:5000;
+}
+server {
+    # www.a.io too
+    server_name a.io www.a.io;
+    listen 443 ssl;
+    location / {
+        root /var/www;
+        location ~ \\.php$ {
+            return 403;
+        }
+    }
+    location /api0 {
+        proxy_pass http://app;
+    }
+}
+server {
+    server_name b.io;
+    listen 80;
+    location /api0 {
+        return 404;
+    }
+}
+"""
+
+
+class TestSelector(TestCase):
+    def setUp(self):
+        self.tree = loads(SOURCE)
+
+    def paths(self, selector, tree=None):
+        return [
+            path for path, _ in select(self.tree if tree is None else tree, selector)
+        ]
+
+    def test_parse(self):
+        self.assertEqual(
+            parse_selector("server[listen^=443] > location[/api0], :root"),
+            (
+                (
+                    Compound("server", (Condition("listen", "^=", "443"),), None),
+                    Compound("location", (Condition(None, "=", "/api0"),), ">"),
+                ),
+                (Compound(":root", (), None),),
+            ),
+        )
+        self.assertEqual(
+            parse_selector('*[server_name="a]b"] [ ~= x]'),
+            (
+                (
+                    Compound(None, (Condition("server_name", "=", "a]b"),), None),
+                    Compound(None, (Condition(None, "~=", "x"),), " "),
+                ),
+            ),
+        )
+        self.assertEqual(
+            parse_selector("*[server_name={}]".format(quote_value('a"\\b')))[0][0]
+            .conditions[0]
+            .value,
+            'a"\\b',
+        )
+        for text in ("", "server >", "server[", "server[]", "a :root", "a!", "a,"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_selector(text)
+
+    def test_conditions(self):
+        self.assertEqual(self.paths("server[listen]"), [(1,), (2,)])
+        self.assertEqual(self.paths("server[listen=80]"), [(2,)])
+        self.assertEqual(self.paths("server[listen^=443]"), [(1,)])
+        self.assertEqual(self.paths("*[server_name$=.io]"), [(1,), (2,)])
+        self.assertEqual(self.paths("*[server_name*=a.i]"), [(1,)])
+        self.assertEqual(self.paths("*[server_name~=www.a.io]"), [(1,)])
+        self.assertEqual(self.paths("[/api0]"), [(1, 1, 4), (2, 1, 2)])
+        self.assertEqual(self.paths("location[~=\\.php$]"), [(1, 1, 3, 1, 1)])
+        self.assertEqual(self.paths("proxy_pass[^=http]"), [(1, 1, 4, 1, 0)])
+        # A bare name is a block type or a directive; `*` is any block
+        self.assertEqual(self.paths("server"), [(0, 1, 0), (1,), (2,)])
+        self.assertEqual(len(self.paths("*")), 7)
+
+    def test_combinators(self):
+        self.assertEqual(
+            self.paths("server return"), [(1, 1, 3, 1, 1, 1, 0), (2, 1, 2, 1, 0)]
+        )
+        self.assertEqual(self.paths("server > * > return"), [(2, 1, 2, 1, 0)])
+        self.assertEqual(self.paths("server > location > location"), [(1, 1, 3, 1, 1)])
+        self.assertEqual(self.paths(":root > server"), [(1,), (2,)])
+        self.assertEqual(self.paths(":root"), [()])
+        self.assertEqual(
+            self.paths("upstream > server, *[listen=80] > location"),
+            [(0, 1, 0), (2, 1, 2)],
+        )
+        path, node = select_one(self.tree, "location location")
+        self.assertEqual(node[0], ["location", "~", "\\.php$"])
+        self.assertIsNone(select_one(self.tree, "http"))
+        self.assertIs(compile_selector("http"), compile_selector("http"))
+
+    def test_parsed_config(self):
+        conf = ParsedConfig(loads(SOURCE))
+        for selector in (
+            ":root > *[server_name=b.io]",
+            ":root > server[listen=443 ssl] > location[/api0]",
+            ":root > * > location",
+            ":root > *[listen] > [/], :root > upstream > server",
+            ":root > * > proxy_pass",
+            "location",
+        ):
+            self.assertEqual(self.paths(selector, conf), self.paths(selector), selector)
+        self.assertTrue(compile_selector(":root > *[listen=80]").exists(conf))
+        self.assertFalse(compile_selector(":root > *[listen=81]").exists(conf))
+        self.assertTrue(compile_selector("location[/]").exists(self.tree))
+
+    def test_lazy(self):
+        conf = LazyConfig(SOURCE)
+        self.assertTrue(compile_selector(":root > *[server_name=b.io]").exists(conf))
+        self.assertEqual(conf.parsed(), 0)
+        self.assertEqual(self.paths(":root > *[server_name=b.io]", conf), [(2,)])
+        self.assertEqual(conf.parsed(), 1)
+
+    def test_remove_by_location(self):
+        removed = remove_by_location(self.tree, "/api0")
+        self.assertEqual(self.paths("[/api0]", removed), [])
+        self.assertEqual(self.paths("location", removed), self.paths("location")[:2])
+        # A location's full arguments are matched, not only its first word
+        self.assertEqual(remove_by_location(self.tree, "~"), self.tree)
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,82 @@
+from copy import deepcopy
+from unittest import TestCase
+from unittest import main as unittest_main
+
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.emit import (
+    api_proxy_block_tree,
+    html5_block_tree,
+    server_block_tree,
+)
+from nginx_parse_emit.parser import loads
+from nginx_parse_emit.snippets import extract_snippets, find_repeats
+
+
+def host(name, root):  # type: (str, str) -> list
+    tree = server_block_tree(name, 443)
+    tree[0][1] += api_proxy_block_tree("/api", "http://127.0.0.1:5000")
+    tree[0][1] += html5_block_tree("/", root)
+    return tree
+
+
+class TestSnippets(TestCase):
+    def setUp(self):
+        self.trees = [host("a.io", "/var/www/a"), host("b.io", "/var/www/b")]
+        self.trees[1] += host("c.io", "/var/www/a")
+        self.original = deepcopy(self.trees)
+
+    def test_find_repeats(self):
+        repeats = find_repeats(self.trees)
+        self.assertEqual(
+            [(repeat.size, repeat.occurrences) for repeat in repeats],
+            [
+                (7, [(0, (0, 1, 3)), (1, (0, 1, 3)), (1, (1, 1, 3))]),
+                (5, [(0, (0, 1, 4)), (1, (1, 1, 4))]),
+            ],
+        )
+        self.assertEqual(
+            repeats[0].body, api_proxy_block_tree("/", "http://127.0.0.1:5000")[0][1]
+        )
+        self.assertEqual(find_repeats(self.trees, min_count=4), [])
+
+    def test_outermost_only(self):
+        self.trees.append(deepcopy(self.trees[0]))
+        repeats = find_repeats(self.trees)
+        # a.io's whole server body, then the api location in b.io and c.io
+        self.assertEqual(repeats[0].occurrences, [(0, (0,)), (2, (0,))])
+        self.assertEqual(repeats[1].occurrences, [(1, (0, 1, 3)), (1, (1, 1, 3))])
+
+    def test_extract_snippets(self):
+        self.trees[1] = ParsedConfig(self.trees[1])
+        trees, snippets = extract_snippets(self.trees, directory="shared")
+        self.assertEqual(self.trees[0], self.original[0])
+        self.assertIs(trees[1], self.trees[1])
+        self.assertEqual(len(snippets), 2)
+        for name, text in snippets.items():
+            self.assertTrue(name.startswith("shared/"))
+        api, html5 = snippets
+        self.assertEqual(trees[1][0][1][3], [["location", "/api"], [["include", api]]])
+        self.assertEqual(trees[1][1][1][4], [["location", "/"], [["include", html5]]])
+        self.assertEqual(trees[1][0][1][4], self.original[1][0][1][4])
+        self.assertIs(trees[0][0][0], self.trees[0][0][0])
+
+        # Splicing the snippets back gives the original configs
+        def splice(tree):
+            return [
+                (
+                    [node[0], loads(snippets[node[1][0][1]])]
+                    if node[1] and node[1][0][0] == "include"
+                    else (
+                        [node[0], splice(node[1])]
+                        if isinstance(node[0], list)
+                        else node
+                    )
+                )
+                for node in tree
+            ]
+
+        self.assertEqual(list(map(splice, trees)), self.original)
+
+
+if __name__ == "__main__":
+    unittest_main()
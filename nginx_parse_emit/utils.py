@@ -1,26 +1,21 @@
-from operator import itemgetter
-from sys import version
-from typing import Optional, Union
-
-from fabric2 import Connection
-from patchwork.files import exists
-
-if version[0] == "2":
-    try:
-        from cStringIO import StringIO
-    except ImportError:
-        from StringIO import StringIO
-else:
-    from functools import reduce
-    from io import StringIO
-
+from collections import namedtuple
 from copy import copy
-from itertools import filterfalse
-from os import path, remove
+from hashlib import sha256
+from operator import itemgetter
+from os import path
 from string import Template
-from tempfile import mkstemp
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional, Tuple, Union
 
-from nginxparser_eb.nginxparser_eb import dumps, load, loads
+from nginxparser_eb.nginxparser_eb import dumps
+
+from nginx_parse_emit.cache import ParseCache, content_key, get_parse_cache
+from nginx_parse_emit.config import ParsedConfig
+from nginx_parse_emit.dumper import iter_dumps
+from nginx_parse_emit.instrument import instrumented
+from nginx_parse_emit.nodes import Node, is_nodes, to_lists
+from nginx_parse_emit.parser import load, loads
+from nginx_parse_emit.persistent import assoc_in, update_in
+from nginx_parse_emit.selector import Selector, compile_selector, quote_value
 
 
 class DollarTemplate(Template):
@@ -36,61 +31,77 @@ def ensure_semicolon(s):  # type: (str) -> Optional[str]
 
 
 def _copy_or_marshal(block):  # type: (Union[str, list]) -> list
+    """
+    Fresh top-level list to edit. The edits below never mutate nested nodes in place:
+    they path-copy (see `nginx_parse_emit.persistent`), so the input stays valid and
+    shares every untouched subtree with the output.
+    """
+    if isinstance(block, ParsedConfig):
+        # Edited in place, so its indexes are never rebuilt from scratch
+        return block
+    elif is_nodes(block):
+        return to_lists(block)
     return copy(block) if isinstance(block, list) else loads(block)
 
 
+def _iter_directives(conf, names):  # type: (list, Tuple[str]) -> Iterator[Tuple[int]]
+    """
+    (i, j, k) such that `conf[i][j][k]` is a directive named in `names`, in document
+    order. Answered from the indexes when `conf` is a `ParsedConfig`, else by scanning.
+    """
+    selector = compile_selector(", ".join(":root > * > " + name for name in names))
+    for directive_path, _ in selector.select(conf):
+        yield directive_path
+
+
+def _with_server_name(server_name):  # type: (str) -> Selector
+    return compile_selector(
+        ":root > *[server_name={}]".format(quote_value(server_name))
+    )
+
+
+def _location(location):  # type: (str) -> Selector
+    return compile_selector(":root > * > *[{}]".format(quote_value(location)))
+
+
+def _child_node(child_block):  # type: (Union[str, list, Node]) -> list
+    if is_nodes(child_block):
+        child_block = to_lists(
+            child_block if isinstance(child_block, list) else [child_block]
+        )
+    return child_block[0] if isinstance(child_block[0], list) else loads(child_block)[0]
+
+
+def _dedupe_body(body):  # type: (list) -> list
+    return uniq(body, itemgetter(0), keep="last")
+
+
+@instrumented
 def merge_into(
     server_name, parent_block, *child_blocks
 ):  # type: (str, Union[str, list], *list) -> list
     parent_block = _copy_or_marshal(parent_block)
-
-    server_name_idx = -1
-    indicies = set()
-    break_ = False
-
-    for i, tier in enumerate(parent_block):
-        for j, statement in enumerate(tier):
-            for k, stm in enumerate(statement):
-                if statement[k][0] == "server_name" and statement[k][1] == server_name:
-                    server_name_idx = i
-                    indicies.add(k)
-                    if break_:
-                        break
-                elif statement[k][0] == "listen" and statement[k][1].startswith("443"):
-                    break_ = True
-                    if k in indicies:
-                        break
-
-    server_name_idx += 1
-
-    if not len(indicies):
+    if not _with_server_name(server_name).exists(parent_block):
         return parent_block
 
-    length = len(parent_block[-1])
-    if server_name_idx >= length:
-        server_name_idx = length - 1
-
-    parent_block[-1][server_name_idx] += list(
-        map(
-            lambda child_block: child_block[0]
-            if isinstance(child_block[0], list)
-            else loads(child_block)[0],
-            child_blocks,
-        )
-    )
-    parent_block[-1][server_name_idx] = list(
-        reversed(uniq(reversed(parent_block[-1][-1]), itemgetter(0)))
+    last = parent_block[-1]
+    parent_block[-1] = update_in(
+        last,
+        (len(last) - 1,),
+        lambda body: _dedupe_body(body + list(map(_child_node, child_blocks))),
     )
 
     return parent_block
 
 
+@instrumented
 def merge_into_str(
     server_name, parent_block, *child_blocks
 ):  # type: (Union[str, list], Union[str, list], *list) -> str
     return dumps(merge_into(server_name, parent_block, *child_blocks))
 
 
+@instrumented
 def upsert_by_location(
     server_name, location, parent_block, child_block
 ):  # type: (str, Union[str, list], Union[str, list], Union[str, list]) -> list
@@ -101,52 +112,62 @@ def upsert_by_location(
     )
 
 
+@instrumented
 def remove_by_location(parent_block, location):  # type: (list, str) -> list
-    parent_block = _copy_or_marshal(parent_block)
-    parent_block = list(
-        map(
-            lambda block: list(
-                map(
-                    lambda subblock: list(
-                        filterfalse(
-                            lambda subsubblock: len(subsubblock)
-                            and len(subsubblock[0]) > 1
-                            and subsubblock[0][1] == location,
-                            subblock,
-                        )
-                    ),
-                    block,
-                )
-            ),
-            parent_block,
-        )
-    )
-    return parent_block
+    conf = _copy_or_marshal(parent_block)
+    # Last first, so earlier indexes stay valid
+    for block_path, _ in reversed(list(_location(location).select(conf))):
+        i, _, k = block_path
+        conf[i] = [conf[i][0], conf[i][1][:k] + conf[i][1][k + 1 :]]
+    return conf
+
+
+def _remove_locations(conf, locations):  # type: (list, Iterable[str]) -> list
+    """
+    `conf` without the blocks, nested in its top-level blocks, of any of `locations`.
+    One pass over the bodies, however many locations are removed.
+    """
+    locations = frozenset(locations)
+    for i in range(len(conf)):
+        block = conf[i]
+        if not isinstance(block[0], list):
+            continue
+        body = [
+            node
+            for node in block[1]
+            if not (isinstance(node[0], list) and " ".join(node[0][1:]) in locations)
+        ]
+        if len(body) != len(block[1]):
+            conf[i] = [block[0], body]
+    return conf
 
 
 def _prevent_slash(s):  # type: (str) -> str
     return s[1:] if s.startswith("/") else s
 
 
+@instrumented
 def apply_attributes(
     block, attribute, append=False
 ):  # type: (Union[str, list], Union[str, list], bool) -> list
     block = _copy_or_marshal(block)
     attribute = _copy_or_marshal(attribute)
 
+    last = list(block[-1])
     if append:
-        block[-1][-1] += attribute
+        last[-1] = last[-1] + attribute
     else:
         changed = False
-        for bid, _block in enumerate(block[-1]):
+        for bid, _block in enumerate(last):
             for sid, subblock in enumerate(_block):
                 if isinstance(subblock[0], list):
-                    block[-1][bid] = attribute + [block[-1][bid][sid]]
+                    last[bid] = attribute + [last[bid][sid]]
                     changed = True
                     break
 
         if not changed:
-            block[-1][-1] += attribute
+            last[-1] = last[-1] + attribute
+    block[-1] = last
 
     # TODO: Generalise these lines to a `remove_duplicates` or `remove_consecutive_duplicates` function
 
@@ -155,8 +176,7 @@ def apply_attributes(
     if not isinstance(block[0][1], list):
         return block
 
-    block[0][1].reverse()
-    for subblock in block[0][1]:
+    for subblock in reversed(block[0][1]):
         if (
             prev_key is not None
             and prev_key == subblock[0]
@@ -166,83 +186,236 @@ def apply_attributes(
         subseq_removed.append(subblock)
         prev_key = subblock[0]
     subseq_removed.reverse()
-    block[0][1] = subseq_removed
+    if len(subseq_removed) != len(block[0][1]):
+        block[0] = assoc_in(block[0], (1,), subseq_removed)
 
     return block
 
 
-def upsert_upload(c, new_conf, name="default", use_sudo=True):
-    """
-    :param c: Connection
-    :type c: ```fabric.connection.Connection```
-    """
-    conf_name = "/etc/nginx/sites-enabled/{nginx_conf}".format(nginx_conf=name)
-    if not conf_name.endswith(".conf") and not exists(c, runner=c.run, path=conf_name):
-        conf_name += ".conf"
-    # cStringIO.StringIO, StringIO.StringIO, TemporaryFile, SpooledTemporaryFile all failed :(
-    tempfile = mkstemp(name)[1]
-    c.get(remote=conf_name, local=tempfile)  # , use_sudo=use_sudo)
-    with open(tempfile, "rt") as f:
-        conf = load(f)
-    new_conf = new_conf(conf)
-    remove(tempfile)
-
-    sio = StringIO()
-    sio.write(dumps(new_conf))
-    return c.put(sio, conf_name)  # , use_sudo=use_sudo)
-
-
-def get_parsed_remote_conf(
-    c, conf_name, suffix="nginx", use_sudo=True
-):  # type: (Connection, str, str, bool) -> [str]
-    if not conf_name.endswith(".conf") and not exists(c, runner=c.run, path=conf_name):
-        conf_name += ".conf"
-    # cStringIO.StringIO, StringIO.StringIO, TemporaryFile, SpooledTemporaryFile all failed :(
-    tempfile = mkstemp(suffix)[1]
-    c.get(remote=conf_name, local=tempfile, use_sudo=use_sudo)
-    with open(tempfile, "rt") as f:
-        conf = load(f)
-    remove(tempfile)
+UpsertLocation = namedtuple(
+    "UpsertLocation", ("server_name", "location", "child_block")
+)
+RemoveLocation = namedtuple("RemoveLocation", ("location",))
+ApplyAttributes = namedtuple("ApplyAttributes", ("attribute", "append"))
+ApplyAttributes.__new__.__defaults__ = (False,)
+SetSslCert = namedtuple(
+    "SetSslCert", ("server_name", "ssl_certificate", "ssl_certificate_key")
+)
+
+
+@instrumented
+def apply_batch(
+    parent_block, operations
+):  # type: (Union[str, list], Iterable[tuple]) -> ParsedConfig
+    """
+    Apply many edits with one copy and one indexing pass over the tree. The result is
+    the same as calling `upsert_by_location`, `remove_by_location`, `apply_attributes`
+    and `upsert_ssl_cert_to_443_block` one after another.
+
+    Consecutive location upserts/removes are coalesced, so the affected server bodies
+    are filtered and de-duplicated once per run rather than once per operation.
+
+    :param parent_block: Config to edit; a `ParsedConfig` is edited in place
+    :type parent_block: ```Union[str, list]```
+
+    :param operations: `UpsertLocation`, `RemoveLocation`, `ApplyAttributes` and
+        `SetSslCert` instances
+    :type operations: ```Iterable[tuple]```
+
+    :return: Edited config
+    :rtype: ```ParsedConfig```
+    """
+    conf = _copy_or_marshal(parent_block)
+    if not isinstance(conf, ParsedConfig):
+        conf = ParsedConfig(conf)
+
+    run = []
+    for operation in operations:
+        if isinstance(operation, RemoveLocation) or (
+            isinstance(operation, UpsertLocation)
+            and isinstance(_child_node(operation.child_block)[0], list)
+        ):
+            run.append(operation)
+            continue
+        _apply_location_run(conf, run)
+        run = []
+        if isinstance(operation, UpsertLocation):
+            upsert_by_location(
+                operation.server_name,
+                operation.location,
+                conf,
+                operation.child_block,
+            )
+        elif isinstance(operation, ApplyAttributes):
+            apply_attributes(conf, operation.attribute, operation.append)
+        elif isinstance(operation, SetSslCert):
+            from nginx_parse_emit.emit import upsert_ssl_cert_to_443_block
+
+            upsert_ssl_cert_to_443_block(conf, *operation)
+        else:
+            raise TypeError("Unknown batch operation: {!r}".format(operation))
+    _apply_location_run(conf, run)
+
     return conf
 
 
-def ensure_nginxparser_instance(conf_file):  # type: (str) -> [[[str]]]
+@instrumented
+def apply_batch_str(
+    parent_block, operations
+):  # type: (Union[str, list], Iterable[tuple]) -> str
+    return dumps(apply_batch(parent_block, operations))
+
+
+def _apply_location_run(conf, run):  # type: (ParsedConfig, [tuple]) -> None
+    """
+    Apply consecutive `RemoveLocation`s and `UpsertLocation`s of blocks in one go.
+
+    Removal only looks at header arguments and de-duplication only at keys, so they
+    commute; an upserted child survives unless a later operation removes its location.
+    """
+    if not run:
+        return
+    merge, children, later = False, [], set()
+    for operation in reversed(run):
+        if isinstance(operation, UpsertLocation) and conf.has_server_name(
+            operation.server_name
+        ):
+            merge = True
+            child = _child_node(operation.child_block)
+            if not (len(child[0]) > 1 and child[0][1] in later):
+                children.append(child)
+        later.add(operation.location)
+    children.reverse()
+
+    _remove_locations(conf, later)
+    if merge:
+        conf[-1] = update_in(
+            conf[-1], (-1,), lambda body: _dedupe_body(body + children)
+        )
+
+
+def _emits_source(tree, source):  # type: (list, str) -> bool
+    """
+    Whether `tree` dumps to exactly `source`, by hashing its text
+    """
+    digest = sha256()
+    for chunk in iter_dumps(tree):
+        digest.update(chunk.encode("utf-8"))
+    return digest.digest() == sha256(source.encode("utf-8")).digest()
+
+
+@instrumented
+def ensure_nginxparser_instance(
+    conf_file, cache=None
+):  # type: (Union[str, list], Optional[ParseCache]) -> [[[str]]]
+    """
+    Parsed tree from a tree, file object, filename or config string
+
+    :param conf_file: Config to parse, returned as is if already a tree, or converted
+      if it is one of `nginx_parse_emit.nodes`
+    :type conf_file: ```Union[str, list]```
+
+    :param cache: Parse cache; defaults to the one from `set_parse_cache`, if any
+    :type cache: ```Optional[ParseCache]```
+
+    :return: Parsed tree
+    :rtype: ```list```
+    """
     if isinstance(conf_file, list):
-        return conf_file
-    elif hasattr(conf_file, "read"):
-        return load(conf_file)
+        return to_lists(conf_file) if is_nodes(conf_file) else conf_file
+    cache = get_parse_cache() if cache is None else cache
+    if cache is None:
+        if hasattr(conf_file, "read"):
+            return load(conf_file)
+        elif path.isfile(conf_file):
+            with open(conf_file, "rt") as f:
+                return load(f)
+        else:
+            return loads(conf_file)
+
+    if hasattr(conf_file, "read"):
+        content = conf_file.read()
+        return cache.lookup(content_key(content), lambda: loads(content))
     elif path.isfile(conf_file):
-        with open(conf_file, "rt") as f:
-            return load(f)
+        # Keyed by what the file holds, read once for both the key and the parse
+        with open(conf_file, "rb") as f:
+            data = f.read()
+        return cache.lookup(content_key(data), lambda: loads(data.decode("utf-8")))
     else:
-        return loads(conf_file)
+        return cache.lookup(content_key(conf_file), lambda: loads(conf_file))
 
 
-def uniq(iterable, key=lambda x: x):
+def uniq(iterable, key=lambda x: x, keep="first"):
     """
     Remove duplicates from an iterable. Preserves order.
 
-    :param iterable: an iterable of objects of any orderable type
-    :type iterable: Iterable[Ord => A]
+    :param iterable: an iterable of objects of any type
+    :type iterable: Iterable[A]
 
     :param key: optional argument; by default an item (A) is discarded
-    :type key: Callable[A] -> (Ord => B)
+    :type key: Callable[A] -> B
 
-    if another item (B), such that A == B, has already been encountered and taken.
-    If you provide a key, this condition changes to key(A) == key(B); the callable
-    must return orderable objects.
+    if another item (B), such that A == B, is kept instead.
+    If you provide a key, this condition changes to key(A) == key(B). Keys need not
+    be hashable: lists (e.g., block headers) are compared by their canonical form.
+
+    :param keep: "first" keeps the first of each set of duplicates, "last" the last
+    :type keep: ```str```
 
     :rtype: ```list```
     """
+    if keep not in ("first", "last"):
+        raise ValueError("keep must be 'first' or 'last', got {!r}".format(keep))
+
+    items = list(iterable)
+    keys = [_canonical_key(key(item)) for item in items]
+    if keep == "last":
+        kept = {k: i for i, k in enumerate(keys)}
+    else:
+        kept = {}
+        for i, k in enumerate(keys):
+            kept.setdefault(k, i)
+    return [item for i, (item, k) in enumerate(zip(items, keys)) if kept[k] == i]
+
+
+_LIST = object()
 
-    # Enumerate the list to restore order lately; reduce the sorted list; restore order
-    def append_unique(acc, item):
-        return acc if key(acc[-1][1]) == key(item[1]) else acc.append(item) or acc
 
-    srt_enum = sorted(enumerate(iterable), key=lambda item: key(item[1]))
-    return [item[1] for item in sorted(reduce(append_unique, srt_enum, [srt_enum[0]]))]
+def _canonical_key(obj):  # type: (Any) -> Hashable
+    """
+    Hashable stand-in for `obj`: lists become tagged tuples, so `[a]` != `(a,)`
+    """
+    if isinstance(obj, list):
+        return _LIST, tuple(map(_canonical_key, obj))
+    return obj
 
 
 class OTemplate(Template):
     delimiter = "_0_"
     idpattern = r"[a-z][_a-z0-9]*"
+
+
+def __getattr__(name):
+    """
+    The remote helpers moved to `nginx_parse_emit.remote`; importing them from here
+    still works, and only then loads fabric
+    """
+    if name in _REMOTE:
+        from nginx_parse_emit import remote
+
+        return getattr(remote, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+_REMOTE = frozenset(
+    (
+        "NO_CHANGE",
+        "SITES_ENABLED",
+        "UPLOADED",
+        "get_parsed_remote_conf",
+        "get_parsed_remote_confs",
+        "upload_confs",
+        "upsert_upload",
+        "upsert_upload_many",
+    )
+)